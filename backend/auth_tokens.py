@@ -0,0 +1,129 @@
+"""Claims del access token y revocación por usuario.
+
+El token lleva todo lo que las rutas necesitan para autorizar (id, rol y
+lavadero del usuario), así que identificar al llamante no lee la base. Para
+poder invalidar tokens ya emitidos cada usuario tiene un ``token_version``:
+al revocar se incrementa y se registra en ``token_revocations``, que cada
+worker mantiene en memoria y refresca periódicamente. Un token es válido si
+su versión no es menor que la mínima registrada para su usuario.
+
+Sin colección ``token_revocations`` (``MemoryRepositories``) las revocaciones
+viven sólo en el proceso, que es el único.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+import asyncio
+import logging
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Se incrementa cuando cambia la forma de los claims; los tokens con otra
+# versión se resuelven por el camino antiguo (lectura del usuario)
+TOKEN_CLAIMS_VERSION = 1
+
+
+class Principal(BaseModel):
+    """Authenticated caller, as carried in the access token"""
+    id: str
+    email: str
+    rol: str
+    lavadero_id: Optional[str] = None
+    token_version: int = 0
+
+
+def build_claims(principal: Principal) -> dict:
+    return {
+        "sub": principal.email,
+        "uid": principal.id,
+        "rol": principal.rol,
+        "lid": principal.lavadero_id,
+        "tv": principal.token_version,
+        "cv": TOKEN_CLAIMS_VERSION,
+    }
+
+
+def principal_from_claims(payload: dict) -> Optional[Principal]:
+    """Principal for a current-version token, None for older tokens"""
+    if payload.get("cv") != TOKEN_CLAIMS_VERSION:
+        return None
+    return Principal(
+        id=payload["uid"],
+        email=payload["sub"],
+        rol=payload["rol"],
+        lavadero_id=payload.get("lid"),
+        token_version=payload.get("tv", 0),
+    )
+
+
+class TokenRevocationRegistry:
+    # Margen para escrituras de otros workers con el reloj algo atrasado
+    SOLAPAMIENTO = timedelta(seconds=5)
+
+    def __init__(self, users, collection, token_lifetime: timedelta, refresh_seconds: float = 2):
+        self.users = users  # repositorio con bump_token_version
+        self.collection = collection
+        self.token_lifetime = token_lifetime
+        self.refresh_seconds = refresh_seconds
+        self._min_version: Dict[str, int] = {}
+        self._desde: Optional[datetime] = None
+
+    def is_revoked(self, principal: Principal) -> bool:
+        return principal.token_version < self._min_version.get(principal.id, 0)
+
+    def _aplicar(self, doc: dict):
+        actual = self._min_version.get(doc["_id"], 0)
+        self._min_version[doc["_id"]] = max(actual, doc["min_version"])
+        updated_at = doc["updated_at"]
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        if self._desde is None or updated_at > self._desde:
+            self._desde = updated_at
+
+    async def load(self):
+        if self.collection is None:
+            return
+        async for doc in self.collection.find({}):
+            self._aplicar(doc)
+
+    async def refresh(self):
+        if self.collection is None:
+            return
+        filtro = {} if self._desde is None else {"updated_at": {"$gt": self._desde - self.SOLAPAMIENTO}}
+        async for doc in self.collection.find(filtro):
+            self._aplicar(doc)
+
+    async def revoke(self, user_id: str) -> Optional[int]:
+        """Invalidate every token issued so far to ``user_id``"""
+        version = await self.users.bump_token_version(user_id)
+        if version is None:
+            return None
+        ahora = datetime.now(timezone.utc)
+        doc = {
+            "_id": user_id,
+            "min_version": version,
+            "updated_at": ahora,
+        }
+        self._aplicar(doc)
+        if self.collection is None:
+            return version
+        # Pasada la vida útil de un token ya no queda ninguno que revocar
+        await self.collection.update_one(
+            {"_id": user_id},
+            {
+                "$max": {"min_version": doc["min_version"]},
+                "$set": {"updated_at": ahora, "expires_at": ahora + self.token_lifetime}
+            },
+            upsert=True
+        )
+        return version
+
+    async def poll(self):
+        """Pick up revocations made by other workers"""
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"No se pudo refrescar token_revocations: {e}")
@@ -0,0 +1,193 @@
+"""Cachés en memoria de configuración leída en casi todas las rutas.
+
+``SingletonConfigCache`` mantiene el documento único de una colección (por
+ejemplo ``configuracion_superadmin``) cargado en el proceso: las lecturas no
+van a MongoDB. Cada escritura incrementa ``version`` y los demás workers se
+enteran por un change stream o, en un servidor standalone, consultando
+periódicamente sólo ese campo.
+
+``LavaderoConfigCache`` es un LRU acotado de (lavadero, configuración) por
+lavadero, accesible por ``lavadero_id`` o por ``admin_id``. Las escrituras de
+este worker lo actualizan (write-through); un TTL corto acota lo que puede
+quedar desactualizado por escrituras de otros workers.
+"""
+from typing import Callable, Optional, Tuple
+import asyncio
+import logging
+
+from cachetools import TTLCache
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+class SingletonConfigCache:
+    SINGLETON_ID = "singleton"
+
+    def __init__(self, collection, default_factory: Callable[[], dict], refresh_seconds: float = 5):
+        self.collection = collection
+        self.default_factory = default_factory
+        self.refresh_seconds = refresh_seconds
+        self._doc: Optional[dict] = None
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> dict:
+        """Read the singleton, atomically creating the default if there is none"""
+        doc = await self.collection.find_one({}, {"_id": 0}, sort=[("_id", 1)])
+        if doc is None:
+            default = {**self.default_factory(), "_id": self.SINGLETON_ID, "version": 1}
+            try:
+                # _id fijo: si dos workers arrancan a la vez sólo uno inserta
+                await self.collection.insert_one(default)
+            except DuplicateKeyError:
+                pass
+            doc = await self.collection.find_one({"_id": self.SINGLETON_ID}, {"_id": 0})
+        self._doc = doc
+        return doc
+
+    def load_default(self) -> dict:
+        """Serve the default without reading MongoDB (in-memory repositories)"""
+        self._doc = {**self.default_factory(), "version": 1}
+        return self._doc
+
+    async def get(self) -> dict:
+        """Cached document; only the first call in a process goes to MongoDB"""
+        doc = self._doc
+        if doc is None:
+            async with self._lock:
+                doc = self._doc if self._doc is not None else await self.load()
+        return doc
+
+    async def update(self, fields: dict) -> dict:
+        """Write ``fields`` and swap in the resulting document"""
+        actual = await self.get()
+        doc = await self.collection.find_one_and_update(
+            {"id": actual["id"]},
+            {"$set": fields, "$inc": {"version": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            # El documento fue reemplazado por fuera: recargar y reintentar una vez
+            await self.load()
+            return await self.update(fields)
+        self._doc = doc
+        return doc
+
+    async def _refresh_if_changed(self):
+        remoto = await self.collection.find_one({"id": (await self.get())["id"]}, {"_id": 0, "version": 1})
+        if remoto is None or remoto.get("version") != self._doc.get("version"):
+            await self.load()
+
+    async def watch(self):
+        """Keep the cache in sync with writes from other workers"""
+        while True:
+            try:
+                async with self.collection.watch() as stream:
+                    async for _ in stream:
+                        await self.load()
+            except OperationFailure:
+                # Standalone: sin change streams, se consulta sólo la versión
+                logger.info(f"{self.collection.name}: change streams no disponibles, usando polling")
+                break
+            except Exception as e:
+                logger.warning(f"Change stream de {self.collection.name} interrumpido: {e}")
+                await asyncio.sleep(self.refresh_seconds)
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self._refresh_if_changed()
+            except Exception as e:
+                logger.warning(f"No se pudo refrescar {self.collection.name}: {e}")
+
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache that counts evictions caused by the size bound"""
+
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize, ttl)
+        self.evictions = 0
+
+    def popitem(self):
+        self.evictions += 1
+        return super().popitem()
+
+
+LavaderoEntry = Tuple[dict, Optional[dict]]
+
+
+def _proyectar(doc: Optional[dict], fields: Optional[Tuple[str, ...]]) -> Optional[dict]:
+    if doc is None or fields is None:
+        return doc
+    return {campo: doc[campo] for campo in fields if campo in doc}
+
+
+class LavaderoConfigCache:
+    def __init__(self, lavaderos, maxsize: int = 10000, ttl: float = 60,
+                 fields: Optional[Tuple[str, ...]] = None, config_fields: Optional[Tuple[str, ...]] = None):
+        self.lavaderos = lavaderos  # repositorio con get_with_config
+        # Proyección de lo que se guarda: sólo los campos que usan las rutas
+        self.fields = fields
+        self.config_fields = config_fields
+        self._entries = _CountingTTLCache(maxsize, ttl)  # lavadero_id -> (lavadero, config)
+        self._por_admin = TTLCache(maxsize, ttl)  # admin_id -> lavadero_id
+        self.hits = 0
+        self.misses = 0
+
+    async def _load(self, **match) -> Optional[LavaderoEntry]:
+        entry = await self.lavaderos.get_with_config(**match, fields=self.fields, config_fields=self.config_fields)
+        if entry is not None:
+            self.put(*entry)
+        return entry
+
+    async def get_by_admin(self, admin_id: str) -> Optional[LavaderoEntry]:
+        lavadero_id = self._por_admin.get(admin_id)
+        entry = self._entries.get(lavadero_id) if lavadero_id else None
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return await self._load(admin_id=admin_id)
+
+    async def get_by_lavadero(self, lavadero_id: str) -> Optional[LavaderoEntry]:
+        entry = self._entries.get(lavadero_id)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return await self._load(lavadero_id=lavadero_id)
+
+    def put(self, lavadero: dict, config: Optional[dict]):
+        # Los write-through traen el documento completo: se guarda la misma proyección que al leer
+        self._entries[lavadero["id"]] = (_proyectar(lavadero, self.fields), _proyectar(config, self.config_fields))
+        self._por_admin[lavadero["admin_id"]] = lavadero["id"]
+
+    def put_config(self, config: dict):
+        """Write-through of a configuration update, if its lavadero is cached"""
+        entry = self._entries.get(config["lavadero_id"])
+        if entry is not None:
+            self._entries[config["lavadero_id"]] = (entry[0], _proyectar(config, self.config_fields))
+
+    def invalidate(self, lavadero_id: Optional[str] = None, admin_id: Optional[str] = None):
+        if admin_id is not None:
+            lavadero_id = self._por_admin.pop(admin_id, None) or lavadero_id
+        if lavadero_id is not None:
+            entry = self._entries.pop(lavadero_id, None)
+            if entry is not None:
+                self._por_admin.pop(entry[0]["admin_id"], None)
+
+    def clear(self):
+        self._entries.clear()
+        self._por_admin.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self._entries.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self._entries.evictions,
+        }
@@ -0,0 +1,238 @@
+"""Atribución de comandos de MongoDB al request que los originó.
+
+``MongoCommandTracer`` es un CommandListener de pymongo. Motor ejecuta cada
+operación en su executor copiando el contexto de la corrutina que la llamó,
+así que el listener ve el ``ContextVar`` del request en curso y acumula ahí
+cantidad de round trips, tiempo en Mongo y la *forma* de cada comando (la
+colección y las claves/operadores del filtro, sin valores). Lo que corre
+fuera de un request (tareas de fondo, scripts) no se registra salvo que
+se envuelva en ``tracking()``.
+
+``DbTracingMiddleware`` abre ese contexto por request, exporta las
+métricas, agrega headers de diagnóstico en modo debug, deja en el log los
+requests lentos con sus formas de consulta y marca los que repiten la misma
+forma más de N veces (patrón N+1).
+
+Cada endpoint declara con ``@db_budget(n)`` cuántos round trips puede hacer
+como máximo (los commitTransaction/abortTransaction incluidos); el middleware
+registra los requests que lo exceden y tests/test_db_budgets.py lo verifica
+ruta por ruta contra una base sembrada. Las rutas que trabajan por lotes
+declaran el costo del primero y suman el de cada lote extra con
+``extend_budget()``.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import threading
+
+from pymongo import monitoring
+
+from metrics import REGISTRY, RouteTemplates
+
+logger = logging.getLogger(__name__)
+
+# Comandos internos del driver que no son consultas de la aplicación
+COMANDOS_IGNORADOS = {"hello", "ismaster", "isMaster", "endSessions", "saslStart", "saslContinue"}
+
+# getMore/killCursors continúan una consulta anterior: no cuentan como forma repetida
+COMANDOS_DE_CURSOR = {"getMore", "killCursors"}
+
+DB_ROUND_TRIPS = REGISTRY.histogram(
+    "http_request_db_round_trips", "Comandos de MongoDB por request", ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+DB_SECONDS = REGISTRY.histogram(
+    "http_request_db_seconds", "Tiempo en MongoDB por request", ("method", "route")
+)
+DB_REPEATED = REGISTRY.counter(
+    "http_requests_repeated_query_total",
+    "Requests que repitieron la misma forma de consulta más veces que el umbral", ("method", "route")
+)
+DB_BUDGET_EXCEEDED = REGISTRY.counter(
+    "http_requests_db_budget_exceeded_total",
+    "Requests que hicieron más round trips que el presupuesto de su ruta", ("method", "route")
+)
+
+
+def db_budget(max_round_trips: int):
+    """Declare the maximum number of MongoDB round trips of an endpoint"""
+    def decorator(endpoint):
+        endpoint.db_round_trip_budget = max_round_trips
+        return endpoint
+    return decorator
+
+
+def round_trip_budget(endpoint) -> Optional[int]:
+    return getattr(endpoint, "db_round_trip_budget", None)
+
+
+def extend_budget(round_trips: int):
+    """Allow the current request ``round_trips`` more than its declared budget"""
+    stats = _stats_actual.get()
+    if stats is not None:
+        stats.extra_budget += round_trips
+
+
+def _shape(valor):
+    if isinstance(valor, dict):
+        return {k: _shape(v) for k, v in valor.items()}
+    if isinstance(valor, list) and valor and all(isinstance(v, dict) for v in valor):
+        # Pipelines, $or, $and: cada elemento tiene su propia estructura
+        return [_shape(v) for v in valor]
+    return "?"
+
+
+def command_shape(command_name: str, command: dict) -> str:
+    """Collection plus filter structure of a command, without literal values"""
+    if command_name == "getMore":
+        return f"getMore {command.get('collection')}"
+    coleccion = command.get(command_name)
+    if command_name == "find":
+        filtro = command.get("filter", {})
+    elif command_name == "aggregate":
+        filtro = command.get("pipeline", [])
+    elif command_name in ("count", "findAndModify"):
+        filtro = command.get("query", {})
+    elif command_name == "distinct":
+        filtro = {"key": command.get("key"), "query": command.get("query", {})}
+    elif command_name == "update":
+        filtro = [u.get("q", {}) for u in command.get("updates", [])[:1]]
+    elif command_name == "delete":
+        filtro = [d.get("q", {}) for d in command.get("deletes", [])[:1]]
+    else:
+        return f"{command_name} {coleccion}" if isinstance(coleccion, str) else command_name
+    return f"{command_name} {coleccion} {json.dumps(_shape(filtro), default=str)}"
+
+
+class RequestDbStats:
+    def __init__(self, label: Optional[str] = None):
+        self.label = label  # "GET /api/..." del request, para los registros de consultas lentas
+        self._lock = threading.Lock()
+        self.closed = False
+        self.commands = 0
+        self.extra_budget = 0  # sumado con extend_budget() por los lotes extra
+        self.duration_ms = 0.0
+        self.shapes: Dict[str, List[float]] = {}  # forma -> [veces, ms]
+        self._pendientes: Dict[int, str] = {}
+
+    def started(self, request_id: int, shape: str):
+        with self._lock:
+            self.commands += 1
+            self._pendientes[request_id] = shape
+            self.shapes.setdefault(shape, [0, 0.0])[0] += 1
+
+    def finished(self, request_id: int, duration_ms: float):
+        with self._lock:
+            self.duration_ms += duration_ms
+            shape = self._pendientes.pop(request_id, None)
+            if shape is not None:
+                self.shapes[shape][1] += duration_ms
+
+    def repeated(self, umbral: int) -> List[Tuple[str, int]]:
+        return [
+            (shape, int(veces)) for shape, (veces, _) in self.shapes.items()
+            if veces > umbral and shape.split(" ", 1)[0] not in COMANDOS_DE_CURSOR
+        ]
+
+    def summary(self) -> str:
+        lineas = sorted(self.shapes.items(), key=lambda item: -item[1][1])
+        return "\n".join(f"  {int(veces)}x {ms:8.2f} ms  {shape}" for shape, (veces, ms) in lineas)
+
+
+_stats_actual: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+def current_stats() -> Optional[RequestDbStats]:
+    return _stats_actual.get()
+
+
+@contextmanager
+def tracking(label: Optional[str] = None):
+    """Attribute the MongoDB commands issued inside the block to a new RequestDbStats"""
+    stats = RequestDbStats(label)
+    token = _stats_actual.set(stats)
+    try:
+        yield stats
+    finally:
+        stats.closed = True
+        _stats_actual.reset(token)
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    def started(self, event):
+        stats = _stats_actual.get()
+        if stats is None or stats.closed or event.command_name in COMANDOS_IGNORADOS:
+            return
+        stats.started(event.request_id, command_shape(event.command_name, event.command))
+
+    def succeeded(self, event):
+        stats = _stats_actual.get()
+        if stats is None or event.command_name in COMANDOS_IGNORADOS:
+            return
+        stats.finished(event.request_id, event.duration_micros / 1000)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+class DbTracingMiddleware:
+    def __init__(self, app, debug_headers: bool = False, slow_request_ms: float = 1000,
+                 repeated_query_threshold: int = 5):
+        self.app = app
+        self.debug_headers = debug_headers
+        self.slow_request_ms = slow_request_ms
+        self.repeated_query_threshold = repeated_query_threshold
+        self.routes = RouteTemplates()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with tracking(f"{scope['method']} {scope['path']}") as stats:
+            send_final = send
+            if self.debug_headers:
+                async def send_final(message):
+                    if message["type"] == "http.response.start":
+                        headers = list(message.get("headers", []))
+                        headers.append((b"x-db-round-trips", str(stats.commands).encode()))
+                        headers.append((b"x-db-time-ms", f"{stats.duration_ms:.2f}".encode()))
+                        if stats.repeated(self.repeated_query_threshold):
+                            headers.append((b"x-db-repeated-query", b"1"))
+                        message = {**message, "headers": headers}
+                    await send(message)
+
+            inicio = perf_counter()
+            try:
+                await self.app(scope, receive, send_final)
+            finally:
+                self._report(scope, stats, (perf_counter() - inicio) * 1000)
+
+    def _report(self, scope, stats: RequestDbStats, total_ms: float):
+        method = scope["method"]
+        route = self.routes.resolve(scope)
+        DB_ROUND_TRIPS.observe((method, route), stats.commands)
+        DB_SECONDS.observe((method, route), stats.duration_ms / 1000)
+
+        repetidas = stats.repeated(self.repeated_query_threshold)
+        if repetidas:
+            DB_REPEATED.inc((method, route))
+            detalle = ", ".join(f"{veces}x {shape}" for shape, veces in repetidas)
+            logger.warning(f"Consulta repetida (posible N+1) en {method} {route}: {detalle}")
+        presupuesto = round_trip_budget(scope.get("endpoint"))
+        if presupuesto is not None:
+            presupuesto += stats.extra_budget
+        if presupuesto is not None and stats.commands > presupuesto:
+            DB_BUDGET_EXCEEDED.inc((method, route))
+            logger.warning(
+                f"Presupuesto de round trips excedido en {method} {route}: "
+                f"{stats.commands} > {presupuesto}\n{stats.summary()}"
+            )
+        if total_ms >= self.slow_request_ms:
+            logger.warning(
+                f"Request lento: {method} {route} {total_ms:.0f} ms, "
+                f"{stats.commands} comandos Mongo ({stats.duration_ms:.0f} ms)\n{stats.summary()}"
+            )
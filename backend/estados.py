@@ -0,0 +1,30 @@
+"""Roles de usuario y estados de lavaderos, turnos y pagos.
+
+Se usan tanto en server.py como en los repositorios.
+"""
+
+
+class UserRole(str):
+    SUPER_ADMIN = "SUPER_ADMIN"
+    ADMIN = "ADMIN"  # Dueño de lavadero
+    CLIENTE = "CLIENTE"  # Cliente que saca turnos
+
+
+class EstadoAdmin(str):
+    PENDIENTE_APROBACION = "PENDIENTE_APROBACION"
+    ACTIVO = "ACTIVO"
+    VENCIDO = "VENCIDO"
+    BLOQUEADO = "BLOQUEADO"
+
+
+class EstadoTurno(str):
+    DISPONIBLE = "DISPONIBLE"
+    RESERVADO = "RESERVADO"
+    CONFIRMADO = "CONFIRMADO"
+    CANCELADO = "CANCELADO"
+
+
+class EstadoPago(str):
+    PENDIENTE = "PENDIENTE"
+    CONFIRMADO = "CONFIRMADO"
+    RECHAZADO = "RECHAZADO"
@@ -0,0 +1,66 @@
+"""Servidor de autenticación falso para desarrollo y tests.
+
+Imita el endpoint ``/auth/v1/env/oauth/session-data`` del servicio externo.
+Su comportamiento se controla con ``FakeAuthSettings``: demora, código de
+estado o colgarse sin responder nunca. En tests se usa en proceso con
+``httpx.ASGITransport``; para desarrollo se puede levantar aparte y apuntar
+``AUTH_SERVICE_URL`` a él:
+
+    python fake_auth_server.py --port 8099 --delay 0.2
+"""
+from dataclasses import dataclass
+import argparse
+import asyncio
+
+from fastapi import FastAPI, Header, HTTPException
+
+SESSION_DATA_PATH = "/auth/v1/env/oauth/session-data"
+
+
+@dataclass
+class FakeAuthSettings:
+    delay: float = 0.0
+    status_code: int = 200
+    hang: bool = False
+
+
+def create_fake_auth_app(settings: FakeAuthSettings = None) -> FastAPI:
+    settings = settings or FakeAuthSettings()
+    app = FastAPI(title="Fake auth")
+    app.state.settings = settings
+    app.state.calls = 0
+
+    @app.get(SESSION_DATA_PATH)
+    async def session_data(x_session_id: str = Header(...)):
+        app.state.calls += 1
+        if settings.hang:
+            await asyncio.Event().wait()
+        if settings.delay:
+            await asyncio.sleep(settings.delay)
+        if settings.status_code != 200:
+            raise HTTPException(status_code=settings.status_code, detail="fake auth error")
+        return {
+            "id": f"google-{x_session_id}",
+            "email": f"{x_session_id}@fake-auth.example.com",
+            "name": f"Usuario {x_session_id}",
+            "picture": "",
+            "session_token": f"token-{x_session_id}",
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--status", type=int, default=200)
+    parser.add_argument("--hang", action="store_true")
+    args = parser.parse_args()
+    uvicorn.run(
+        create_fake_auth_app(FakeAuthSettings(args.delay, args.status, args.hang)),
+        host="127.0.0.1",
+        port=args.port
+    )
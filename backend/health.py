@@ -0,0 +1,129 @@
+"""Piezas del endpoint de readiness.
+
+- ``PoolStats``: ConnectionPoolListener que lleva, por servidor, cuántas
+  conexiones tiene abiertas el pool de Motor y cuántas están en uso.
+- ``Pinger``: ping a Mongo con un deadline corto. Si un ping anterior sigue
+  colgado (Motor lo corre en un hilo que el deadline no interrumpe) se
+  reutiliza en lugar de lanzar otro, así las probes no acumulan hilos.
+- ``CachedCheck``: cachea el resultado de un chequeo durante ``ttl``
+  segundos y comparte el cálculo en curso entre probes concurrentes.
+- ``executor_queue_depth``: trabajos encolados en un executor de hilos.
+"""
+from collections import defaultdict
+from time import monotonic
+from typing import Awaitable, Callable, Optional
+import asyncio
+import tempfile
+import threading
+
+from pymongo import monitoring
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._abiertas = defaultdict(int)
+        self._en_uso = defaultdict(int)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "size": sum(self._abiertas.values()),
+                "checked_out": sum(self._en_uso.values()),
+            }
+
+    def _sumar(self, contador, address, valor):
+        with self._lock:
+            contador[address] += valor
+
+    def connection_created(self, event):
+        self._sumar(self._abiertas, event.address, 1)
+
+    def connection_closed(self, event):
+        self._sumar(self._abiertas, event.address, -1)
+
+    def connection_checked_out(self, event):
+        self._sumar(self._en_uso, event.address, 1)
+
+    def connection_checked_in(self, event):
+        self._sumar(self._en_uso, event.address, -1)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._abiertas.pop(event.address, None)
+            self._en_uso.pop(event.address, None)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+
+class Pinger:
+    def __init__(self, db, timeout: float = 0.5):
+        self.db = db
+        self.timeout = timeout
+        self._en_curso: Optional[asyncio.Future] = None
+
+    async def ping(self) -> dict:
+        if self._en_curso is None or self._en_curso.done():
+            self._en_curso = asyncio.ensure_future(self.db.command("ping"))
+        inicio = monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._en_curso), self.timeout)
+        except asyncio.TimeoutError:
+            return {"ok": False, "error": f"sin respuesta en {self.timeout} s"}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "latency_ms": round((monotonic() - inicio) * 1000, 2)}
+
+
+def _probar_escritura(directorio: str):
+    with tempfile.NamedTemporaryFile(dir=directorio, prefix=".readiness-") as f:
+        f.write(b"ok")
+        f.flush()
+
+
+async def storage_writable(directorio) -> dict:
+    try:
+        await asyncio.to_thread(_probar_escritura, str(directorio))
+    except OSError as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True}
+
+
+def executor_queue_depth(executor) -> Optional[int]:
+    cola = getattr(executor, "_work_queue", None)
+    return cola.qsize() if cola is not None else None
+
+
+class CachedCheck:
+    def __init__(self, check: Callable[[], Awaitable[dict]], ttl: float = 1.0):
+        self.check = check
+        self.ttl = ttl
+        self._resultado: Optional[dict] = None
+        self._calculado_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> dict:
+        if monotonic() - self._calculado_at < self.ttl:
+            return self._resultado
+        async with self._lock:
+            # Otra probe pudo haberlo recalculado mientras esperábamos el lock
+            if monotonic() - self._calculado_at >= self.ttl:
+                self._resultado = await self.check()
+                self._calculado_at = monotonic()
+            return self._resultado
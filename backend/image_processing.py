@@ -0,0 +1,177 @@
+"""Normalización de imágenes de comprobantes al momento de subirlas.
+
+Los comprobantes llegan como capturas o fotos a resolución completa. Para leer
+una transferencia alcanza con resolución de pantalla, así que antes de guardar
+cada imagen se decodifica, se le quitan los metadatos EXIF, se reduce a una
+dimensión máxima configurable y se re-codifica a WebP o JPEG de alta calidad.
+
+El trabajo de CPU corre en un pool de procesos para no bloquear el event loop.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+import asyncio
+import multiprocessing
+import os
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Límite de píxeles para evitar "decompression bombs" (~50 MP)
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+FORMATOS_SALIDA = {
+    "webp": ("WEBP", "webp", "image/webp"),
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+}
+
+
+@dataclass(frozen=True)
+class ImageSettings:
+    max_dimension: int = 1280
+    formato: str = "webp"
+    calidad: int = 80
+    conservar_original: bool = False
+    workers: int = 2
+
+    @classmethod
+    def from_env(cls) -> "ImageSettings":
+        formato = os.environ.get("COMPROBANTE_FORMATO", "webp").lower()
+        if formato not in FORMATOS_SALIDA:
+            formato = "webp"
+        return cls(
+            max_dimension=int(os.environ.get("COMPROBANTE_MAX_DIMENSION", 1280)),
+            formato=formato,
+            calidad=int(os.environ.get("COMPROBANTE_CALIDAD", 80 if formato == "webp" else 85)),
+            conservar_original=os.environ.get("COMPROBANTE_CONSERVAR_ORIGINAL", "false").lower() in ("1", "true", "yes"),
+            workers=int(os.environ.get("COMPROBANTE_IMAGE_WORKERS", min(4, os.cpu_count() or 1))),
+        )
+
+
+@dataclass(frozen=True)
+class NormalizedImage:
+    content: bytes
+    extension: str
+    content_type: str
+    width: int
+    height: int
+    original_size: int
+    phash: str  # Hash perceptual de 64 bits en hexadecimal
+
+
+class InvalidImageError(ValueError):
+    """Raised when the uploaded bytes cannot be decoded as an image"""
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    matriz = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    matriz[0] *= 1 / np.sqrt(2)
+    return matriz * np.sqrt(2 / n)
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def perceptual_hash(img: Image.Image) -> int:
+    """64-bit DCT perceptual hash (pHash) of an image"""
+    gris = img.convert("L").resize((32, 32), Image.Resampling.LANCZOS)
+    pixeles = np.asarray(gris, dtype=np.float64)
+    dct = _DCT_32 @ pixeles @ _DCT_32.T
+    # Frecuencias bajas 8x8, comparadas contra la mediana (sin el término DC)
+    bajas = dct[:8, :8].flatten()
+    bits = bajas > np.median(bajas[1:])
+    valor = 0
+    for bit in bits:
+        valor = (valor << 1) | int(bit)
+    return valor
+
+
+def normalize_image(data: bytes, settings: ImageSettings) -> NormalizedImage:
+    """Decode, strip metadata, downscale and re-encode an image.
+
+    Runs inside the worker pool, so it must stay a top-level picklable function.
+    """
+    pil_format, extension, content_type = FORMATOS_SALIDA[settings.formato]
+    limite = (settings.max_dimension, settings.max_dimension)
+
+    try:
+        img = Image.open(BytesIO(data))
+        # Para JPEG, decodificar directamente a escala reducida (DCT scaling)
+        if img.format == "JPEG":
+            img.draft("RGB", limite)
+        img.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(str(e)) from e
+
+    # GIF/WEBP animados: nos quedamos con el primer cuadro
+    if getattr(img, "is_animated", False):
+        img.seek(0)
+
+    # Aplicar la orientación EXIF antes de descartar los metadatos
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail(limite, Image.Resampling.LANCZOS)
+    phash = perceptual_hash(img)
+
+    tiene_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if pil_format == "JPEG" or not tiene_alpha:
+        if tiene_alpha:
+            fondo = Image.new("RGB", img.size, (255, 255, 255))
+            fondo.paste(img.convert("RGBA"), mask=img.convert("RGBA").split()[-1])
+            img = fondo
+        else:
+            img = img.convert("RGB")
+    else:
+        img = img.convert("RGBA")
+
+    salida = BytesIO()
+    save_kwargs = {"quality": settings.calidad}
+    if pil_format == "JPEG":
+        save_kwargs.update(optimize=True, progressive=True)
+    else:
+        save_kwargs.update(method=4)
+    # No se pasa exif= ni icc_profile=, así que la imagen se guarda sin metadatos
+    img.save(salida, format=pil_format, **save_kwargs)
+
+    return NormalizedImage(
+        content=salida.getvalue(),
+        extension=extension,
+        content_type=content_type,
+        width=img.width,
+        height=img.height,
+        original_size=len(data),
+        phash=f"{phash:016x}",
+    )
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_image_pool(settings: ImageSettings) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: los workers no heredan el cliente de Mongo ni el event loop
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_image_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def image_pool_pending() -> int:
+    """Images submitted to the pool and not finished yet"""
+    return len(getattr(_pool, "_pending_work_items", ())) if _pool is not None else 0
+
+
+async def normalize_image_async(data: bytes, settings: ImageSettings) -> NormalizedImage:
+    """Run normalize_image in the worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_image_pool(settings), normalize_image, data, settings)
@@ -0,0 +1,115 @@
+"""Medición continua del lag del event loop y captura de lo que lo bloquea.
+
+Una corrutina duerme ``interval`` segundos en un ciclo y mide cuánto más
+tardó en despertar: ese exceso es el lag, y se exporta como histograma.
+Cada vez que despierta deja un latido; un hilo vigía revisa el latido y, si
+el loop lleva más de ``threshold`` segundos sin despertar, toma la pila del
+hilo del loop en ese momento (el frame que está bloqueando) y la deja en el
+log junto con la ruta del request que estaba corriendo.
+
+``RequestTaskMiddleware`` asocia cada tarea de request con su ruta para que
+el vigía pueda nombrarla.
+"""
+from time import monotonic
+from typing import Dict, Optional
+import asyncio
+import logging
+import sys
+import threading
+import traceback
+
+from metrics import REGISTRY, RouteTemplates
+
+logger = logging.getLogger(__name__)
+
+_current_tasks = getattr(asyncio.tasks, "_current_tasks", None)
+
+LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds", "Demora del event loop en atender un timer",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_BLOCKS = REGISTRY.counter(
+    "event_loop_blocks_total", "Bloqueos del event loop por encima del umbral", ("method", "route")
+)
+
+# Frames de la pila que se incluyen en el log (los más cercanos al bloqueo)
+MAX_FRAMES = 25
+
+_scopes_por_tarea: Dict[asyncio.Task, dict] = {}
+
+
+class RequestTaskMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        _scopes_por_tarea[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _scopes_por_tarea.pop(task, None)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.2):
+        self.interval = interval
+        self.threshold = threshold
+        self.last_lag = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._latido = monotonic()
+        self._reportado = False
+        self._detener = threading.Event()
+        self._vigia: Optional[threading.Thread] = None
+        self._rutas = RouteTemplates()
+
+    def start(self) -> asyncio.Task:
+        """Start the watchdog thread and return the measuring task; call from the loop"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._latido = monotonic()
+        self._detener.clear()
+        self._vigia = threading.Thread(target=self._vigilar, name="loop-watchdog", daemon=True)
+        self._vigia.start()
+        return asyncio.create_task(self.run())
+
+    def stop(self):
+        self._detener.set()
+        if self._vigia is not None:
+            self._vigia.join()
+            self._vigia = None
+
+    async def run(self):
+        while True:
+            inicio = monotonic()
+            await asyncio.sleep(self.interval)
+            ahora = monotonic()
+            self.last_lag = max(0.0, ahora - inicio - self.interval)
+            LOOP_LAG.observe((), self.last_lag)
+            self._latido = ahora
+            self._reportado = False
+
+    def _vigilar(self):
+        while not self._detener.wait(self.interval / 2):
+            bloqueado = monotonic() - self._latido - self.interval
+            if bloqueado < self.threshold or self._reportado:
+                continue
+            self._reportado = True
+            frame = sys._current_frames().get(self._loop_thread_id)
+            pila = "".join(traceback.format_stack(frame)[-MAX_FRAMES:]) if frame is not None else ""
+            tarea = _current_tasks.get(self._loop) if _current_tasks is not None else None
+            scope = _scopes_por_tarea.get(tarea)
+            if scope is not None:
+                # El router ya corrió: la plantilla de la ruta está disponible
+                method, ruta, detalle = scope["method"], self._rutas.resolve(scope), scope["path"]
+            else:
+                method, ruta, detalle = "", "fuera de un request", ""
+            LOOP_BLOCKS.inc((method, ruta))
+            logger.warning(
+                f"Event loop bloqueado hace {bloqueado * 1000:.0f} ms en {method} {ruta} ({detalle}). "
+                f"Pila del bloqueo:\n{pila}"
+            )
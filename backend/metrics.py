@@ -0,0 +1,242 @@
+"""Métricas en formato de exposición de Prometheus, sin dependencias.
+
+``MetricsMiddleware`` es un middleware ASGI puro (no BaseHTTPMiddleware, que
+agrega una tarea y una cola por request) que registra cantidad de requests,
+errores, latencia y requests en curso, etiquetados por método y por la
+plantilla de la ruta (``/api/superadmin/admins/{admin_id}``), nunca por la
+URL concreta, para que la cantidad de series quede acotada.
+
+Los contadores se pueden actualizar desde otros hilos (los listeners de
+pymongo corren en el executor de Motor), por eso cada métrica tiene su lock.
+"""
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import threading
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(nombres: Sequence[str], valores: Sequence[str]) -> str:
+    if not nombres:
+        return ""
+    pares = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(nombres, valores))
+    return "{" + pares + "}"
+
+
+def _format_value(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class _Metric:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, labels: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, labels=()):
+        super().__init__(nombre, ayuda, labels)
+        self._valores: Dict[LabelValues, float] = {}
+
+    def inc(self, labels: LabelValues = (), valor: float = 1):
+        with self._lock:
+            self._valores[labels] = self._valores.get(labels, 0) + valor
+
+    def value(self, labels: LabelValues = ()) -> float:
+        return self._valores.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._valores.items())
+        return self._header() + [
+            f"{self.nombre}{_format_labels(self.labels, k)} {_format_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    tipo = "gauge"
+
+    def dec(self, labels: LabelValues = (), valor: float = 1):
+        self.inc(labels, -valor)
+
+    def set(self, labels: LabelValues = (), valor: float = 0):
+        with self._lock:
+            self._valores[labels] = valor
+
+
+class Histogram(_Metric):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, labels=(), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(nombre, ayuda, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [conteos por bucket (+Inf al final), suma]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, labels: LabelValues, valor: float):
+        # Se guarda el conteo de cada bucket por separado; se acumula al renderizar
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(labels)
+            if serie is None:
+                serie = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    def count(self, labels: LabelValues) -> int:
+        serie = self._series.get(labels)
+        return sum(serie[0]) if serie else 0
+
+    def render(self):
+        with self._lock:
+            items = [(k, list(conteos), suma) for k, (conteos, suma) in self._series.items()]
+        lineas = self._header()
+        nombres_le = self.labels + ("le",)
+        for k, conteos, suma in items:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float("inf"),), conteos):
+                acumulado += conteo
+                lineas.append(
+                    f"{self.nombre}_bucket{_format_labels(nombres_le, k + (_format_value(limite),))} {acumulado}"
+                )
+            lineas.append(f"{self.nombre}_sum{_format_labels(self.labels, k)} {_format_value(suma)}")
+            lineas.append(f"{self.nombre}_count{_format_labels(self.labels, k)} {acumulado}")
+        return lineas
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, nombre, ayuda, labels=()) -> Counter:
+        return self.register(Counter(nombre, ayuda, labels))
+
+    def gauge(self, nombre, ayuda, labels=()) -> Gauge:
+        return self.register(Gauge(nombre, ayuda, labels))
+
+    def histogram(self, nombre, ayuda, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(nombre, ayuda, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Callback run before each scrape, to refresh gauges computed on demand"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lineas = []
+        for metric in self._metrics:
+            lineas.extend(metric.render())
+        return "\n".join(lineas) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Requests HTTP atendidos", ("method", "route", "status")
+)
+HTTP_ERRORS = REGISTRY.counter(
+    "http_request_errors_total", "Requests que terminaron en 5xx o con una excepción", ("method", "route")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Latencia de los requests HTTP", ("method", "route")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "Requests HTTP en curso")
+
+# Etiqueta para lo que no coincide con ninguna ruta (404): no se usa la URL
+RUTA_SIN_MATCH = "<unmatched>"
+
+
+def _route_templates(app) -> Dict[object, str]:
+    plantillas = {}
+    for route in getattr(app, "routes", ()):
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is not None:
+            plantillas.setdefault(endpoint, route.path)
+        elif getattr(route, "app", None) is not None:
+            # Mount: el router pone la app montada como endpoint
+            plantillas.setdefault(route.app, route.path + "/{path}")
+    return plantillas
+
+
+class RouteTemplates:
+    """Resolve the route template a request matched, once routing is done"""
+
+    def __init__(self):
+        self._plantillas: Optional[Dict[object, str]] = None
+
+    def resolve(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return RUTA_SIN_MATCH
+        if self._plantillas is None:
+            # Las rutas ya están todas registradas cuando llega el primer request
+            self._plantillas = _route_templates(scope.get("app"))
+        return self._plantillas.get(endpoint, RUTA_SIN_MATCH)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.routes = RouteTemplates()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_con_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        inicio = perf_counter()
+        try:
+            await self.app(scope, receive, send_con_status)
+        except BaseException:
+            status_code = 500
+            raise
+        finally:
+            duracion = perf_counter() - inicio
+            HTTP_IN_FLIGHT.dec()
+            method = scope["method"]
+            route = self.routes.resolve(scope)
+            HTTP_REQUESTS.inc((method, route, str(status_code)))
+            if status_code >= 500:
+                HTTP_ERRORS.inc((method, route))
+            HTTP_LATENCY.observe((method, route), duracion)
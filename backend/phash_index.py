@@ -0,0 +1,166 @@
+"""Índice de hashes perceptuales para detectar comprobantes casi duplicados.
+
+Implementa una tabla hash multi-índice (multi-index hashing): cada hash de 64
+bits se parte en ``BLOQUES`` segmentos de 16 bits y cada segmento indexa una
+tabla propia. Por el principio del palomar, si dos hashes están a distancia de
+Hamming <= k, al menos un segmento difiere en <= k // BLOQUES bits, así que basta
+con revisar los buckets vecinos de cada segmento en vez de recorrer todo.
+
+Cada worker tiene su propio índice: ``HashIndexSync`` lo carga al arrancar
+(reintentando hasta lograrlo) y después trae periódicamente los hashes que
+subieron otros workers.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from itertools import combinations
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+BITS = 64
+BLOQUES = 4
+BITS_BLOQUE = BITS // BLOQUES
+MASCARA_BLOQUE = (1 << BITS_BLOQUE) - 1
+
+
+def _segmentos(valor: int) -> List[int]:
+    return [(valor >> (i * BITS_BLOQUE)) & MASCARA_BLOQUE for i in range(BLOQUES)]
+
+
+def _mascaras(radio: int) -> List[int]:
+    """XOR masks that flip up to ``radio`` bits of a segment"""
+    mascaras = [0]
+    for r in range(1, radio + 1):
+        for posiciones in combinations(range(BITS_BLOQUE), r):
+            mascara = 0
+            for pos in posiciones:
+                mascara |= 1 << pos
+            mascaras.append(mascara)
+    return mascaras
+
+
+class MultiIndexHashTable:
+    def __init__(self):
+        self._hashes: Dict[str, int] = {}
+        self._ids_por_hash: Dict[int, Set[str]] = defaultdict(set)
+        # Cada tabla guarda segmento -> hashes completos, para verificar sin indirecciones
+        self._tablas: List[Dict[int, Set[int]]] = [defaultdict(set) for _ in range(BLOQUES)]
+        self._mascaras: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._hashes
+
+    def add(self, item_id: str, valor: int):
+        if item_id in self._hashes:
+            self.remove(item_id)
+        self._hashes[item_id] = valor
+        ids = self._ids_por_hash[valor]
+        ids.add(item_id)
+        if len(ids) == 1:
+            for tabla, segmento in zip(self._tablas, _segmentos(valor)):
+                tabla[segmento].add(valor)
+
+    def remove(self, item_id: str):
+        valor = self._hashes.pop(item_id, None)
+        if valor is None:
+            return
+        ids = self._ids_por_hash[valor]
+        ids.discard(item_id)
+        if ids:
+            return
+        del self._ids_por_hash[valor]
+        for tabla, segmento in zip(self._tablas, _segmentos(valor)):
+            bucket = tabla.get(segmento)
+            if bucket is not None:
+                bucket.discard(valor)
+                if not bucket:
+                    del tabla[segmento]
+
+    def search(self, valor: int, max_distancia: int, excluir: Optional[str] = None) -> List[Tuple[str, int]]:
+        """Return ``(item_id, distancia)`` for every hash within ``max_distancia``, nearest first"""
+        radio = max_distancia // BLOQUES
+        mascaras = self._mascaras.get(radio)
+        if mascaras is None:
+            mascaras = self._mascaras[radio] = _mascaras(radio)
+
+        cercanos: Dict[int, int] = {}
+        for tabla, segmento in zip(self._tablas, _segmentos(valor)):
+            for mascara in mascaras:
+                bucket = tabla.get(segmento ^ mascara)
+                if not bucket:
+                    continue
+                for candidato in bucket:
+                    distancia = (candidato ^ valor).bit_count()
+                    if distancia <= max_distancia:
+                        cercanos[candidato] = distancia
+
+        resultado = [
+            (item_id, distancia)
+            for candidato, distancia in cercanos.items()
+            for item_id in self._ids_por_hash[candidato]
+            if item_id != excluir
+        ]
+        resultado.sort(key=lambda par: par[1])
+        return resultado
+
+
+class HashIndexSync:
+    """Keeps a MultiIndexHashTable in step with the stored hashes.
+
+    ``fuente(desde)`` yields ``(item_id, hash_hex, created_at)`` for the items
+    created after ``desde``, or for all of them when ``desde`` is None.
+    """
+    # Margen para inserciones de otros workers con el reloj algo atrasado
+    SOLAPAMIENTO = timedelta(seconds=5)
+
+    def __init__(self, indice: MultiIndexHashTable,
+                 fuente: Callable[[Optional[datetime]], AsyncIterator[Tuple[str, str, datetime]]],
+                 refresh_seconds: float = 30, retry_seconds: float = 5):
+        self.indice = indice
+        self.fuente = fuente
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        self.cargado = False
+        self._desde: Optional[datetime] = None
+
+    async def refresh(self) -> int:
+        """Add the hashes created since the last complete pass; returns how many were new"""
+        desde = None if self._desde is None else self._desde - self.SOLAPAMIENTO
+        hasta = self._desde
+        nuevos = 0
+        async for item_id, valor, created_at in self.fuente(desde):
+            if item_id not in self.indice:
+                self.indice.add(item_id, int(valor, 16))
+                nuevos += 1
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            if hasta is None or created_at > hasta:
+                hasta = created_at
+        # Sólo tras una pasada completa: una cortada se repite desde el mismo punto
+        self._desde = hasta
+        self.cargado = True
+        return nuevos
+
+    async def run(self):
+        """Load the index, retrying until it succeeds, then pick up new hashes periodically"""
+        while True:
+            cargado = self.cargado
+            try:
+                nuevos = await self.refresh()
+                if not cargado:
+                    logger.info(f"Índice de hashes de comprobantes cargado: {len(self.indice)} imágenes")
+                elif nuevos:
+                    logger.info(f"Índice de hashes de comprobantes: {nuevos} imágenes nuevas")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if cargado:
+                    logger.warning(f"No se pudo refrescar el índice de hashes de comprobantes: {e}")
+                else:
+                    logger.error(f"No se pudo cargar el índice de hashes de comprobantes, se reintenta: {e}")
+            await asyncio.sleep(self.refresh_seconds if self.cargado else self.retry_seconds)
@@ -0,0 +1,153 @@
+"""Profiler por muestreo de un único request, activado por header.
+
+Un super admin agrega ``X-Profile-Request: 1`` y ese request corre en su
+propia tarea mientras un hilo muestrea su pila cada ``interval`` segundos:
+si la tarea está ejecutando, la pila del hilo del event loop (recortada a la
+tarea); si está suspendida, la cadena de ``await`` con una hoja
+``[await]``, así el tiempo esperando a Mongo o a la red también aparece. El
+resultado se guarda en formato speedscope (https://www.speedscope.app) y
+la respuesta lleva ``X-Profile-Id`` para recuperarlo.
+
+Los requests sin el header sólo pagan la búsqueda del header.
+"""
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import sys
+import threading
+import uuid
+
+HEADER = b"x-profile-request"
+FRAME_ESPERA = ("[await]", "", 0)
+MAX_SAMPLES = 100_000
+
+_current_tasks = getattr(asyncio.tasks, "_current_tasks", None)
+
+FrameKey = Tuple[str, str, int]
+
+
+def _frame_key(frame) -> FrameKey:
+    code = frame.f_code
+    return (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+
+
+class TaskSampler(threading.Thread):
+    def __init__(self, task: asyncio.Task, interval: float = 0.001):
+        super().__init__(name="request-profiler", daemon=True)
+        self.task = task
+        self.loop = task.get_loop()
+        self.loop_thread_id = threading.get_ident()  # se crea desde el hilo del event loop
+        self.interval = interval
+        self.frames: List[FrameKey] = []
+        self._indices: Dict[FrameKey, int] = {}
+        self.samples: List[List[int]] = []
+        self.weights: List[float] = []
+        self._detener = threading.Event()
+
+    def _indice(self, key: FrameKey) -> int:
+        indice = self._indices.get(key)
+        if indice is None:
+            indice = self._indices[key] = len(self.frames)
+            self.frames.append(key)
+        return indice
+
+    def _stack(self) -> Optional[List[FrameKey]]:
+        if self.task.done():
+            return None
+        ejecutando = _current_tasks is None or _current_tasks.get(self.loop) is self.task
+        if ejecutando:
+            frame = sys._current_frames().get(self.loop_thread_id)
+            pila = []
+            while frame is not None:
+                pila.append(frame)
+                frame = frame.f_back
+            pila.reverse()
+            # Descartar los frames del event loop por debajo de la tarea
+            raiz = self.task.get_coro().cr_frame
+            if raiz in pila:
+                pila = pila[pila.index(raiz):]
+            return [_frame_key(f) for f in pila]
+        try:
+            pila = self.task.get_stack()
+        except Exception:
+            return None
+        return [_frame_key(f) for f in pila] + [FRAME_ESPERA]
+
+    def run(self):
+        ultimo = perf_counter()
+        while not self._detener.wait(self.interval) and len(self.samples) < MAX_SAMPLES:
+            ahora = perf_counter()
+            pila = self._stack()
+            if pila:
+                self.samples.append([self._indice(k) for k in pila])
+                self.weights.append(ahora - ultimo)
+            ultimo = ahora
+
+    def stop(self):
+        self._detener.set()
+        self.join()
+
+
+def to_speedscope(sampler: TaskSampler, nombre: str, duracion: float) -> dict:
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": [{"name": n, "file": f, "line": l} for n, f, l in sampler.frames]},
+        "profiles": [{
+            "type": "sampled",
+            "name": nombre,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": duracion,
+            "samples": sampler.samples,
+            "weights": sampler.weights,
+        }],
+        "name": nombre,
+        "activeProfileIndex": 0,
+        "exporter": "lavaderos-request-profiler",
+    }
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, authorize: Callable[[dict], Awaitable[bool]],
+                 save: Callable[[dict], Awaitable[None]], interval: float = 0.001):
+        self.app = app
+        self.authorize = authorize
+        self.save = save
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(k == HEADER for k, _ in scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+        if not await self.authorize(scope):
+            await self.app(scope, receive, send)
+            return
+
+        perfil_id = str(uuid.uuid4())
+
+        async def send_con_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(b"x-profile-id", perfil_id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        task = asyncio.ensure_future(self.app(scope, receive, send_con_id))
+        sampler = TaskSampler(task, self.interval)
+        inicio = perf_counter()
+        sampler.start()
+        try:
+            await task
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            sampler.stop()
+            duracion = perf_counter() - inicio
+            nombre = f"{scope['method']} {scope['path']}"
+            await self.save({
+                "id": perfil_id,
+                "request": nombre,
+                "duracion_ms": round(duracion * 1000, 3),
+                "samples": len(sampler.samples),
+                "speedscope": to_speedscope(sampler, nombre, duracion),
+            })
@@ -0,0 +1,1434 @@
+"""Acceso a datos de usuarios, lavaderos, turnos, pagos y comprobantes.
+
+Cada repositorio tiene dos implementaciones con la misma semántica:
+
+- ``Mongo*``: Motor, las consultas e índices que usa la aplicación en producción.
+- ``Memory*``: diccionarios en memoria, para correr la app ASGI en proceso en
+  los tests sin MongoDB. Los documentos se copian al guardar y al leer como lo
+  haría un round trip a Mongo (fechas UTC sin zona, con precisión de
+  milisegundos) y las claves únicas levantan ``DuplicateKeyError``.
+
+Los métodos devuelven diccionarios sin ``_id``. Las lecturas aceptan
+``fields``: los campos que necesita quien llama, que viajan como proyección
+(``None`` trae el documento entero). ``has_password`` es un campo calculado de
+los usuarios, para no leer el hash cuando sólo importa si existe.
+``MongoRepositories`` y
+``MemoryRepositories`` agrupan los repositorios y saben correr una
+operación dentro de una transacción (si el servidor la soporta).
+"""
+from collections import Counter
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+import logging
+import re
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from estados import EstadoAdmin, EstadoPago
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+SIN_ID = {"_id": 0}
+Campos = Optional[Iterable[str]]
+
+# Campos de usuario que se calculan en el servidor en vez de leerse
+CALCULADOS_USUARIO = {"has_password": {"$gt": ["$password_hash", None]}}
+
+# Lo que acompaña a cada comprobante pendiente en pendientes_con_detalle()
+DETALLE_PENDIENTE = {
+    "pago": ("id", "mes_año", "monto", "estado", "fecha_vencimiento"),
+    "admin": ("id", "nombre", "email"),
+    "lavadero": ("id", "nombre"),
+}
+
+
+def _con_prefijo(expresion, prefijo: str):
+    """Rewrite the ``$campo`` paths of an expression to ``$<prefijo>campo``"""
+    if isinstance(expresion, str) and expresion.startswith("$") and not expresion.startswith("$$"):
+        return f"${prefijo}{expresion[1:]}"
+    if isinstance(expresion, dict):
+        return {clave: _con_prefijo(valor, prefijo) for clave, valor in expresion.items()}
+    if isinstance(expresion, list):
+        return [_con_prefijo(valor, prefijo) for valor in expresion]
+    return expresion
+
+
+def proyeccion(fields: Campos, calculados: Optional[dict] = None, prefijo: str = "") -> dict:
+    """Projection with only ``fields`` (the whole document, minus _id, for None)"""
+    if fields is None:
+        return {f"{prefijo}_id": 0}
+    calculados = calculados or {}
+    # Los campos calculados de un subdocumento se calculan con sus propios campos
+    incluidos = {
+        f"{prefijo}{campo}": _con_prefijo(calculados[campo], prefijo) if campo in calculados else 1
+        for campo in fields
+    }
+    # En una inclusión el _id de un subdocumento queda afuera sin nombrarlo
+    return incluidos if prefijo else {"_id": 0, **incluidos}
+
+
+# ---------------------------------------------------------------- MongoDB
+
+class MongoUserRepository:
+    def __init__(self, collection, sesiones, credenciales):
+        self.collection = collection
+        self.sesiones = sesiones  # google_sessions
+        self.credenciales = credenciales  # temp_credentials
+
+    async def get_by_email(self, email: str, fields: Campos = None) -> Optional[dict]:
+        # Los usuarios con una purga en curso ya no existen para la aplicación
+        return await self.collection.find_one(
+            {"email": email, "purga_id": {"$exists": False}}, proyeccion(fields, CALCULADOS_USUARIO)
+        )
+
+    async def get_by_id(self, user_id: str, fields: Campos = None) -> Optional[dict]:
+        return await self.collection.find_one(
+            {"id": user_id, "purga_id": {"$exists": False}}, proyeccion(fields, CALCULADOS_USUARIO)
+        )
+
+    async def get(self, user_id: str, fields: Campos = None) -> Optional[dict]:
+        return await self.collection.find_one({"id": user_id}, proyeccion(fields, CALCULADOS_USUARIO))
+
+    async def get_with_rol(self, user_id: str, rol: str, exclude_purging: bool = False,
+                           fields: Campos = None) -> Optional[dict]:
+        filtro = {"id": user_id, "rol": rol}
+        if exclude_purging:
+            filtro["purga_id"] = {"$exists": False}
+        return await self.collection.find_one(filtro, proyeccion(fields, CALCULADOS_USUARIO))
+
+    async def email_in_use(self, email: str, exclude_id: Optional[str] = None) -> bool:
+        filtro = {"email": email}
+        if exclude_id is not None:
+            filtro["id"] = {"$ne": exclude_id}
+        return await self.collection.find_one(filtro, {"_id": 0, "id": 1}) is not None
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one(dict(doc))
+
+    async def update(self, user_id: str, fields: dict) -> bool:
+        result = await self.collection.update_one({"id": user_id}, {"$set": fields})
+        return result.matched_count > 0
+
+    async def delete(self, user_id: str) -> bool:
+        result = await self.collection.delete_one({"id": user_id})
+        return result.deleted_count > 0
+
+    async def mark_purging(self, user_id: str, purga_id: str):
+        await self.collection.update_one({"id": user_id}, {"$set": {"is_active": False, "purga_id": purga_id}})
+
+    async def bump_token_version(self, user_id: str) -> Optional[int]:
+        """Increment ``token_version``; the new version, or None if the user does not exist"""
+        user = await self.collection.find_one_and_update(
+            {"id": user_id},
+            {"$inc": {"token_version": 1}},
+            projection={"_id": 0, "token_version": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return user["token_version"] if user is not None else None
+
+    async def delete_sessions(self, user_id: str) -> int:
+        return (await self.sesiones.delete_many({"user_id": user_id})).deleted_count
+
+    async def session_user_id(self, session_token: str, now: datetime) -> Optional[str]:
+        """User of a session that has not expired yet"""
+        # Cubierta por el índice (session_token, expires_at, user_id); las
+        # sesiones vencidas las borra el índice TTL
+        sesion = await self.sesiones.find_one(
+            {"session_token": session_token, "expires_at": {"$gt": now}},
+            {"_id": 0, "user_id": 1}
+        )
+        return sesion["user_id"] if sesion else None
+
+    async def upsert_session(self, doc: dict):
+        """Upsert by token: logging in again with the same session adds no rows"""
+        await self.sesiones.update_one(
+            {"session_token": doc["session_token"]},
+            {
+                "$set": {"user_id": doc["user_id"], "expires_at": doc["expires_at"]},
+                "$setOnInsert": {"id": doc["id"], "created_at": doc["created_at"]}
+            },
+            upsert=True
+        )
+
+    async def delete_session(self, session_token: str):
+        await self.sesiones.delete_one({"session_token": session_token})
+
+    async def insert_temp_credential(self, email: str, password: str, created_at: datetime):
+        await self.credenciales.insert_one({"admin_email": email, "password": password, "created_at": created_at})
+
+    async def temp_credentials(self, emails: List[str]) -> Dict[str, str]:
+        """Temporary password by admin email"""
+        return {
+            doc["admin_email"]: doc["password"]
+            async for doc in self.credenciales.find(
+                {"admin_email": {"$in": emails}}, {"_id": 0, "admin_email": 1, "password": 1}
+            )
+        }
+
+    async def list(self, rol: Optional[str] = None, limit: int = 1000, fields: Campos = None) -> List[dict]:
+        filtro = {"rol": rol} if rol else {}
+        return await self.collection.find(filtro, proyeccion(fields, CALCULADOS_USUARIO)).to_list(limit)
+
+    async def with_lavadero(self, rol: str, limit: int = 1000, fields: Campos = None,
+                            lavadero_fields: Campos = None) -> List[dict]:
+        """Active users of ``rol``, newest first, each with its ``lavadero`` list.
+
+        ``lavadero_fields`` only applies together with ``fields``.
+        """
+        if fields is None:
+            proyectar = {"_id": 0, "lavadero._id": 0}
+        else:
+            proyectar = {**proyeccion(fields, CALCULADOS_USUARIO),
+                         **proyeccion(lavadero_fields or ("id",), prefijo="lavadero.")}
+        return await self.collection.aggregate([
+            {"$match": {"rol": rol, "purga_id": {"$exists": False}}},
+            {"$lookup": {
+                "from": "lavaderos",
+                "localField": "id",
+                "foreignField": "admin_id",
+                "as": "lavadero"
+            }},
+            {"$sort": {"created_at": -1}},
+            {"$project": proyectar}
+        ]).to_list(limit)
+
+
+class MongoLavaderoRepository:
+    def __init__(self, collection, configuraciones, dias_no_laborales):
+        self.collection = collection
+        self.configuraciones = configuraciones
+        self.dias_no_laborales = dias_no_laborales
+
+    async def get(self, lavadero_id: str, fields: Campos = None) -> Optional[dict]:
+        return await self.collection.find_one({"id": lavadero_id}, proyeccion(fields))
+
+    async def get_by_admin(self, admin_id: str, fields: Campos = None) -> Optional[dict]:
+        return await self.collection.find_one({"admin_id": admin_id}, proyeccion(fields))
+
+    async def owned_by(self, lavadero_id: str, admin_id: str) -> bool:
+        # Cubierta por el índice (admin_id, id): no lee el documento
+        return await self.collection.find_one(
+            {"admin_id": admin_id, "id": lavadero_id}, {"_id": 0, "id": 1}
+        ) is not None
+
+    async def name_exists(self, nombre: str) -> bool:
+        """Case-insensitive match on the whole name"""
+        filtro = {"nombre": {"$regex": f"^{re.escape(nombre)}$", "$options": "i"}}
+        return await self.collection.find_one(filtro, {"_id": 0, "id": 1}) is not None
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one(dict(doc))
+
+    async def update(self, lavadero_id: str, fields: dict, session=None):
+        await self.collection.update_one({"id": lavadero_id}, {"$set": fields}, session=session)
+
+    async def update_by_admin(self, admin_id: str, fields: dict, unset: Iterable[str] = ()):
+        update = {"$set": fields}
+        if unset:
+            update["$unset"] = {campo: "" for campo in unset}
+        await self.collection.update_one({"admin_id": admin_id}, update)
+
+    async def activate(self, lavadero_ids: List[str], fecha_vencimiento: datetime):
+        await self.collection.update_many(
+            {"id": {"$in": lavadero_ids}},
+            {"$set": {"estado_operativo": EstadoAdmin.ACTIVO, "fecha_vencimiento": fecha_vencimiento}}
+        )
+
+    async def deactivate_by_admin(self, admin_id: str):
+        await self.collection.update_many({"admin_id": admin_id}, {"$set": {"is_active": False}})
+
+    async def list_operativos(self, limit: int = 1000, fields: Campos = None) -> List[dict]:
+        return await self.collection.find(
+            {"estado_operativo": EstadoAdmin.ACTIVO, "is_active": True}, proyeccion(fields)
+        ).to_list(limit)
+
+    async def with_admin(self, limit: int = 1000, fields: Campos = None,
+                         admin_fields: Campos = None) -> List[dict]:
+        """Lavaderos joined with their ``admin`` user (lavaderos without one are skipped).
+
+        ``admin_fields`` only applies together with ``fields``.
+        """
+        if fields is None:
+            proyectar = {"_id": 0, "admin._id": 0}
+        else:
+            proyectar = {**proyeccion(fields),
+                         **proyeccion(admin_fields or ("id",), CALCULADOS_USUARIO, prefijo="admin.")}
+        return await self.collection.aggregate([
+            {"$lookup": {
+                "from": "users",
+                "localField": "admin_id",
+                "foreignField": "id",
+                "as": "admin"
+            }},
+            {"$unwind": "$admin"},
+            {"$project": proyectar}
+        ]).to_list(limit)
+
+    async def count_by_estado(self) -> Dict[str, int]:
+        return {
+            doc["_id"]: doc["total"]
+            async for doc in self.collection.aggregate([
+                {"$group": {"_id": "$estado_operativo", "total": {"$sum": 1}}}
+            ])
+        }
+
+    async def billable(self, batch_size: int = 5000) -> AsyncIterator[dict]:
+        """id and admin_id of every active or expired lavadero: both pay next month"""
+        cursor = self.collection.find(
+            {"estado_operativo": {"$in": [EstadoAdmin.ACTIVO, EstadoAdmin.VENCIDO]}, "is_active": True},
+            {"_id": 0, "id": 1, "admin_id": 1},
+            batch_size=batch_size
+        )
+        async for doc in cursor:
+            yield doc
+
+    async def expire(self, now: datetime) -> int:
+        """Move every active lavadero past its fecha_vencimiento to VENCIDO"""
+        result = await self.collection.update_many(
+            {"estado_operativo": EstadoAdmin.ACTIVO, "fecha_vencimiento": {"$lt": now}},
+            {"$set": {"estado_operativo": EstadoAdmin.VENCIDO}}
+        )
+        return result.modified_count
+
+    async def get_with_config(self, admin_id: Optional[str] = None, lavadero_id: Optional[str] = None,
+                              fields: Campos = None,
+                              config_fields: Campos = None) -> Optional[Tuple[dict, Optional[dict]]]:
+        """(lavadero, configuracion) by admin or by id; ``config_fields`` only applies together with ``fields``"""
+        # Lavadero y configuración en un solo round trip
+        match = {"admin_id": admin_id} if admin_id is not None else {"id": lavadero_id}
+        if fields is None:
+            proyectar = {"_id": 0, "configuracion._id": 0}
+        else:
+            proyectar = {**proyeccion(fields), **proyeccion(config_fields or ("id",), prefijo="configuracion.")}
+        docs = await self.collection.aggregate([
+            {"$match": match},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": self.configuraciones.name,
+                "localField": "id",
+                "foreignField": "lavadero_id",
+                "as": "configuracion"
+            }},
+            {"$project": proyectar}
+        ]).to_list(1)
+        if not docs:
+            return None
+        lavadero = docs[0]
+        configuraciones = lavadero.pop("configuracion")
+        return lavadero, configuraciones[0] if configuraciones else None
+
+    async def insert_config(self, doc: dict):
+        await self.configuraciones.insert_one(dict(doc))
+
+    async def upsert_config(self, lavadero_id: str, fields: dict, on_insert: dict) -> dict:
+        return await self.configuraciones.find_one_and_update(
+            {"lavadero_id": lavadero_id},
+            {"$setOnInsert": on_insert, "$set": fields},
+            projection=SIN_ID,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def toggle_apertura(self, lavadero_id: str) -> Optional[dict]:
+        # Toggle atómico en la base: no depende de un valor leído antes
+        return await self.configuraciones.find_one_and_update(
+            {"lavadero_id": lavadero_id},
+            [{"$set": {"esta_abierto": {"$not": [{"$ifNull": ["$esta_abierto", False]}]}}}],
+            projection=SIN_ID,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def delete_by_admin(self, admin_id: str) -> int:
+        return (await self.collection.delete_many({"admin_id": admin_id})).deleted_count
+
+    async def delete_config(self, lavadero_id: str) -> int:
+        return (await self.configuraciones.delete_many({"lavadero_id": lavadero_id})).deleted_count
+
+    async def delete_dias_no_laborales(self, lavadero_id: str) -> int:
+        return (await self.dias_no_laborales.delete_many({"lavadero_id": lavadero_id})).deleted_count
+
+    async def list_dias_no_laborales(self, lavadero_id: str, limit: int = 1000) -> List[dict]:
+        return await self.dias_no_laborales.find({"lavadero_id": lavadero_id}, SIN_ID).to_list(limit)
+
+    async def dia_no_laboral_exists(self, lavadero_id: str, fecha: datetime) -> bool:
+        # Cubierta por el índice (lavadero_id, fecha)
+        return await self.dias_no_laborales.find_one(
+            {"lavadero_id": lavadero_id, "fecha": fecha}, {"_id": 0, "fecha": 1}
+        ) is not None
+
+    async def insert_dia_no_laboral(self, doc: dict):
+        await self.dias_no_laborales.insert_one(dict(doc))
+
+    async def delete_dia_no_laboral(self, dia_id: str, lavadero_id: str) -> bool:
+        result = await self.dias_no_laborales.delete_one({"id": dia_id, "lavadero_id": lavadero_id})
+        return result.deleted_count > 0
+
+
+class MongoTurnoRepository:
+    def __init__(self, collection, comprobantes):
+        self.collection = collection
+        self.comprobantes = comprobantes  # comprobantes de pago de turnos
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one(dict(doc))
+
+    async def insert_comprobante(self, doc: dict):
+        await self.comprobantes.insert_one(dict(doc))
+
+    async def stats_lavadero(self, lavadero_id: str) -> Tuple[Dict[str, int], int]:
+        """(turnos per estado, pending receipts of those turnos) in a single query"""
+        resumen = await self.collection.aggregate([
+            {"$match": {"lavadero_id": lavadero_id}},
+            {"$project": {"_id": 0, "id": 1, "estado": 1}},
+            {"$facet": {
+                "por_estado": [{"$group": {"_id": "$estado", "total": {"$sum": 1}}}],
+                "comprobantes_pendientes": [
+                    {"$lookup": {
+                        "from": self.comprobantes.name,
+                        "localField": "id",
+                        "foreignField": "turno_id",
+                        "as": "comprobante"
+                    }},
+                    {"$unwind": "$comprobante"},
+                    {"$match": {"comprobante.estado": EstadoPago.PENDIENTE}},
+                    {"$count": "total"}
+                ]
+            }}
+        ]).to_list(1)
+        por_estado = {doc["_id"]: doc["total"] for doc in resumen[0]["por_estado"]}
+        pendientes = resumen[0]["comprobantes_pendientes"]
+        return por_estado, pendientes[0]["total"] if pendientes else 0
+
+    async def stats_cliente(self, cliente_id: str) -> Dict[str, int]:
+        return {
+            doc["_id"]: doc["total"]
+            async for doc in self.collection.aggregate([
+                {"$match": {"cliente_id": cliente_id}},
+                {"$group": {"_id": "$estado", "total": {"$sum": 1}}}
+            ])
+        }
+
+    async def delete_by_lavadero(self, lavadero_id: str) -> int:
+        return (await self.collection.delete_many({"lavadero_id": lavadero_id})).deleted_count
+
+
+class MongoPagoRepository:
+    # Un pago por admin y mes: de este índice depende que facturar dos veces no duplique
+    UNICO_POR_MES = [("admin_id", 1), ("mes_año", 1)]
+
+    def __init__(self, collection, comprobantes):
+        self.collection = collection
+        self.comprobantes = comprobantes
+
+    async def unique_month_index_ready(self) -> bool:
+        indices = await self.collection.index_information()
+        return any(
+            indice["key"] == self.UNICO_POR_MES and indice.get("unique") for indice in indices.values()
+        )
+
+    async def ensure_unique_month(self) -> int:
+        """Build the unique (admin_id, mes_año) index, merging duplicates first if needed.
+
+        Returns how many duplicate pagos were removed; raises if the index
+        still cannot be built.
+        """
+        try:
+            await self.collection.create_index(self.UNICO_POR_MES, unique=True)
+            return 0
+        except OperationFailure as e:
+            if e.code != DUPLICATE_KEY_ERROR:
+                raise
+        eliminados = await self.dedupe_months()
+        await self.collection.create_index(self.UNICO_POR_MES, unique=True)
+        return eliminados
+
+    async def dedupe_months(self) -> int:
+        """Keep one pago per (admin_id, mes_año) and repoint the comprobantes of the rest.
+
+        The one kept is the CONFIRMADO one if any, else the oldest.
+        """
+        eliminados = 0
+        grupos = self.collection.aggregate([
+            {"$group": {
+                "_id": {"admin_id": "$admin_id", "mes_año": "$mes_año"},
+                "pagos": {"$push": {"id": "$id", "estado": "$estado", "created_at": "$created_at"}},
+                "total": {"$sum": 1}
+            }},
+            {"$match": {"total": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        async for grupo in grupos:
+            pagos = sorted(grupo["pagos"], key=lambda p: (p["estado"] != EstadoPago.CONFIRMADO,
+                                                          p.get("created_at") or datetime.min))
+            conservado, sobrantes = pagos[0]["id"], [p["id"] for p in pagos[1:]]
+            await self.comprobantes.update_many(
+                {"pago_mensualidad_id": {"$in": sobrantes}}, {"$set": {"pago_mensualidad_id": conservado}}
+            )
+            eliminados += (await self.collection.delete_many({"id": {"$in": sobrantes}})).deleted_count
+            logger.warning(f"Pagos duplicados de {grupo['_id']}: se conserva {conservado}, se borran {sobrantes}")
+        return eliminados
+
+    async def get(self, pago_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": pago_id}, SIN_ID)
+
+    async def get_pendiente(self, admin_id: str, fields: Campos = None) -> Optional[dict]:
+        """Oldest pending pago: a VENCIDO lavadero keeps being billed, so there can be several"""
+        return await self.collection.find_one(
+            {"admin_id": admin_id, "estado": EstadoPago.PENDIENTE}, proyeccion(fields), sort=[("mes_año", 1)]
+        )
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one(dict(doc))
+
+    async def insert_new(self, pagos: List[dict]) -> int:
+        """Insert pagos skipping the (admin_id, mes_año) that already exist; returns how many were skipped"""
+        try:
+            await self.collection.insert_many([dict(p) for p in pagos], ordered=False)
+            return 0
+        except BulkWriteError as e:
+            errores = e.details.get("writeErrors", [])
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in errores):
+                raise
+            return len(errores)
+
+    async def confirm(self, pago_id: str, session=None, only_pending: bool = False) -> Optional[dict]:
+        """Confirm a pago; returns its lavadero_id without a second read.
+
+        With ``only_pending`` a pago that is no longer PENDIENTE is left as is
+        and None is returned.
+        """
+        filtro = {"id": pago_id}
+        if only_pending:
+            filtro["estado"] = EstadoPago.PENDIENTE
+        return await self.collection.find_one_and_update(
+            filtro,
+            {"$set": {"estado": EstadoPago.CONFIRMADO}},
+            projection={"_id": 0, "lavadero_id": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+    async def confirm_many(self, pago_ids: List[str]):
+        await self.collection.update_many({"id": {"$in": pago_ids}}, {"$set": {"estado": EstadoPago.CONFIRMADO}})
+
+    async def lavaderos_por_pago(self, pago_ids: List[str]) -> Dict[str, str]:
+        cursor = self.collection.find({"id": {"$in": pago_ids}}, {"_id": 0, "id": 1, "lavadero_id": 1})
+        return {doc["id"]: doc["lavadero_id"] async for doc in cursor}
+
+    async def reopen_month(self, pago: dict) -> Optional[str]:
+        """Leave the pago of ``pago["mes_año"]`` PENDIENTE, creating it if missing.
+
+        Returns "creado", "reabierto" or None if it was already pending.
+        """
+        nuevo = {k: v for k, v in pago.items() if k != "estado"}
+        result = await self.collection.update_one(
+            {"admin_id": pago["admin_id"], "mes_año": pago["mes_año"]},
+            {"$set": {"estado": EstadoPago.PENDIENTE}, "$setOnInsert": nuevo},
+            upsert=True
+        )
+        if result.upserted_id is not None:
+            return "creado"
+        return "reabierto" if result.modified_count else None
+
+    async def ensure_month(self, pago: dict):
+        """Insert the pago unless its admin already has one for that month"""
+        await self.collection.update_one(
+            {"admin_id": pago["admin_id"], "mes_año": pago["mes_año"]},
+            {"$setOnInsert": dict(pago)},
+            upsert=True
+        )
+
+    async def delete_by_admin(self, admin_id: str) -> int:
+        return (await self.collection.delete_many({"admin_id": admin_id})).deleted_count
+
+
+class MongoComprobanteRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, comprobante_id: str, session=None) -> Optional[dict]:
+        return await self.collection.find_one({"id": comprobante_id}, SIN_ID, session=session)
+
+    async def get_pendiente_de_pago(self, pago_id: str) -> Optional[dict]:
+        return await self.collection.find_one(
+            {"pago_mensualidad_id": pago_id, "estado": EstadoPago.PENDIENTE}, SIN_ID
+        )
+
+    async def get_many(self, comprobante_ids: List[str], fields: Campos = None) -> Dict[str, dict]:
+        """Comprobantes by id; ``id`` is always read, to key the result"""
+        if fields is not None:
+            fields = ("id", *fields)
+        cursor = self.collection.find({"id": {"$in": comprobante_ids}}, proyeccion(fields))
+        return {doc["id"]: doc async for doc in cursor}
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one(dict(doc))
+
+    async def approve(self, comprobante_id: str, fecha: datetime, session=None) -> Optional[dict]:
+        """Confirm the comprobante if it is still PENDIENTE; returns it after the update or None"""
+        return await self.collection.find_one_and_update(
+            {"id": comprobante_id, "estado": EstadoPago.PENDIENTE},
+            {"$set": {
+                "estado": EstadoPago.CONFIRMADO,
+                "fecha_revision": fecha,
+                "comentario_superadmin": "Pago confirmado"
+            }},
+            projection=SIN_ID,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+    async def reject(self, comprobante_id: str, comentario: str, fecha: datetime):
+        await self.collection.update_one(
+            {"id": comprobante_id},
+            {"$set": {"estado": EstadoPago.RECHAZADO, "fecha_revision": fecha, "comentario_superadmin": comentario}}
+        )
+
+    async def apply_decisions(self, aprobados: List[str], rechazados: Dict[str, str], fecha: datetime,
+                              revision_id: str) -> List[str]:
+        """Approve and reject pending comprobantes in one bulk write.
+
+        Each update only matches a comprobante that is still PENDIENTE and tags
+        it with ``revision_id``; returns the ids this revision actually changed.
+        """
+        ops = [
+            UpdateOne({"id": comprobante_id, "estado": EstadoPago.PENDIENTE}, {"$set": {
+                "estado": EstadoPago.CONFIRMADO, "fecha_revision": fecha, "comentario_superadmin": "Pago confirmado",
+                "revision_id": revision_id
+            }})
+            for comprobante_id in aprobados
+        ] + [
+            UpdateOne({"id": comprobante_id, "estado": EstadoPago.PENDIENTE}, {"$set": {
+                "estado": EstadoPago.RECHAZADO, "fecha_revision": fecha, "comentario_superadmin": comentario,
+                "revision_id": revision_id
+            }})
+            for comprobante_id, comentario in rechazados.items()
+        ]
+        if not ops:
+            return []
+        resultado = await self.collection.bulk_write(ops, ordered=False)
+        if resultado.modified_count == len(ops):
+            return aprobados + list(rechazados)
+        # Alguno lo procesó otra revisión entre la lectura y la escritura: ver cuáles son nuestros
+        cursor = self.collection.find({"revision_id": revision_id}, {"_id": 0, "id": 1})
+        return [doc["id"] async for doc in cursor]
+
+    async def count_pendientes(self) -> int:
+        return await self.collection.count_documents({"estado": EstadoPago.PENDIENTE})
+
+    async def pendientes_con_detalle(self, limit: int = 1000, fields: Campos = None) -> List[dict]:
+        """Pending comprobantes with their ``pago``, ``admin`` and ``lavadero``.
+
+        With ``fields`` the joined documents only bring the DETALLE_PENDIENTE fields.
+        """
+        if fields is None:
+            proyectar = {"_id": 0, "pago._id": 0, "admin._id": 0, "lavadero._id": 0}
+        else:
+            proyectar = proyeccion(fields)
+            for subdocumento, campos in DETALLE_PENDIENTE.items():
+                proyectar.update(proyeccion(campos, prefijo=f"{subdocumento}."))
+        return await self.collection.aggregate([
+            {"$match": {"estado": EstadoPago.PENDIENTE}},
+            {"$lookup": {
+                "from": "pagos_mensualidad",
+                "localField": "pago_mensualidad_id",
+                "foreignField": "id",
+                "as": "pago"
+            }},
+            {"$unwind": "$pago"},
+            {"$lookup": {
+                "from": "users",
+                "localField": "admin_id",
+                "foreignField": "id",
+                "as": "admin"
+            }},
+            {"$unwind": "$admin"},
+            {"$lookup": {
+                "from": "lavaderos",
+                "localField": "pago.lavadero_id",
+                "foreignField": "id",
+                "as": "lavadero"
+            }},
+            {"$unwind": "$lavadero"},
+            {"$project": proyectar}
+        ]).to_list(limit)
+
+    async def historial(self, estado: Optional[str] = None, admin_id: Optional[str] = None,
+                        limit: int = 50, offset: int = 0) -> Tuple[List[dict], int, Dict[str, int]]:
+        """(page of the history, total matching, count per estado of every comprobante)"""
+        match_filters = {}
+        if estado:
+            match_filters["estado"] = estado
+        if admin_id:
+            match_filters["admin_id"] = admin_id
+
+        pipeline = [
+            {"$match": match_filters},
+            {"$lookup": {
+                "from": "pagos_mensualidad",
+                "localField": "pago_mensualidad_id",
+                "foreignField": "id",
+                "as": "pago_info"
+            }},
+            {"$unwind": "$pago_info"},
+            {"$lookup": {
+                "from": "users",
+                "localField": "admin_id",
+                "foreignField": "id",
+                "as": "admin_info"
+            }},
+            {"$unwind": "$admin_info"},
+            {"$lookup": {
+                "from": "lavaderos",
+                "localField": "pago_info.lavadero_id",
+                "foreignField": "id",
+                "as": "lavadero_info"
+            }},
+            {"$unwind": "$lavadero_info"},
+            {"$project": {
+                "_id": 0,
+                "comprobante_id": "$id",
+                "admin_id": "$admin_id",
+                "admin_nombre": "$admin_info.nombre",
+                "admin_email": "$admin_info.email",
+                "lavadero_nombre": "$lavadero_info.nombre",
+                "monto": "$pago_info.monto",
+                "mes_año": "$pago_info.mes_año",
+                "imagen_url": 1,
+                "created_at": 1,
+                "estado": 1,
+                "comentario_superadmin": 1,
+                "fecha_procesamiento": {"$ifNull": ["$fecha_procesamiento", None]}
+            }},
+            {"$sort": {"created_at": -1}},
+            {"$skip": offset},
+            {"$limit": limit}
+        ]
+        comprobantes = await self.collection.aggregate(pipeline).to_list(limit)
+
+        count_result = await self.collection.aggregate([
+            {"$match": match_filters},
+            {"$count": "total"}
+        ]).to_list(1)
+        total = count_result[0]["total"] if count_result else 0
+
+        por_estado = {
+            doc["_id"]: doc["count"]
+            async for doc in self.collection.aggregate([{"$group": {"_id": "$estado", "count": {"$sum": 1}}}])
+        }
+        return comprobantes, total, por_estado
+
+    async def del_admin(self, admin_id: str, limit: int = 100, fields: Campos = None,
+                        pago_fields: Campos = None) -> List[dict]:
+        """Comprobantes of an admin with their ``pago``, newest first.
+
+        ``pago_fields`` only applies together with ``fields``.
+        """
+        if fields is None:
+            proyectar = {"_id": 0, "pago._id": 0}
+        else:
+            proyectar = {**proyeccion(fields), **proyeccion(pago_fields or ("id",), prefijo="pago.")}
+        return await self.collection.aggregate([
+            {"$match": {"admin_id": admin_id}},
+            {"$lookup": {
+                "from": "pagos_mensualidad",
+                "localField": "pago_mensualidad_id",
+                "foreignField": "id",
+                "as": "pago"
+            }},
+            {"$unwind": "$pago"},
+            {"$sort": {"created_at": -1}},
+            {"$project": proyectar}
+        ]).to_list(limit)
+
+    async def phashes(self, since: Optional[datetime] = None) -> AsyncIterator[Tuple[str, str, datetime]]:
+        """``(id, phash, created_at)`` of the comprobantes with a hash, created after ``since`` if given"""
+        filtro = {"phash": {"$ne": None}}
+        if since is not None:
+            filtro["created_at"] = {"$gt": since}
+        cursor = self.collection.find(filtro, {"_id": 0, "id": 1, "phash": 1, "created_at": 1})
+        async for doc in cursor:
+            yield doc["id"], doc["phash"], doc["created_at"]
+
+    async def delete_by_admin(self, admin_id: str) -> int:
+        return (await self.collection.delete_many({"admin_id": admin_id})).deleted_count
+
+
+class MongoPurgaRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one(dict(doc))
+
+    async def get(self, purga_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": purga_id}, SIN_ID)
+
+    async def update(self, purga_id: str, fields: dict, inc: Optional[dict] = None,
+                     owner: Optional[str] = None) -> bool:
+        """Update a purge; with ``owner``, only while that worker still holds it"""
+        filtro = {"id": purga_id}
+        if owner is not None:
+            filtro["owner"] = owner
+        update = {"$set": fields}
+        if inc:
+            update["$inc"] = inc
+        resultado = await self.collection.update_one(filtro, update)
+        return resultado.matched_count == 1
+
+    async def interrupted(self, estados: Iterable[str], before: datetime) -> List[str]:
+        """Ids of purges in ``estados`` whose heartbeat is older than ``before``"""
+        cursor = self.collection.find(
+            {"estado": {"$in": list(estados)}, "heartbeat_at": {"$not": {"$gte": before}}}, {"_id": 0, "id": 1}
+        )
+        return [doc["id"] async for doc in cursor]
+
+    async def claim(self, purga_id: str, owner: str, estados: Iterable[str], before: datetime,
+                    ahora: datetime) -> Optional[dict]:
+        """Take over a purge whose heartbeat is older than ``before``; None if another worker holds it"""
+        return await self.collection.find_one_and_update(
+            {"id": purga_id, "estado": {"$in": list(estados)}, "heartbeat_at": {"$not": {"$gte": before}}},
+            {"$set": {"owner": owner, "heartbeat_at": ahora}},
+            projection=SIN_ID,
+            return_document=ReturnDocument.AFTER
+        )
+
+
+class MongoPerfilRepository:
+    def __init__(self, collection):
+        self.collection = collection  # perfiles capturados con X-Profile-Request
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one(dict(doc))
+
+    async def list(self, limit: int = 100) -> List[dict]:
+        """Newest first, without the speedscope payload"""
+        return await self.collection.find(
+            {}, {"_id": 0, "speedscope": 0}
+        ).sort("created_at", -1).to_list(limit)
+
+    async def get_speedscope(self, perfil_id: str) -> Optional[str]:
+        perfil = await self.collection.find_one({"id": perfil_id}, {"_id": 0, "speedscope": 1})
+        return perfil["speedscope"] if perfil else None
+
+
+class MongoRepositories:
+    def __init__(self, client, db):
+        self.client = client
+        self.users = MongoUserRepository(db.users, db.google_sessions, db.temp_credentials)
+        self.lavaderos = MongoLavaderoRepository(db.lavaderos, db.configuracion_lavadero, db.dias_no_laborales)
+        self.turnos = MongoTurnoRepository(db.turnos, db.comprobantes_pago)
+        self.pagos = MongoPagoRepository(db.pagos_mensualidad, db.comprobantes_pago_mensualidad)
+        self.comprobantes = MongoComprobanteRepository(db.comprobantes_pago_mensualidad)
+        self.purgas = MongoPurgaRepository(db.purgas)
+        self.perfiles = MongoPerfilRepository(db.perfiles)
+        # Revocaciones de tokens compartidas entre workers (ver TokenRevocationRegistry)
+        self.token_revocations = db.token_revocations
+        self._transacciones_soportadas: Optional[bool] = None
+
+    async def transactions_supported(self) -> bool:
+        """Multi-document transactions need a replica set or mongos"""
+        if self._transacciones_soportadas is None:
+            hello = await self.client.admin.command("hello")
+            self._transacciones_soportadas = "setName" in hello or hello.get("msg") == "isdbgrid"
+            if not self._transacciones_soportadas:
+                logger.warning("MongoDB standalone: las operaciones multi-documento se ejecutan sin transacción")
+        return self._transacciones_soportadas
+
+    async def run_in_transaction(self, operacion):
+        """Run ``operacion(session)`` inside a multi-document transaction.
+
+        with_transaction retries on transient errors, so ``operacion`` must be
+        idempotent. On a standalone server it runs with ``session=None``.
+        """
+        if not await self.transactions_supported():
+            return await operacion(None)
+        async with await self.client.start_session() as session:
+            return await session.with_transaction(operacion)
+
+
+# ---------------------------------------------------------------- Memoria
+
+def _bson(valor):
+    """Copy a value the way a MongoDB round trip returns it"""
+    if isinstance(valor, dict):
+        return {k: _bson(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_bson(v) for v in valor]
+    if isinstance(valor, datetime):
+        if valor.tzinfo is not None:
+            valor = valor.astimezone(timezone.utc).replace(tzinfo=None)
+        return valor.replace(microsecond=valor.microsecond // 1000 * 1000)
+    return valor
+
+
+def _proyectar(doc: Optional[dict], fields: Campos = None, calculados: Optional[dict] = None) -> Optional[dict]:
+    """Copy ``doc`` the way a find() with ``proyeccion(fields)`` returns it"""
+    if doc is None:
+        return None
+    if fields is None:
+        return _bson(doc)
+    calculados = calculados or {}
+    return {
+        campo: calculados[campo](doc) if campo in calculados else _bson(doc[campo])
+        for campo in fields if campo in calculados or campo in doc
+    }
+
+
+_CALCULADOS_USUARIO_MEMORIA = {"has_password": lambda doc: doc.get("password_hash") is not None}
+
+
+def _newest_first(docs: Iterable[dict]) -> List[dict]:
+    return sorted(docs, key=lambda d: d.get("created_at") or datetime.min, reverse=True)
+
+
+class _MemoryCollection:
+    """Documents by ``id`` in insertion order, with optional unique keys"""
+
+    def __init__(self, unique: Tuple[str, ...] = ()):
+        self.docs: Dict[str, dict] = {}
+        self.unique = unique
+
+    def insert(self, doc: dict):
+        if doc["id"] in self.docs:
+            raise DuplicateKeyError(f"id duplicado: {doc['id']}")
+        if self.unique:
+            clave = tuple(doc.get(k) for k in self.unique)
+            if any(tuple(d.get(k) for k in self.unique) == clave for d in self.docs.values()):
+                raise DuplicateKeyError(f"{self.unique} duplicado: {clave}")
+        self.docs[doc["id"]] = _bson(doc)
+
+    def find(self, **campos) -> List[dict]:
+        return [d for d in self.docs.values() if all(d.get(k) == v for k, v in campos.items())]
+
+    def find_one(self, **campos) -> Optional[dict]:
+        encontrados = self.find(**campos)
+        return encontrados[0] if encontrados else None
+
+    def delete(self, **campos) -> int:
+        borrar = [d["id"] for d in self.find(**campos)]
+        for doc_id in borrar:
+            del self.docs[doc_id]
+        return len(borrar)
+
+
+class MemoryUserRepository:
+    def __init__(self):
+        self.data = _MemoryCollection()
+        self.sesiones = _MemoryCollection()
+        self.credenciales: Dict[str, dict] = {}  # por admin_email
+        self.lavaderos: Optional["MemoryLavaderoRepository"] = None
+
+    def _activo(self, doc: Optional[dict], fields: Campos = None) -> Optional[dict]:
+        return self._proyectar(doc, fields) if doc is not None and "purga_id" not in doc else None
+
+    @staticmethod
+    def _proyectar(doc: Optional[dict], fields: Campos = None) -> Optional[dict]:
+        return _proyectar(doc, fields, _CALCULADOS_USUARIO_MEMORIA)
+
+    async def get_by_email(self, email: str, fields: Campos = None) -> Optional[dict]:
+        return next((self._activo(d, fields) for d in self.data.find(email=email) if "purga_id" not in d), None)
+
+    async def get_by_id(self, user_id: str, fields: Campos = None) -> Optional[dict]:
+        return self._activo(self.data.docs.get(user_id), fields)
+
+    async def get(self, user_id: str, fields: Campos = None) -> Optional[dict]:
+        return self._proyectar(self.data.docs.get(user_id), fields)
+
+    async def get_with_rol(self, user_id: str, rol: str, exclude_purging: bool = False,
+                           fields: Campos = None) -> Optional[dict]:
+        doc = self.data.docs.get(user_id)
+        if doc is None or doc.get("rol") != rol or (exclude_purging and "purga_id" in doc):
+            return None
+        return self._proyectar(doc, fields)
+
+    async def email_in_use(self, email: str, exclude_id: Optional[str] = None) -> bool:
+        return any(d["id"] != exclude_id for d in self.data.find(email=email))
+
+    async def insert(self, doc: dict):
+        self.data.insert(doc)
+
+    async def update(self, user_id: str, fields: dict) -> bool:
+        doc = self.data.docs.get(user_id)
+        if doc is None:
+            return False
+        doc.update(_bson(fields))
+        return True
+
+    async def delete(self, user_id: str) -> bool:
+        return self.data.delete(id=user_id) > 0
+
+    async def mark_purging(self, user_id: str, purga_id: str):
+        await self.update(user_id, {"is_active": False, "purga_id": purga_id})
+
+    async def bump_token_version(self, user_id: str) -> Optional[int]:
+        doc = self.data.docs.get(user_id)
+        if doc is None:
+            return None
+        doc["token_version"] = doc.get("token_version", 0) + 1
+        return doc["token_version"]
+
+    async def delete_sessions(self, user_id: str) -> int:
+        return self.sesiones.delete(user_id=user_id)
+
+    async def session_user_id(self, session_token: str, now: datetime) -> Optional[str]:
+        sesion = self.sesiones.find_one(session_token=session_token)
+        return sesion["user_id"] if sesion and sesion["expires_at"] > _bson(now) else None
+
+    async def upsert_session(self, doc: dict):
+        sesion = self.sesiones.find_one(session_token=doc["session_token"])
+        if sesion is None:
+            self.sesiones.insert(doc)
+        else:
+            sesion.update(_bson({"user_id": doc["user_id"], "expires_at": doc["expires_at"]}))
+
+    async def delete_session(self, session_token: str):
+        self.sesiones.delete(session_token=session_token)
+
+    async def insert_temp_credential(self, email: str, password: str, created_at: datetime):
+        self.credenciales[email] = _bson({"admin_email": email, "password": password, "created_at": created_at})
+
+    async def temp_credentials(self, emails: List[str]) -> Dict[str, str]:
+        return {email: self.credenciales[email]["password"] for email in emails if email in self.credenciales}
+
+    async def list(self, rol: Optional[str] = None, limit: int = 1000, fields: Campos = None) -> List[dict]:
+        docs = self.data.find(rol=rol) if rol else list(self.data.docs.values())
+        return [self._proyectar(d, fields) for d in docs[:limit]]
+
+    async def with_lavadero(self, rol: str, limit: int = 1000, fields: Campos = None,
+                            lavadero_fields: Campos = None) -> List[dict]:
+        if fields is not None:
+            lavadero_fields = lavadero_fields or ("id",)
+        docs = [d for d in self.data.find(rol=rol) if "purga_id" not in d]
+        return [
+            {**self._proyectar(d, fields),
+             "lavadero": [_proyectar(lav, lavadero_fields) for lav in self.lavaderos.data.find(admin_id=d["id"])]}
+            for d in _newest_first(docs)[:limit]
+        ]
+
+
+class MemoryLavaderoRepository:
+    def __init__(self):
+        self.data = _MemoryCollection()
+        self.configuraciones = _MemoryCollection()
+        self.dias_no_laborales = _MemoryCollection()
+        self.users: Optional[MemoryUserRepository] = None
+
+    async def get(self, lavadero_id: str, fields: Campos = None) -> Optional[dict]:
+        return _proyectar(self.data.docs.get(lavadero_id), fields)
+
+    async def get_by_admin(self, admin_id: str, fields: Campos = None) -> Optional[dict]:
+        return _proyectar(self.data.find_one(admin_id=admin_id), fields)
+
+    async def owned_by(self, lavadero_id: str, admin_id: str) -> bool:
+        return self.data.find_one(admin_id=admin_id, id=lavadero_id) is not None
+
+    async def name_exists(self, nombre: str) -> bool:
+        return any(d.get("nombre", "").lower() == nombre.lower() for d in self.data.docs.values())
+
+    async def insert(self, doc: dict):
+        self.data.insert(doc)
+
+    async def update(self, lavadero_id: str, fields: dict, session=None):
+        if lavadero_id in self.data.docs:
+            self.data.docs[lavadero_id].update(_bson(fields))
+
+    async def update_by_admin(self, admin_id: str, fields: dict, unset: Iterable[str] = ()):
+        doc = self.data.find_one(admin_id=admin_id)
+        if doc is not None:
+            doc.update(_bson(fields))
+            for campo in unset:
+                doc.pop(campo, None)
+
+    async def activate(self, lavadero_ids: List[str], fecha_vencimiento: datetime):
+        for lavadero_id in lavadero_ids:
+            await self.update(lavadero_id, {"estado_operativo": EstadoAdmin.ACTIVO,
+                                            "fecha_vencimiento": fecha_vencimiento})
+
+    async def deactivate_by_admin(self, admin_id: str):
+        for doc in self.data.find(admin_id=admin_id):
+            doc["is_active"] = False
+
+    async def list_operativos(self, limit: int = 1000, fields: Campos = None) -> List[dict]:
+        operativos = self.data.find(estado_operativo=EstadoAdmin.ACTIVO, is_active=True)
+        return [_proyectar(d, fields) for d in operativos[:limit]]
+
+    async def with_admin(self, limit: int = 1000, fields: Campos = None,
+                         admin_fields: Campos = None) -> List[dict]:
+        if fields is not None:
+            admin_fields = admin_fields or ("id",)
+        result = []
+        for doc in self.data.docs.values():
+            # $unwind: un documento por admin coincidente, ninguno si no hay
+            for admin in self.users.data.find(id=doc["admin_id"]):
+                result.append({**_proyectar(doc, fields),
+                               "admin": _proyectar(admin, admin_fields, _CALCULADOS_USUARIO_MEMORIA)})
+        return result[:limit]
+
+    async def count_by_estado(self) -> Dict[str, int]:
+        return dict(Counter(d.get("estado_operativo") for d in self.data.docs.values()))
+
+    async def billable(self, batch_size: int = 5000) -> AsyncIterator[dict]:
+        for doc in list(self.data.docs.values()):
+            if doc.get("estado_operativo") in (EstadoAdmin.ACTIVO, EstadoAdmin.VENCIDO) and doc.get("is_active"):
+                yield {"id": doc["id"], "admin_id": doc["admin_id"]}
+
+    async def expire(self, now: datetime) -> int:
+        now = _bson(now)
+        vencidos = [
+            d for d in self.data.find(estado_operativo=EstadoAdmin.ACTIVO)
+            if d.get("fecha_vencimiento") is not None and d["fecha_vencimiento"] < now
+        ]
+        for doc in vencidos:
+            doc["estado_operativo"] = EstadoAdmin.VENCIDO
+        return len(vencidos)
+
+    async def get_with_config(self, admin_id: Optional[str] = None, lavadero_id: Optional[str] = None,
+                              fields: Campos = None,
+                              config_fields: Campos = None) -> Optional[Tuple[dict, Optional[dict]]]:
+        if fields is not None:
+            config_fields = config_fields or ("id",)
+        if admin_id is not None:
+            lavadero = self.data.find_one(admin_id=admin_id)
+        else:
+            lavadero = self.data.docs.get(lavadero_id)
+        if lavadero is None:
+            return None
+        config = self.configuraciones.find_one(lavadero_id=lavadero["id"])
+        return _proyectar(lavadero, fields), _proyectar(config, config_fields)
+
+    async def insert_config(self, doc: dict):
+        self.configuraciones.insert(doc)
+
+    async def upsert_config(self, lavadero_id: str, fields: dict, on_insert: dict) -> dict:
+        config = self.configuraciones.find_one(lavadero_id=lavadero_id)
+        if config is None:
+            self.configuraciones.insert({**on_insert, "lavadero_id": lavadero_id})
+            config = self.configuraciones.find_one(lavadero_id=lavadero_id)
+        config.update(_bson(fields))
+        return _bson(config)
+
+    async def toggle_apertura(self, lavadero_id: str) -> Optional[dict]:
+        config = self.configuraciones.find_one(lavadero_id=lavadero_id)
+        if config is None:
+            return None
+        config["esta_abierto"] = not config.get("esta_abierto", False)
+        return _bson(config)
+
+    async def delete_by_admin(self, admin_id: str) -> int:
+        return self.data.delete(admin_id=admin_id)
+
+    async def delete_config(self, lavadero_id: str) -> int:
+        return self.configuraciones.delete(lavadero_id=lavadero_id)
+
+    async def delete_dias_no_laborales(self, lavadero_id: str) -> int:
+        return self.dias_no_laborales.delete(lavadero_id=lavadero_id)
+
+    async def list_dias_no_laborales(self, lavadero_id: str, limit: int = 1000) -> List[dict]:
+        return [_bson(d) for d in self.dias_no_laborales.find(lavadero_id=lavadero_id)[:limit]]
+
+    async def dia_no_laboral_exists(self, lavadero_id: str, fecha: datetime) -> bool:
+        return self.dias_no_laborales.find_one(lavadero_id=lavadero_id, fecha=_bson(fecha)) is not None
+
+    async def insert_dia_no_laboral(self, doc: dict):
+        self.dias_no_laborales.insert(doc)
+
+    async def delete_dia_no_laboral(self, dia_id: str, lavadero_id: str) -> bool:
+        return self.dias_no_laborales.delete(id=dia_id, lavadero_id=lavadero_id) > 0
+
+
+class MemoryTurnoRepository:
+    def __init__(self):
+        self.data = _MemoryCollection()
+        self.comprobantes = _MemoryCollection()
+
+    async def insert(self, doc: dict):
+        self.data.insert(doc)
+
+    async def insert_comprobante(self, doc: dict):
+        self.comprobantes.insert(doc)
+
+    async def stats_lavadero(self, lavadero_id: str) -> Tuple[Dict[str, int], int]:
+        turnos = self.data.find(lavadero_id=lavadero_id)
+        pendientes = sum(
+            len(self.comprobantes.find(turno_id=t["id"], estado=EstadoPago.PENDIENTE)) for t in turnos
+        )
+        return dict(Counter(t.get("estado") for t in turnos)), pendientes
+
+    async def stats_cliente(self, cliente_id: str) -> Dict[str, int]:
+        return dict(Counter(t.get("estado") for t in self.data.find(cliente_id=cliente_id)))
+
+    async def delete_by_lavadero(self, lavadero_id: str) -> int:
+        return self.data.delete(lavadero_id=lavadero_id)
+
+
+class MemoryPagoRepository:
+    def __init__(self):
+        # Un pago por admin y mes, como el índice único de Mongo
+        self.data = _MemoryCollection(unique=("admin_id", "mes_año"))
+
+    async def get(self, pago_id: str) -> Optional[dict]:
+        doc = self.data.docs.get(pago_id)
+        return _bson(doc) if doc is not None else None
+
+    async def unique_month_index_ready(self) -> bool:
+        return True
+
+    async def ensure_unique_month(self) -> int:
+        return 0
+
+    async def get_pendiente(self, admin_id: str, fields: Campos = None) -> Optional[dict]:
+        pendientes = self.data.find(admin_id=admin_id, estado=EstadoPago.PENDIENTE)
+        return _proyectar(min(pendientes, key=lambda p: p["mes_año"]), fields) if pendientes else None
+
+    async def insert(self, doc: dict):
+        self.data.insert(doc)
+
+    async def insert_new(self, pagos: List[dict]) -> int:
+        omitidos = 0
+        for pago in pagos:
+            try:
+                self.data.insert(pago)
+            except DuplicateKeyError:
+                omitidos += 1
+        return omitidos
+
+    async def confirm(self, pago_id: str, session=None, only_pending: bool = False) -> Optional[dict]:
+        doc = self.data.docs.get(pago_id)
+        if doc is None or (only_pending and doc.get("estado") != EstadoPago.PENDIENTE):
+            return None
+        doc["estado"] = EstadoPago.CONFIRMADO
+        return {"lavadero_id": doc["lavadero_id"]}
+
+    async def confirm_many(self, pago_ids: List[str]):
+        for pago_id in pago_ids:
+            await self.confirm(pago_id)
+
+    async def lavaderos_por_pago(self, pago_ids: List[str]) -> Dict[str, str]:
+        return {i: self.data.docs[i]["lavadero_id"] for i in pago_ids if i in self.data.docs}
+
+    async def reopen_month(self, pago: dict) -> Optional[str]:
+        actual = self.data.find_one(admin_id=pago["admin_id"], mes_año=pago["mes_año"])
+        if actual is None:
+            self.data.insert({**pago, "estado": EstadoPago.PENDIENTE})
+            return "creado"
+        if actual.get("estado") == EstadoPago.PENDIENTE:
+            return None
+        actual["estado"] = EstadoPago.PENDIENTE
+        return "reabierto"
+
+    async def ensure_month(self, pago: dict):
+        if self.data.find_one(admin_id=pago["admin_id"], mes_año=pago["mes_año"]) is None:
+            self.data.insert(pago)
+
+    async def delete_by_admin(self, admin_id: str) -> int:
+        return self.data.delete(admin_id=admin_id)
+
+
+class MemoryComprobanteRepository:
+    def __init__(self):
+        self.data = _MemoryCollection()
+        self.pagos: Optional[MemoryPagoRepository] = None
+        self.users: Optional[MemoryUserRepository] = None
+        self.lavaderos: Optional[MemoryLavaderoRepository] = None
+
+    async def get(self, comprobante_id: str, session=None) -> Optional[dict]:
+        doc = self.data.docs.get(comprobante_id)
+        return _bson(doc) if doc is not None else None
+
+    async def get_pendiente_de_pago(self, pago_id: str) -> Optional[dict]:
+        return _bson(self.data.find_one(pago_mensualidad_id=pago_id, estado=EstadoPago.PENDIENTE))
+
+    async def get_many(self, comprobante_ids: List[str], fields: Campos = None) -> Dict[str, dict]:
+        if fields is not None:
+            fields = ("id", *fields)
+        return {i: _proyectar(self.data.docs[i], fields) for i in comprobante_ids if i in self.data.docs}
+
+    async def insert(self, doc: dict):
+        self.data.insert(doc)
+
+    async def approve(self, comprobante_id: str, fecha: datetime, session=None) -> Optional[dict]:
+        doc = self.data.docs.get(comprobante_id)
+        if doc is None or doc.get("estado") != EstadoPago.PENDIENTE:
+            return None
+        doc.update(_bson({"estado": EstadoPago.CONFIRMADO, "fecha_revision": fecha,
+                          "comentario_superadmin": "Pago confirmado"}))
+        return _bson(doc)
+
+    async def reject(self, comprobante_id: str, comentario: str, fecha: datetime):
+        doc = self.data.docs.get(comprobante_id)
+        if doc is not None:
+            doc.update(_bson({"estado": EstadoPago.RECHAZADO, "fecha_revision": fecha,
+                              "comentario_superadmin": comentario}))
+
+    async def apply_decisions(self, aprobados: List[str], rechazados: Dict[str, str], fecha: datetime,
+                              revision_id: str) -> List[str]:
+        decisiones = [(i, EstadoPago.CONFIRMADO, "Pago confirmado") for i in aprobados]
+        decisiones += [(i, EstadoPago.RECHAZADO, comentario) for i, comentario in rechazados.items()]
+        aplicados = []
+        for comprobante_id, estado, comentario in decisiones:
+            doc = self.data.docs.get(comprobante_id)
+            if doc is not None and doc.get("estado") == EstadoPago.PENDIENTE:
+                doc.update(_bson({"estado": estado, "fecha_revision": fecha, "comentario_superadmin": comentario,
+                                  "revision_id": revision_id}))
+                aplicados.append(comprobante_id)
+        return aplicados
+
+    async def count_pendientes(self) -> int:
+        return len(self.data.find(estado=EstadoPago.PENDIENTE))
+
+    def _con_detalle(self, docs: Iterable[dict]) -> List[dict]:
+        # Mismo efecto que los $lookup + $unwind: se descartan los que no tienen pago, admin o lavadero
+        result = []
+        for doc in docs:
+            pago = self.pagos.data.docs.get(doc.get("pago_mensualidad_id"))
+            admin = self.users.data.docs.get(doc.get("admin_id"))
+            lavadero = self.lavaderos.data.docs.get(pago.get("lavadero_id")) if pago else None
+            if pago and admin and lavadero:
+                result.append((doc, pago, admin, lavadero))
+        return result
+
+    async def pendientes_con_detalle(self, limit: int = 1000, fields: Campos = None) -> List[dict]:
+        detalle = DETALLE_PENDIENTE if fields is not None else {}
+        return [
+            {**_proyectar(doc, fields),
+             "pago": _proyectar(pago, detalle.get("pago")),
+             "admin": _proyectar(admin, detalle.get("admin")),
+             "lavadero": _proyectar(lavadero, detalle.get("lavadero"))}
+            for doc, pago, admin, lavadero in self._con_detalle(self.data.find(estado=EstadoPago.PENDIENTE))
+        ][:limit]
+
+    async def historial(self, estado: Optional[str] = None, admin_id: Optional[str] = None,
+                        limit: int = 50, offset: int = 0) -> Tuple[List[dict], int, Dict[str, int]]:
+        filtro = {}
+        if estado:
+            filtro["estado"] = estado
+        if admin_id:
+            filtro["admin_id"] = admin_id
+        coincidentes = self.data.find(**filtro)
+        pagina = [
+            _bson({
+                "comprobante_id": doc["id"],
+                "admin_id": doc["admin_id"],
+                "admin_nombre": admin.get("nombre"),
+                "admin_email": admin.get("email"),
+                "lavadero_nombre": lavadero.get("nombre"),
+                "monto": pago.get("monto"),
+                "mes_año": pago.get("mes_año"),
+                "imagen_url": doc.get("imagen_url"),
+                "created_at": doc.get("created_at"),
+                "estado": doc.get("estado"),
+                "comentario_superadmin": doc.get("comentario_superadmin"),
+                "fecha_procesamiento": doc.get("fecha_procesamiento"),
+            })
+            for doc, pago, admin, lavadero in self._con_detalle(_newest_first(coincidentes))
+        ][offset:offset + limit]
+        por_estado = dict(Counter(d.get("estado") for d in self.data.docs.values()))
+        return pagina, len(coincidentes), por_estado
+
+    async def del_admin(self, admin_id: str, limit: int = 100, fields: Campos = None,
+                        pago_fields: Campos = None) -> List[dict]:
+        if fields is not None:
+            pago_fields = pago_fields or ("id",)
+        result = []
+        for doc in _newest_first(self.data.find(admin_id=admin_id)):
+            pago = self.pagos.data.docs.get(doc.get("pago_mensualidad_id"))
+            if pago is not None:
+                result.append({**_proyectar(doc, fields), "pago": _proyectar(pago, pago_fields)})
+        return result[:limit]
+
+    async def phashes(self, since: Optional[datetime] = None) -> AsyncIterator[Tuple[str, str, datetime]]:
+        since = _bson(since)
+        for doc in list(self.data.docs.values()):
+            if doc.get("phash") is not None and (since is None or doc["created_at"] > since):
+                yield doc["id"], doc["phash"], doc["created_at"]
+
+    async def delete_by_admin(self, admin_id: str) -> int:
+        return self.data.delete(admin_id=admin_id)
+
+
+class MemoryPurgaRepository:
+    def __init__(self):
+        self.data = _MemoryCollection()
+
+    async def insert(self, doc: dict):
+        self.data.insert(doc)
+
+    async def get(self, purga_id: str) -> Optional[dict]:
+        return _proyectar(self.data.docs.get(purga_id))
+
+    async def update(self, purga_id: str, fields: dict, inc: Optional[dict] = None,
+                     owner: Optional[str] = None) -> bool:
+        doc = self.data.docs.get(purga_id)
+        if doc is None or (owner is not None and doc.get("owner") != owner):
+            return False
+        for campo, valor in _bson(fields).items():
+            # "pasos.turnos" como en $set: dentro del subdocumento
+            destino = doc
+            *ruta, ultimo = campo.split(".")
+            for parte in ruta:
+                destino = destino.setdefault(parte, {})
+            destino[ultimo] = valor
+        for campo, delta in (inc or {}).items():
+            doc[campo] = doc.get(campo, 0) + delta
+        return True
+
+    @staticmethod
+    def _vencida(doc: dict, estados: Iterable[str], before: datetime) -> bool:
+        return doc.get("estado") in estados and (doc.get("heartbeat_at") is None or doc["heartbeat_at"] < before)
+
+    async def interrupted(self, estados: Iterable[str], before: datetime) -> List[str]:
+        before = _bson(before)
+        return [d["id"] for d in self.data.docs.values() if self._vencida(d, estados, before)]
+
+    async def claim(self, purga_id: str, owner: str, estados: Iterable[str], before: datetime,
+                    ahora: datetime) -> Optional[dict]:
+        doc = self.data.docs.get(purga_id)
+        if doc is None or not self._vencida(doc, estados, _bson(before)):
+            return None
+        doc.update(_bson({"owner": owner, "heartbeat_at": ahora}))
+        return _proyectar(doc)
+
+
+class MemoryPerfilRepository:
+    def __init__(self):
+        self.data = _MemoryCollection()
+
+    async def insert(self, doc: dict):
+        self.data.insert(doc)
+
+    async def list(self, limit: int = 100) -> List[dict]:
+        return [
+            _bson({k: v for k, v in d.items() if k != "speedscope"})
+            for d in _newest_first(self.data.docs.values())[:limit]
+        ]
+
+    async def get_speedscope(self, perfil_id: str) -> Optional[str]:
+        perfil = self.data.docs.get(perfil_id)
+        return perfil["speedscope"] if perfil else None
+
+
+class MemoryRepositories:
+    def __init__(self):
+        self.users = MemoryUserRepository()
+        self.lavaderos = MemoryLavaderoRepository()
+        self.turnos = MemoryTurnoRepository()
+        self.pagos = MemoryPagoRepository()
+        self.comprobantes = MemoryComprobanteRepository()
+        self.purgas = MemoryPurgaRepository()
+        self.perfiles = MemoryPerfilRepository()
+        # Un solo proceso: las revocaciones de tokens no se comparten
+        self.token_revocations = None
+        # Los joins en memoria leen directamente de los otros repositorios
+        self.users.lavaderos = self.lavaderos
+        self.lavaderos.users = self.users
+        self.comprobantes.pagos = self.pagos
+        self.comprobantes.users = self.users
+        self.comprobantes.lavaderos = self.lavaderos
+
+    async def transactions_supported(self) -> bool:
+        return False
+
+    async def run_in_transaction(self, operacion):
+        return await operacion(None)
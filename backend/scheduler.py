@@ -0,0 +1,65 @@
+"""Tareas periódicas en segundo plano coordinadas entre workers.
+
+Con varios workers de uvicorn cada proceso arranca las mismas tareas; un lease
+guardado en MongoDB (colección ``scheduler_locks``) garantiza que en cada tick
+sólo una de ellas ejecute el trabajo.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class MongoLease:
+    """Named lease with expiry, stored as one document per job"""
+
+    def __init__(self, db, nombre: str, duracion: timedelta, owner: str = WORKER_ID):
+        self.collection = db.scheduler_locks
+        self.nombre = nombre
+        self.duracion = duracion
+        self.owner = owner
+
+    async def acquire(self) -> bool:
+        ahora = datetime.now(timezone.utc)
+        try:
+            # Se toma el lease si está libre, vencido o ya es nuestro
+            await self.collection.find_one_and_update(
+                {
+                    "_id": self.nombre,
+                    "$or": [{"locked_until": {"$lt": ahora}}, {"owner": self.owner}]
+                },
+                {"$set": {"owner": self.owner, "locked_until": ahora + self.duracion}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Otro worker tiene el lease vigente: el upsert choca con su _id
+            return False
+
+    async def release(self):
+        await self.collection.update_one(
+            {"_id": self.nombre, "owner": self.owner},
+            {"$set": {"locked_until": datetime.now(timezone.utc)}}
+        )
+
+
+async def run_periodic(nombre: str, intervalo: float, job: Callable[[], Awaitable[None]], lease: MongoLease):
+    """Run ``job`` every ``intervalo`` seconds while this worker holds ``lease``"""
+    while True:
+        try:
+            if await lease.acquire():
+                await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Error en la tarea periódica {nombre}")
+        await asyncio.sleep(intervalo)
@@ -2,7 +2,9 @@ from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Request,
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+import motor.frameworks.asyncio as motor_framework
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Union
 from datetime import datetime, timedelta, timezone
@@ -13,9 +15,28 @@ from pathlib import Path
 import os
 import logging
 import uuid
-import requests
 import json
 import shutil
+import asyncio
+import contextvars
+import re
+import time
+from contextlib import asynccontextmanager
+
+from image_processing import ImageSettings, InvalidImageError, image_pool_pending, normalize_image_async, shutdown_image_pool
+from phash_index import HashIndexSync, MultiIndexHashTable
+from scheduler import WORKER_ID, MongoLease, run_periodic
+from config_cache import LavaderoConfigCache, SingletonConfigCache
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as metrics_registry, MetricsMiddleware
+from db_tracing import DbTracingMiddleware, MongoCommandTracer, db_budget, extend_budget
+from slow_queries import SlowQueryLog
+from profiler import ProfilingMiddleware
+from loop_monitor import LoopLagMonitor, RequestTaskMiddleware
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient, UpstreamError, UpstreamTimeout
+from health import CachedCheck, Pinger, PoolStats, executor_queue_depth, storage_writable
+from auth_tokens import Principal, TokenRevocationRegistry, build_claims, principal_from_claims
+from estados import EstadoAdmin, EstadoPago, EstadoTurno, UserRole
+from repositories import MongoRepositories
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,10 +46,51 @@ logger = logging.getLogger(__name__)
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Consultas más lentas que el umbral se guardan con su explain en una colección capped
+slow_query_log = SlowQueryLog(
+    threshold_ms=float(os.environ.get("SLOW_QUERY_MS", 100)),
+    size_bytes=int(os.environ.get("SLOW_QUERY_LOG_BYTES", 16 * 1024 * 1024))
+)
+
+# Conexiones abiertas y en uso del pool de Motor, para readiness
+pool_stats = PoolStats()
+
+# MongoDB: cada worker abre su cliente en el lifespan (ver conectar), nunca al importar
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+# Usuarios, lavaderos, turnos, pagos y comprobantes (ver repositories.py)
+repos = None
+
+# Modo debug: headers de diagnóstico (round trips a Mongo por request)
+DEBUG = os.environ.get("DEBUG", "false").lower() in ("1", "true", "yes")
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 1000))
+# Más repeticiones de la misma forma de consulta en un request se marcan como N+1
+REPEATED_QUERY_THRESHOLD = int(os.environ.get("REPEATED_QUERY_THRESHOLD", 5))
+
+# Lag del event loop: se mide cada LOOP_LAG_INTERVAL_MS y se loguea la pila de bloqueos largos
+loop_monitor = LoopLagMonitor(
+    interval=float(os.environ.get("LOOP_LAG_INTERVAL_MS", 100)) / 1000,
+    threshold=float(os.environ.get("LOOP_BLOCK_THRESHOLD_MS", 200)) / 1000
+)
+
+# Servicio externo de autenticación (Google OAuth); configurable para apuntar a un fake
+AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "https://demobackend.emergentagent.com")
+AUTH_SESSION_DATA_PATH = "/auth/v1/env/oauth/session-data"
+auth_client = UpstreamClient(
+    "auth",
+    AUTH_SERVICE_URL,
+    timeout=float(os.environ.get("AUTH_TIMEOUT_SECONDS", 5)),
+    max_connections=int(os.environ.get("AUTH_MAX_CONNECTIONS", 20)),
+    max_concurrency=int(os.environ.get("AUTH_MAX_CONCURRENCY", 20)),
+    breaker=CircuitBreaker(failure_threshold=5, reset_timeout=30)
+)
+
+# Intervalo del barrido que marca lavaderos vencidos
+VENCIMIENTO_SWEEP_INTERVAL_SECONDS = int(os.environ.get("VENCIMIENTO_SWEEP_INTERVAL_SECONDS", 60))
+
+# Una purga sin heartbeat en este lapso quedó huérfana y otro worker la puede reclamar
+PURGA_LEASE_SECONDS = float(os.environ.get("PURGA_LEASE_SECONDS", 60))
 
 # JWT Configuration
 SECRET_KEY = "mi-clave-secreta-super-segura-para-demo-12345"
@@ -41,21 +103,28 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # Security
 security = HTTPBearer()
 
-# Create FastAPI app
-app = FastAPI(title="Demo Authentication API")
+# Las rutas se registran acá; la app la arma create_app()
 api_router = APIRouter(prefix="/api")
 
-# Create uploads directory
-UPLOAD_DIR = Path("/app/uploads")
+# Uploads: los directorios se crean al arrancar
+UPLOAD_DIR = Path(os.environ.get("UPLOAD_DIR", "/app/uploads"))
 COMPROBANTES_DIR = UPLOAD_DIR / "comprobantes"
-COMPROBANTES_DIR.mkdir(parents=True, exist_ok=True)
+ORIGINALES_DIR = COMPROBANTES_DIR / "originales"
+
+# Normalización de imágenes de comprobantes
+image_settings = ImageSettings.from_env()
+
+# Detección de comprobantes casi duplicados (hash perceptual)
+DUPLICADO_MAX_DISTANCIA = int(os.environ.get("COMPROBANTE_DUPLICADO_MAX_DISTANCIA", 6))
+phash_index = MultiIndexHashTable()
+# Cada worker trae los hashes que suben los demás; repos se resuelve en cada pasada
+phash_sync = HashIndexSync(
+    phash_index,
+    lambda desde: repos.comprobantes.phashes(since=desde),
+    refresh_seconds=float(os.environ.get("PHASH_SYNC_INTERVAL_SECONDS", 30))
+)
 
 # User Models
-class UserRole(str):
-    SUPER_ADMIN = "SUPER_ADMIN"
-    ADMIN = "ADMIN"  # Dueño de lavadero
-    CLIENTE = "CLIENTE"  # Cliente que saca turnos
-
 class UserBase(BaseModel):
     email: EmailStr
     nombre: str
@@ -78,6 +147,13 @@ class User(UserBase):
     is_active: bool = True
     google_id: Optional[str] = None
     picture: Optional[str] = None
+    token_version: int = 0  # Se incrementa para revocar los tokens emitidos
+
+# Campos que se leen de users según para qué (proyecciones): el hash sólo en el login
+CAMPOS_USUARIO = tuple(campo for campo in User.model_fields if campo != "password_hash")
+CAMPOS_LOGIN = CAMPOS_USUARIO + ("password_hash",)
+CAMPOS_USER_RESPONSE = tuple(UserResponse.model_fields)
+SOLO_ID = ("id",)
 
 class GoogleUser(BaseModel):
     email: EmailStr
@@ -122,23 +198,6 @@ class UserStats(BaseModel):
 
 # ========== MODELOS DEL SISTEMA DE LAVADEROS ==========
 
-class EstadoAdmin(str):
-    PENDIENTE_APROBACION = "PENDIENTE_APROBACION"
-    ACTIVO = "ACTIVO"
-    VENCIDO = "VENCIDO"
-    BLOQUEADO = "BLOQUEADO"
-
-class EstadoTurno(str):
-    DISPONIBLE = "DISPONIBLE"
-    RESERVADO = "RESERVADO"
-    CONFIRMADO = "CONFIRMADO"
-    CANCELADO = "CANCELADO"
-
-class EstadoPago(str):
-    PENDIENTE = "PENDIENTE"
-    CONFIRMADO = "CONFIRMADO"
-    RECHAZADO = "RECHAZADO"
-
 # Configuración Super Admin
 class ConfiguracionSuperAdmin(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -146,6 +205,49 @@ class ConfiguracionSuperAdmin(BaseModel):
     precio_mensualidad: float
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+def configuracion_superadmin_por_defecto() -> dict:
+    return ConfiguracionSuperAdmin(
+        alias_bancario="superadmin.alias.mp",
+        precio_mensualidad=10000.0
+    ).dict()
+
+# Singleton en memoria: las lecturas no van a MongoDB (se crea en conectar)
+superadmin_config: Optional[SingletonConfigCache] = None
+
+# Versión mínima de token por usuario (revocaciones), compartida entre workers (se crea con los repositorios)
+token_revocations: Optional[TokenRevocationRegistry] = None
+
+def usar_repositorios(nuevos):
+    """Swap the data layer, e.g. for MemoryRepositories in tests"""
+    global repos, token_revocations
+    repos = nuevos
+    lavadero_cache.lavaderos = nuevos.lavaderos
+    lavadero_cache.clear()
+    token_revocations = TokenRevocationRegistry(
+        nuevos.users, nuevos.token_revocations, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
+# Ping de readiness a Mongo (se crea en conectar)
+mongo_pinger: Optional[Pinger] = None
+
+def conectar(mongo_url: Optional[str] = None, db_name: Optional[str] = None):
+    """Create the Motor client and everything bound to its database.
+
+    The lifespan calls it, so each worker opens its own client after the
+    fork. Scripts that use ``server.db`` without running the app call it
+    themselves. No I/O happens until the first command.
+    """
+    global client, db, superadmin_config, mongo_pinger
+    client = AsyncIOMotorClient(
+        mongo_url or os.environ['MONGO_URL'],
+        event_listeners=[MongoCommandTracer(), slow_query_log, pool_stats]
+    )
+    db = client[db_name or os.environ['DB_NAME']]
+    usar_repositorios(MongoRepositories(client, db))
+    superadmin_config = SingletonConfigCache(db.configuracion_superadmin, configuracion_superadmin_por_defecto)
+    mongo_pinger = Pinger(db, timeout=float(os.environ.get("READINESS_PING_TIMEOUT_SECONDS", 0.5)))
+    return db
+
 # Lavadero
 class Lavadero(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -172,6 +274,9 @@ class LavaderoResponse(BaseModel):
     fecha_vencimiento: Optional[datetime] = None
     created_at: datetime
 
+CAMPOS_LAVADERO = tuple(Lavadero.model_fields)
+CAMPOS_LAVADERO_RESPONSE = tuple(LavaderoResponse.model_fields)
+
 # Configuración de Lavadero
 class ConfiguracionLavadero(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -197,6 +302,17 @@ class ConfiguracionLavadero(BaseModel):
     esta_abierto: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+CAMPOS_CONFIGURACION = tuple(ConfiguracionLavadero.model_fields)
+
+# LRU de (lavadero, configuración) para las pantallas del admin
+lavadero_cache = LavaderoConfigCache(
+    None,
+    maxsize=int(os.environ.get("LAVADERO_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("LAVADERO_CACHE_TTL_SECONDS", 60)),
+    fields=CAMPOS_LAVADERO,
+    config_fields=CAMPOS_CONFIGURACION
+)
+
 class ConfiguracionLavaderoCreate(BaseModel):
     hora_apertura: str
     hora_cierre: str
@@ -282,6 +398,8 @@ class ComprobantePagoMensualidad(BaseModel):
     pago_mensualidad_id: str
     admin_id: str
     imagen_url: str
+    imagen_original_url: Optional[str] = None  # Solo si COMPROBANTE_CONSERVAR_ORIGINAL está activo
+    phash: Optional[str] = None  # Hash perceptual para detectar duplicados
     estado: str = EstadoPago.PENDIENTE
     comentario_superadmin: Optional[str] = None
     fecha_revision: Optional[datetime] = None
@@ -293,6 +411,14 @@ class ComprobantePagoMensualidadCreate(BaseModel):
 class RechazarComprobanteRequest(BaseModel):
     comentario: str
 
+class DecisionComprobante(BaseModel):
+    comprobante_id: str
+    decision: str  # "APROBAR" o "RECHAZAR"
+    comentario: Optional[str] = None  # Requerido al rechazar
+
+class ProcesarComprobantesLoteRequest(BaseModel):
+    decisiones: List[DecisionComprobante]
+
 # Registro de Admin con Lavadero
 class AdminLavaderoRegister(BaseModel):
     # Datos del admin
@@ -319,8 +445,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_user_by_email(email: str):
-    user_doc = await db.users.find_one({"email": email})
+async def get_user_by_email(email: str, campos=CAMPOS_USUARIO):
+    user_doc = await repos.users.get_by_email(email, fields=campos)
     if user_doc:
         return User(**user_doc)
     return None
@@ -329,7 +455,7 @@ async def authenticate_user(email: str, password: str):
     # Super Admin hardcodeado
     if email == "kearcangel@gmail.com" and password == "K@#l1331":
         # Crear o obtener usuario Super Admin
-        super_admin = await get_user_by_email(email)
+        super_admin = await get_user_by_email(email, CAMPOS_LOGIN)
         if not super_admin:
             # Crear Super Admin si no existe
             super_admin = User(
@@ -338,21 +464,17 @@ async def authenticate_user(email: str, password: str):
                 rol=UserRole.SUPER_ADMIN,
                 password_hash=get_password_hash(password)
             )
-            user_dict = super_admin.dict()
-            await db.users.insert_one(user_dict)
+            await repos.users.insert(super_admin.dict())
         else:
             # Si existe pero no es SUPER_ADMIN, actualizarlo
             if super_admin.rol != UserRole.SUPER_ADMIN:
-                await db.users.update_one(
-                    {"email": email},
-                    {"$set": {"rol": UserRole.SUPER_ADMIN}}
-                )
+                await repos.users.update(super_admin.id, {"rol": UserRole.SUPER_ADMIN})
                 super_admin.rol = UserRole.SUPER_ADMIN
         return super_admin
     
     # Autenticación normal para otros usuarios
-    user = await get_user_by_email(email)
-    if not user:
+    user = await get_user_by_email(email, CAMPOS_LOGIN)
+    if not user or not user.is_active:
         return False
     if not user.password_hash or not verify_password(password, user.password_hash):
         return False
@@ -360,30 +482,38 @@ async def authenticate_user(email: str, password: str):
 
 async def get_session_user(session_token: str):
     """Get user from session token"""
-    session_doc = await db.google_sessions.find_one({"session_token": session_token})
-    if not session_doc:
-        return None
-    
-    session = GoogleSession(**session_doc)
-    
-    # Check if session is expired
-    current_time = datetime.now(timezone.utc)
-    session_expires = session.expires_at
-    
-    # Ensure both datetimes are timezone-aware for comparison
-    if session_expires.tzinfo is None:
-        session_expires = session_expires.replace(tzinfo=timezone.utc)
-    
-    if session_expires < current_time:
-        await db.google_sessions.delete_one({"session_token": session_token})
+    user_id = await repos.users.session_user_id(session_token, datetime.now(timezone.utc))
+    if not user_id:
         return None
     
     # Get user
-    user_doc = await db.users.find_one({"id": session.user_id})
+    user_doc = await repos.users.get_by_id(user_id, fields=CAMPOS_USUARIO)
     if user_doc:
         return User(**user_doc)
     return None
 
+def verificar_revocacion(principal: Principal):
+    if token_revocations.is_revoked(principal):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revocado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+async def usuario_del_token(payload: dict) -> Optional[User]:
+    """Active user behind a decoded access token; raises if the token was revoked"""
+    principal = principal_from_claims(payload)
+    if principal is None:
+        # Token anterior a los claims: sólo trae el email
+        email = payload.get("sub")
+        user = await get_user_by_email(email) if email else None
+    else:
+        # Mismo chequeo que get_current_principal, y el usuario por id
+        verificar_revocacion(principal)
+        user_doc = await repos.users.get_by_id(principal.id, fields=CAMPOS_USUARIO)
+        user = User(**user_doc) if user_doc else None
+    return user if user is not None and user.is_active else None
+
 async def get_current_user(request: Request):
     # First try to get user from session cookie (Google OAuth)
     session_token = request.cookies.get("session_token")
@@ -403,13 +533,12 @@ async def get_current_user(request: Request):
         try:
             token = auth_header.split(" ")[1]
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            email: str = payload.get("sub")
-            if email is None:
+            if payload.get("sub") is None:
                 raise credentials_exception
         except JWTError:
             raise credentials_exception
         
-        user = await get_user_by_email(email)
+        user = await usuario_del_token(payload)
         if user is None:
             raise credentials_exception
         return user
@@ -421,6 +550,42 @@ async def get_current_user(request: Request):
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+async def get_current_principal(request: Request) -> Principal:
+    """Identify the caller from the token claims, without reading the database.
+
+    Google sessions and tokens issued before the claims existed fall back to
+    get_current_user.
+    """
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        try:
+            payload = jwt.decode(auth_header.split(" ")[1], SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            payload = None
+        principal = principal_from_claims(payload) if payload else None
+        if principal is not None:
+            verificar_revocacion(principal)
+            return principal
+    
+    user = await get_current_user(request)
+    lavadero_id = None
+    if user.rol == UserRole.ADMIN:
+        entry = await lavadero_cache.get_by_admin(user.id)
+        lavadero_id = entry[0]["id"] if entry else None
+    return Principal(
+        id=user.id,
+        email=user.email,
+        rol=user.rol,
+        lavadero_id=lavadero_id,
+        token_version=user.token_version
+    )
+
+async def get_lavadero_del_admin(principal: Principal):
+    """(lavadero, configuracion) owned by an admin, from the cache"""
+    if principal.lavadero_id:
+        return await lavadero_cache.get_by_lavadero(principal.lavadero_id)
+    return await lavadero_cache.get_by_admin(principal.id)
+
 async def get_current_user_optional(request: Request):
     """Get current user without requiring authentication"""
     # Try session cookie first
@@ -436,17 +601,14 @@ async def get_current_user_optional(request: Request):
         try:
             token = auth_header.split(" ")[1]
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            email: str = payload.get("sub")
-            if email:
-                user = await get_user_by_email(email)
-                return user
-        except JWTError:
+            return await usuario_del_token(payload)
+        except (JWTError, HTTPException):
             pass
     
     return None
 
 async def get_admin_user(request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     if current_user.rol not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -455,7 +617,7 @@ async def get_admin_user(request: Request):
     return current_user
 
 async def get_super_admin_user(request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     if current_user.rol != UserRole.SUPER_ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -464,27 +626,34 @@ async def get_super_admin_user(request: Request):
     return current_user
 
 async def get_lavadero_by_id(lavadero_id: str):
-    lavadero_doc = await db.lavaderos.find_one({"id": lavadero_id})
+    lavadero_doc = await repos.lavaderos.get(lavadero_id, fields=CAMPOS_LAVADERO)
     if lavadero_doc:
         return Lavadero(**lavadero_doc)
     return None
 
 async def verify_admin_owns_lavadero(admin_id: str, lavadero_id: str):
-    lavadero = await get_lavadero_by_id(lavadero_id)
-    if not lavadero or lavadero.admin_id != admin_id:
+    # Consulta cubierta por el índice (admin_id, id): no trae el lavadero
+    if not await repos.lavaderos.owned_by(lavadero_id, admin_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="No tienes permisos para acceder a este lavadero"
         )
-    return lavadero
+
+async def transacciones_soportadas() -> bool:
+    return await repos.transactions_supported()
+
+async def run_in_transaction(operacion):
+    """Run ``operacion(session)`` inside a multi-document transaction (see MongoRepositories)"""
+    return await repos.run_in_transaction(operacion)
 
 # ========== ENDPOINTS DE REGISTRO ==========
 
 # Registro normal (solo para clientes)
 @api_router.post("/register", response_model=UserResponse)
+@db_budget(2)
 async def register_user(user_data: UserCreate):
     # Check if user already exists
-    existing_user = await get_user_by_email(user_data.email)
+    existing_user = await repos.users.get_by_email(user_data.email, fields=SOLO_ID)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -509,15 +678,16 @@ async def register_user(user_data: UserCreate):
     
     # Insert to database
     user_dict = new_user.dict()
-    await db.users.insert_one(user_dict)
+    await repos.users.insert(user_dict)
     
     return UserResponse(**user_dict)
 
 # Registro de Admin con Lavadero
 @api_router.post("/register-admin", response_model=dict)
+@db_budget(7)
 async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister):
     # Check if user already exists
-    existing_user = await get_user_by_email(admin_data.email)
+    existing_user = await repos.users.get_by_email(admin_data.email, fields=SOLO_ID)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -525,10 +695,7 @@ async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister):
         )
     
     # Check if lavadero name already exists (case-insensitive)
-    existing_lavadero = await db.lavaderos.find_one({
-        "nombre": {"$regex": f"^{admin_data.lavadero.nombre}$", "$options": "i"}
-    })
-    if existing_lavadero:
+    if await repos.lavaderos.name_exists(admin_data.lavadero.nombre):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Ya existe un lavadero con ese nombre"
@@ -544,15 +711,10 @@ async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister):
     )
     
     # Insert admin to database
-    admin_dict = new_admin.dict()
-    await db.users.insert_one(admin_dict)
+    await repos.users.insert(new_admin.dict())
     
     # Guardar credencial en tabla temporal para testing
-    await db.temp_credentials.insert_one({
-        "admin_email": admin_data.email,
-        "password": admin_data.password,
-        "created_at": datetime.now(timezone.utc)
-    })
+    await repos.users.insert_temp_credential(admin_data.email, admin_data.password, datetime.now(timezone.utc))
     
     # Create lavadero
     new_lavadero = Lavadero(
@@ -564,23 +726,13 @@ async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister):
     )
     
     # Insert lavadero to database
-    lavadero_dict = new_lavadero.dict()
-    await db.lavaderos.insert_one(lavadero_dict)
+    await repos.lavaderos.insert(new_lavadero.dict())
     
     # Create pago mensualidad pendiente
-    # Obtener configuración super admin
-    config_super = await db.configuracion_superadmin.find_one({})
-    if not config_super:
-        # Crear configuración por defecto si no existe
-        default_config = ConfiguracionSuperAdmin(
-            alias_bancario="superadmin.alias.mp",
-            precio_mensualidad=10000.0
-        )
-        await db.configuracion_superadmin.insert_one(default_config.dict())
-        config_super = default_config.dict()
+    # Obtener configuración super admin (en memoria)
+    config_super = await superadmin_config.get()
     
     # Crear pago mensualidad
-    from datetime import datetime, timedelta
     fecha_vencimiento = datetime.now(timezone.utc) + timedelta(days=30)
     
     pago_mensualidad = PagoMensualidad(
@@ -591,7 +743,7 @@ async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister):
         fecha_vencimiento=fecha_vencimiento
     )
     
-    await db.pagos_mensualidad.insert_one(pago_mensualidad.dict())
+    await repos.pagos.insert(pago_mensualidad.dict())
     
     return {
         "message": "Admin y lavadero registrados correctamente",
@@ -604,6 +756,7 @@ async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister):
     }
 
 @api_router.post("/login", response_model=Token)
+@db_budget(3)
 async def login(login_data: LoginRequest):
     user = await authenticate_user(login_data.email, login_data.password)
     if not user:
@@ -613,29 +766,22 @@ async def login(login_data: LoginRequest):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verificar estado del admin si no es super admin
+    # El lavadero del admin va en el token: las rutas no vuelven a buscarlo
+    lavadero_id = None
     if user.rol == UserRole.ADMIN:
-        # Buscar el lavadero del admin
-        lavadero_doc = await db.lavaderos.find_one({"admin_id": user.id})
-        if lavadero_doc:
-            lavadero = Lavadero(**lavadero_doc)
-            # Verificar si está vencido
-            if lavadero.fecha_vencimiento:
-                # Asegurar que ambas fechas tengan timezone para comparar
-                fecha_vencimiento = lavadero.fecha_vencimiento
-                if fecha_vencimiento.tzinfo is None:
-                    fecha_vencimiento = fecha_vencimiento.replace(tzinfo=timezone.utc)
-                    
-                if fecha_vencimiento < datetime.now(timezone.utc):
-                    lavadero.estado_operativo = EstadoAdmin.VENCIDO
-                    await db.lavaderos.update_one(
-                        {"id": lavadero.id},
-                        {"$set": {"estado_operativo": EstadoAdmin.VENCIDO}}
-                    )
+        entry = await lavadero_cache.get_by_admin(user.id)
+        lavadero_id = entry[0]["id"] if entry else None
+    principal = Principal(
+        id=user.id,
+        email=user.email,
+        rol=user.rol,
+        lavadero_id=lavadero_id,
+        token_version=user.token_version
+    )
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=build_claims(principal), expires_delta=access_token_expires
     )
     
     user_response = UserResponse(**user.dict())
@@ -647,21 +793,24 @@ async def login(login_data: LoginRequest):
     )
 
 @api_router.get("/me", response_model=UserResponse)
+@db_budget(1)
 async def get_current_user_info(request: Request):
     current_user = await get_current_user(request)
     return UserResponse(**current_user.dict())
 
 # Dashboard Routes
 @api_router.get("/dashboard/stats")
+@db_budget(2)
 async def get_dashboard_stats(request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     
     if current_user.rol == UserRole.SUPER_ADMIN:
-        # Super Admin: estadísticas globales
-        total_lavaderos = await db.lavaderos.count_documents({})
-        lavaderos_activos = await db.lavaderos.count_documents({"estado_operativo": EstadoAdmin.ACTIVO})
-        lavaderos_pendientes = await db.lavaderos.count_documents({"estado_operativo": EstadoAdmin.PENDIENTE_APROBACION})
-        comprobantes_pendientes = await db.comprobantes_pago_mensualidad.count_documents({"estado": EstadoPago.PENDIENTE})
+        # Super Admin: estadísticas globales (lavaderos por estado en una sola consulta)
+        por_estado = await repos.lavaderos.count_by_estado()
+        total_lavaderos = sum(por_estado.values())
+        lavaderos_activos = por_estado.get(EstadoAdmin.ACTIVO, 0)
+        lavaderos_pendientes = por_estado.get(EstadoAdmin.PENDIENTE_APROBACION, 0)
+        comprobantes_pendientes = await repos.comprobantes.count_pendientes()
         
         return {
             "total_lavaderos": total_lavaderos,
@@ -671,24 +820,21 @@ async def get_dashboard_stats(request: Request):
         }
     
     elif current_user.rol == UserRole.ADMIN:
-        # Admin: estadísticas de su lavadero
-        lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-        if not lavadero_doc:
+        # Admin: estadísticas de su lavadero (caché)
+        entry = await get_lavadero_del_admin(current_user)
+        if not entry:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Lavadero no encontrado"
             )
         
-        lavadero = Lavadero(**lavadero_doc)
+        lavadero = Lavadero(**entry[0])
         
-        # Contar turnos
-        total_turnos = await db.turnos.count_documents({"lavadero_id": lavadero.id})
-        turnos_confirmados = await db.turnos.count_documents({"lavadero_id": lavadero.id, "estado": EstadoTurno.CONFIRMADO})
-        turnos_pendientes = await db.turnos.count_documents({"lavadero_id": lavadero.id, "estado": EstadoTurno.RESERVADO})
-        comprobantes_pendientes = await db.comprobantes_pago.count_documents({
-            "turno_id": {"$in": [turno["id"] async for turno in db.turnos.find({"lavadero_id": lavadero.id})]},
-            "estado": EstadoPago.PENDIENTE
-        })
+        # Turnos por estado y comprobantes pendientes de esos turnos, en una sola consulta
+        por_estado, comprobantes_pendientes = await repos.turnos.stats_lavadero(lavadero.id)
+        total_turnos = sum(por_estado.values())
+        turnos_confirmados = por_estado.get(EstadoTurno.CONFIRMADO, 0)
+        turnos_pendientes = por_estado.get(EstadoTurno.RESERVADO, 0)
         
         # Días restantes de suscripción
         dias_restantes = 0
@@ -712,9 +858,10 @@ async def get_dashboard_stats(request: Request):
     
     else:  # CLIENTE
         # Cliente: estadísticas de sus turnos
-        mis_turnos = await db.turnos.count_documents({"cliente_id": current_user.id})
-        turnos_confirmados = await db.turnos.count_documents({"cliente_id": current_user.id, "estado": EstadoTurno.CONFIRMADO})
-        turnos_pendientes = await db.turnos.count_documents({"cliente_id": current_user.id, "estado": EstadoTurno.RESERVADO})
+        por_estado = await repos.turnos.stats_cliente(current_user.id)
+        mis_turnos = sum(por_estado.values())
+        turnos_confirmados = por_estado.get(EstadoTurno.CONFIRMADO, 0)
+        turnos_pendientes = por_estado.get(EstadoTurno.RESERVADO, 0)
         
         return {
             "mis_turnos": mis_turnos,
@@ -724,17 +871,19 @@ async def get_dashboard_stats(request: Request):
 
 # User Management (Admin only)
 @api_router.get("/admin/users", response_model=List[UserResponse])
+@db_budget(2)
 async def get_all_users(request: Request):
     admin_user = await get_admin_user(request)
-    users_cursor = db.users.find({})
-    users = await users_cursor.to_list(1000)
+    users = await repos.users.list(fields=CAMPOS_USER_RESPONSE)
     return [UserResponse(**user) for user in users]
 
 @api_router.delete("/admin/users/{user_id}")
+@db_budget(3)
 async def delete_user(user_id: str, request: Request):
     admin_user = await get_admin_user(request)
-    result = await db.users.delete_one({"id": user_id})
-    if result.deleted_count == 0:
+    # Antes de borrar: sin el usuario no hay token_version que incrementar
+    await token_revocations.revoke(user_id)
+    if not await repos.users.delete(user_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Usuario no encontrado"
@@ -742,9 +891,10 @@ async def delete_user(user_id: str, request: Request):
     return {"message": "Usuario eliminado correctamente"}
 
 @api_router.put("/admin/users/{user_id}/toggle-status")
+@db_budget(4)
 async def toggle_user_status(user_id: str, request: Request):
     admin_user = await get_admin_user(request)
-    user_doc = await db.users.find_one({"id": user_id})
+    user_doc = await repos.users.get(user_id, fields=("is_active",))
     if not user_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -752,26 +902,28 @@ async def toggle_user_status(user_id: str, request: Request):
         )
     
     new_status = not user_doc.get("is_active", True)
-    await db.users.update_one(
-        {"id": user_id},
-        {"$set": {"is_active": new_status}}
-    )
+    await repos.users.update(user_id, {"is_active": new_status})
+    if not new_status:
+        await token_revocations.revoke(user_id)
     
     return {"message": f"Usuario {'activado' if new_status else 'desactivado'} correctamente"}
 
 # Protected routes examples
 @api_router.get("/protected")
+@db_budget(1)
 async def protected_route(request: Request):
     current_user = await get_current_user(request)
     return {"message": f"Hola {current_user.nombre}, tienes acceso como {current_user.rol}"}
 
 @api_router.get("/admin-only")
+@db_budget(0)
 async def admin_only_route(request: Request):
     admin_user = await get_admin_user(request)
     return {"message": "Solo los administradores pueden ver esto", "secret": "Información ultra secreta"}
 
 # Google OAuth Session Endpoint
 @api_router.get("/session-data", response_model=SessionDataResponse)
+@db_budget(3)
 async def get_session_data(request: Request):
     session_id = request.headers.get("X-Session-ID")
     if not session_id:
@@ -780,13 +932,9 @@ async def get_session_data(request: Request):
             detail="Session ID requerido"
         )
     
-    # Call Emergent Auth API
+    # Call Emergent Auth API (cliente asíncrono compartido, no bloquea el event loop)
     try:
-        response = requests.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": session_id},
-            timeout=10
-        )
+        response = await auth_client.get(AUTH_SESSION_DATA_PATH, headers={"X-Session-ID": session_id})
         
         if response.status_code != 200:
             raise HTTPException(
@@ -818,19 +966,15 @@ async def get_session_data(request: Request):
                 password_hash=None  # No password for Google users
             )
             
-            user_dict = new_user.dict()
-            await db.users.insert_one(user_dict)
+            await repos.users.insert(new_user.dict())
             user = new_user
         else:
             # Update existing user with Google info if they don't have it
             if not user.google_id:
-                await db.users.update_one(
-                    {"id": user.id},
-                    {"$set": {
-                        "google_id": session_data["id"],
-                        "picture": session_data.get("picture")
-                    }}
-                )
+                await repos.users.update(user.id, {
+                    "google_id": session_data["id"],
+                    "picture": session_data.get("picture")
+                })
                 # Update user object
                 user.google_id = session_data["id"]
                 user.picture = session_data.get("picture")
@@ -845,11 +989,23 @@ async def get_session_data(request: Request):
             expires_at=expires_at
         )
         
-        await db.google_sessions.insert_one(google_session.dict())
+        # Upsert por token: repetir el login con la misma sesión no agrega filas
+        await repos.users.upsert_session(google_session.dict())
         
         return SessionDataResponse(**session_data)
         
-    except requests.RequestException as e:
+    except CircuitOpenError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor de autenticación no disponible, intente más tarde"
+        )
+    except UpstreamTimeout as e:
+        logger.error(f"Timeout calling Emergent Auth API: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="El servidor de autenticación no respondió a tiempo"
+        )
+    except UpstreamError as e:
         logger.error(f"Error calling Emergent Auth API: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -860,6 +1016,7 @@ class SetSessionCookieRequest(BaseModel):
     session_token: str
 
 @api_router.post("/set-session-cookie")
+@db_budget(0)
 async def set_session_cookie(response: Response, request_data: SetSessionCookieRequest):
     """Set session cookie after Google OAuth"""
     # Determine if we're in development or production
@@ -877,6 +1034,7 @@ async def set_session_cookie(response: Response, request_data: SetSessionCookieR
     return {"message": "Cookie establecida correctamente"}
 
 @api_router.post("/logout")
+@db_budget(1)
 async def logout(request: Request, response: Response):
     """Logout user and clear session"""
     # Get session token from cookie
@@ -884,7 +1042,7 @@ async def logout(request: Request, response: Response):
     
     if session_token:
         # Delete session from database
-        await db.google_sessions.delete_one({"session_token": session_token})
+        await repos.users.delete_session(session_token)
         
         # Clear cookie
         is_development = os.environ.get('CORS_ORIGINS', '*') == '*'
@@ -899,6 +1057,7 @@ async def logout(request: Request, response: Response):
     return {"message": "Sesión cerrada correctamente"}
 
 @api_router.get("/check-session")
+@db_budget(2)
 async def check_session(request: Request):
     """Check if user has valid session"""
     user = await get_current_user_optional(request)
@@ -908,6 +1067,7 @@ async def check_session(request: Request):
 
 # Root endpoint
 @api_router.get("/")
+@db_budget(0)
 async def root():
     return {"message": "Hello World", "status": "API funcionando"}
 
@@ -915,26 +1075,16 @@ async def root():
 
 # Obtener lavaderos operativos (para la página inicial)
 @api_router.get("/lavaderos-operativos")
+@db_budget(2)
 async def get_lavaderos_operativos():
-    lavaderos_cursor = db.lavaderos.find({
-        "estado_operativo": EstadoAdmin.ACTIVO,
-        "is_active": True
-    })
-    lavaderos = await lavaderos_cursor.to_list(1000)
+    lavaderos = await repos.lavaderos.list_operativos(fields=CAMPOS_LAVADERO_RESPONSE)
     return [LavaderoResponse(**lavadero) for lavadero in lavaderos]
 
 # Obtener configuración de Super Admin (alias bancario)
 @api_router.get("/superadmin-config")
+@db_budget(1)
 async def get_superadmin_config():
-    config = await db.configuracion_superadmin.find_one({})
-    if not config:
-        # Crear configuración por defecto
-        default_config = ConfiguracionSuperAdmin(
-            alias_bancario="superadmin.alias.mp",
-            precio_mensualidad=10000.0
-        )
-        await db.configuracion_superadmin.insert_one(default_config.dict())
-        config = default_config.dict()
+    config = await superadmin_config.get()
     
     return {
         "alias_bancario": config.get("alias_bancario"),
@@ -945,23 +1095,15 @@ async def get_superadmin_config():
 
 # Ver todos los lavaderos (Super Admin)
 @api_router.get("/superadmin/lavaderos")
+@db_budget(2)
 async def get_all_lavaderos(request: Request):
     await get_super_admin_user(request)
     
     # Join con usuarios para obtener datos del admin
-    pipeline = [
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "admin_id",
-                "foreignField": "id",
-                "as": "admin"
-            }
-        },
-        {"$unwind": "$admin"}
-    ]
-    
-    lavaderos = await db.lavaderos.aggregate(pipeline).to_list(1000)
+    lavaderos = await repos.lavaderos.with_admin(
+        fields=("id", "nombre", "direccion", "estado_operativo", "fecha_vencimiento", "created_at"),
+        admin_fields=("nombre", "email")
+    )
     
     result = []
     for lavadero in lavaderos:
@@ -980,45 +1122,49 @@ async def get_all_lavaderos(request: Request):
 
 # Obtener comprobantes pendientes (Super Admin)
 @api_router.get("/superadmin/comprobantes-pendientes")
+@db_budget(3)
 async def get_comprobantes_pendientes(request: Request):
     await get_super_admin_user(request)
     
     # Join para obtener información del admin y lavadero
-    pipeline = [
-        {"$match": {"estado": EstadoPago.PENDIENTE}},
-        {
-            "$lookup": {
-                "from": "pagos_mensualidad",
-                "localField": "pago_mensualidad_id",
-                "foreignField": "id",
-                "as": "pago"
-            }
-        },
-        {"$unwind": "$pago"},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "admin_id",
-                "foreignField": "id",
-                "as": "admin"
-            }
-        },
-        {"$unwind": "$admin"},
-        {
-            "$lookup": {
-                "from": "lavaderos",
-                "localField": "pago.lavadero_id",
-                "foreignField": "id",
-                "as": "lavadero"
-            }
-        },
-        {"$unwind": "$lavadero"}
-    ]
+    comprobantes = await repos.comprobantes.pendientes_con_detalle(
+        fields=("id", "phash", "imagen_url", "created_at")
+    )
+    
+    # Marcar posibles reenvíos de la misma captura (hash perceptual cercano)
+    duplicados_por_comprobante = {}
+    for comp in comprobantes:
+        if not comp.get("phash"):
+            continue
+        phash = int(comp["phash"], 16)
+        if comp["id"] not in phash_index:
+            phash_index.add(comp["id"], phash)
+        duplicados_por_comprobante[comp["id"]] = phash_index.search(
+            phash, DUPLICADO_MAX_DISTANCIA, excluir=comp["id"]
+        )
     
-    comprobantes = await db.comprobantes_pago_mensualidad.aggregate(pipeline).to_list(1000)
+    # Datos mínimos de los comprobantes coincidentes, en una sola consulta
+    ids_duplicados = {dup_id for dups in duplicados_por_comprobante.values() for dup_id, _ in dups}
+    info_duplicados = {}
+    if ids_duplicados:
+        info_duplicados = await repos.comprobantes.get_many(
+            list(ids_duplicados), fields=("admin_id", "estado", "created_at")
+        )
     
     result = []
     for comp in comprobantes:
+        posibles_duplicados = [
+            {
+                "comprobante_id": dup_id,
+                "distancia": distancia,
+                "admin_id": info_duplicados[dup_id]["admin_id"],
+                "estado": info_duplicados[dup_id]["estado"],
+                "created_at": info_duplicados[dup_id]["created_at"]
+            }
+            for dup_id, distancia in duplicados_por_comprobante.get(comp["id"], [])
+            if dup_id in info_duplicados
+        ]
+        
         result.append({
             "comprobante_id": comp["id"],
             "admin_nombre": comp["admin"]["nombre"],
@@ -1026,13 +1172,16 @@ async def get_comprobantes_pendientes(request: Request):
             "lavadero_nombre": comp["lavadero"]["nombre"],
             "monto": comp["pago"]["monto"],
             "imagen_url": comp["imagen_url"],
-            "created_at": comp["created_at"]
+            "created_at": comp["created_at"],
+            "posible_duplicado": bool(posibles_duplicados),
+            "posibles_duplicados": posibles_duplicados
         })
     
     return result
 
 # Obtener historial completo de comprobantes (Super Admin) - NUEVA FUNCIONALIDAD
 @api_router.get("/superadmin/comprobantes-historial")
+@db_budget(3)
 async def get_comprobantes_historial(
     request: Request,
     estado: Optional[str] = None,
@@ -1042,79 +1191,14 @@ async def get_comprobantes_historial(
 ):
     await get_super_admin_user(request)
     
-    # Construir filtros
-    match_filters = {}
-    if estado and estado in [EstadoPago.PENDIENTE, EstadoPago.CONFIRMADO, EstadoPago.RECHAZADO]:
-        match_filters["estado"] = estado
-    if admin_id:
-        match_filters["admin_id"] = admin_id
-    
-    # Pipeline para obtener historial completo con información detallada
-    pipeline = [
-        {"$match": match_filters} if match_filters else {"$match": {}},
-        {"$lookup": {
-            "from": "pagos_mensualidad",
-            "localField": "pago_mensualidad_id",
-            "foreignField": "id",
-            "as": "pago_info"
-        }},
-        {"$unwind": "$pago_info"},
-        {"$lookup": {
-            "from": "users",
-            "localField": "admin_id", 
-            "foreignField": "id",
-            "as": "admin_info"
-        }},
-        {"$unwind": "$admin_info"},
-        {"$lookup": {
-            "from": "lavaderos",
-            "localField": "pago_info.lavadero_id",
-            "foreignField": "id", 
-            "as": "lavadero_info"
-        }},
-        {"$unwind": "$lavadero_info"},
-        {"$project": {
-            "_id": 0,  # Exclude MongoDB ObjectId
-            "comprobante_id": "$id",
-            "admin_id": "$admin_id",
-            "admin_nombre": "$admin_info.nombre",
-            "admin_email": "$admin_info.email", 
-            "lavadero_nombre": "$lavadero_info.nombre",
-            "monto": "$pago_info.monto",
-            "mes_año": "$pago_info.mes_año",
-            "imagen_url": 1,
-            "created_at": 1,
-            "estado": 1,
-            "comentario_superadmin": 1,
-            "fecha_procesamiento": {"$ifNull": ["$fecha_procesamiento", None]}
-        }},
-        {"$sort": {"created_at": -1}},
-        {"$skip": offset},
-        {"$limit": limit}
-    ]
-    
-    # Ejecutar query principal
-    comprobantes_cursor = db.comprobantes_pago_mensualidad.aggregate(pipeline)
-    comprobantes = await comprobantes_cursor.to_list(limit)
-    
-    # Contar total de registros para paginación
-    count_pipeline = [
-        {"$match": match_filters} if match_filters else {"$match": {}},
-        {"$count": "total"}
-    ]
-    count_cursor = db.comprobantes_pago_mensualidad.aggregate(count_pipeline)
-    count_result = await count_cursor.to_list(1)
-    total = count_result[0]["total"] if count_result else 0
-    
-    # Obtener estadísticas de resumen
-    stats_pipeline = [
-        {"$group": {
-            "_id": "$estado",
-            "count": {"$sum": 1}
-        }}
-    ]
-    stats_cursor = db.comprobantes_pago_mensualidad.aggregate(stats_pipeline)
-    stats_raw = await stats_cursor.to_list(10)
+    # Sólo se filtra por estados conocidos
+    if estado not in [EstadoPago.PENDIENTE, EstadoPago.CONFIRMADO, EstadoPago.RECHAZADO]:
+        estado_filtro = None
+    else:
+        estado_filtro = estado
+    comprobantes, total, por_estado = await repos.comprobantes.historial(
+        estado=estado_filtro, admin_id=admin_id, limit=limit, offset=offset
+    )
     
     stats = {
         "total": total,
@@ -1123,13 +1207,9 @@ async def get_comprobantes_historial(
         "rechazados": 0
     }
     
-    for stat in stats_raw:
-        if stat["_id"] == EstadoPago.PENDIENTE:
-            stats["pendientes"] = stat["count"]
-        elif stat["_id"] == EstadoPago.CONFIRMADO:
-            stats["aprobados"] = stat["count"]
-        elif stat["_id"] == EstadoPago.RECHAZADO:
-            stats["rechazados"] = stat["count"]
+    stats["pendientes"] = por_estado.get(EstadoPago.PENDIENTE, 0)
+    stats["aprobados"] = por_estado.get(EstadoPago.CONFIRMADO, 0)
+    stats["rechazados"] = por_estado.get(EstadoPago.RECHAZADO, 0)
     
     return {
         "comprobantes": comprobantes,
@@ -1147,11 +1227,12 @@ async def get_comprobantes_historial(
 
 # Subir comprobante de pago mensualidad (Admin)
 @api_router.post("/comprobante-mensualidad")
+@db_budget(3)
 async def upload_comprobante_mensualidad(
     request: Request, 
     imagen: UploadFile = File(...)
 ):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     
     if current_user.rol != UserRole.ADMIN:
         raise HTTPException(
@@ -1175,10 +1256,7 @@ async def upload_comprobante_mensualidad(
         )
     
     # Buscar pago mensualidad pendiente del admin
-    pago_pendiente = await db.pagos_mensualidad.find_one({
-        "admin_id": current_user.id,
-        "estado": EstadoPago.PENDIENTE
-    })
+    pago_pendiente = await repos.pagos.get_pendiente(current_user.id, fields=SOLO_ID)
     
     if not pago_pendiente:
         raise HTTPException(
@@ -1186,11 +1264,9 @@ async def upload_comprobante_mensualidad(
             detail="No hay pagos pendientes para este administrador"
         )
     
-    # Verificar si ya existe un comprobante para este pago
-    existing_comprobante = await db.comprobantes_pago_mensualidad.find_one({
-        "pago_mensualidad_id": pago_pendiente["id"],
-        "estado": {"$in": [EstadoPago.PENDIENTE, EstadoPago.CONFIRMADO]}
-    })
+    # Verificar si ya existe un comprobante en revisión para este pago
+    # (un comprobante CONFIRMADO de un pago que volvió a PENDIENTE ya no cuenta)
+    existing_comprobante = await repos.comprobantes.get_pendiente_de_pago(pago_pendiente["id"])
     
     if existing_comprobante:
         raise HTTPException(
@@ -1198,29 +1274,55 @@ async def upload_comprobante_mensualidad(
             detail="Ya existe un comprobante para este pago"
         )
     
+    content = await imagen.read()
+    if len(content) > 5 * 1024 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El archivo no puede ser mayor a 5MB"
+        )
+    
+    # Normalizar imagen en el pool de workers (decodificar, quitar EXIF, reducir y re-codificar)
+    try:
+        normalizada = await normalize_image_async(content, image_settings)
+    except InvalidImageError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El archivo no es una imagen válida"
+        )
+    
     # Generar nombre único para el archivo
-    file_extension = imagen.filename.split('.')[-1] if '.' in imagen.filename else 'jpg'
-    unique_filename = f"comprobante_{current_user.id}_{uuid.uuid4()}.{file_extension}"
+    file_stem = f"comprobante_{current_user.id}_{uuid.uuid4()}"
+    unique_filename = f"{file_stem}.{normalizada.extension}"
     file_path = COMPROBANTES_DIR / unique_filename
+    original_path = None
     
     try:
-        # Guardar archivo
-        with open(file_path, "wb") as buffer:
-            content = await imagen.read()
-            buffer.write(content)
+        # Guardar archivo sin bloquear el event loop
+        await asyncio.to_thread(file_path.write_bytes, normalizada.content)
         
         # Crear URL para acceder al archivo
         imagen_url = f"/uploads/comprobantes/{unique_filename}"
+        imagen_original_url = None
+        
+        if image_settings.conservar_original:
+            original_extension = imagen.filename.split('.')[-1] if '.' in imagen.filename else 'jpg'
+            original_filename = f"{file_stem}.{original_extension}"
+            original_path = ORIGINALES_DIR / original_filename
+            await asyncio.to_thread(ORIGINALES_DIR.mkdir, parents=True, exist_ok=True)
+            await asyncio.to_thread(original_path.write_bytes, content)
+            imagen_original_url = f"/uploads/comprobantes/originales/{original_filename}"
         
         # Crear comprobante
         nuevo_comprobante = ComprobantePagoMensualidad(
             pago_mensualidad_id=pago_pendiente["id"],
             admin_id=current_user.id,
-            imagen_url=imagen_url
+            imagen_url=imagen_url,
+            imagen_original_url=imagen_original_url,
+            phash=normalizada.phash
         )
         
-        comprobante_dict = nuevo_comprobante.dict()
-        await db.comprobantes_pago_mensualidad.insert_one(comprobante_dict)
+        await repos.comprobantes.insert(nuevo_comprobante.dict())
+        phash_index.add(nuevo_comprobante.id, int(normalizada.phash, 16))
         
         return {
             "message": "Comprobante subido exitosamente",
@@ -1230,9 +1332,10 @@ async def upload_comprobante_mensualidad(
         }
         
     except Exception as e:
-        # Si hay error, eliminar archivo si se creó
-        if file_path.exists():
-            file_path.unlink()
+        # Si hay error, eliminar archivos si se crearon
+        for path in (file_path, original_path):
+            if path is not None and path.exists():
+                path.unlink()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al guardar archivo: {str(e)}"
@@ -1240,8 +1343,9 @@ async def upload_comprobante_mensualidad(
 
 # Obtener comprobantes del admin (Admin)
 @api_router.get("/admin/mis-comprobantes")
+@db_budget(1)
 async def get_mis_comprobantes(request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     
     if current_user.rol != UserRole.ADMIN:
         raise HTTPException(
@@ -1249,22 +1353,12 @@ async def get_mis_comprobantes(request: Request):
             detail="Solo los administradores pueden ver sus comprobantes"
         )
     
-    # Pipeline para obtener comprobantes con información del pago
-    pipeline = [
-        {"$match": {"admin_id": current_user.id}},
-        {
-            "$lookup": {
-                "from": "pagos_mensualidad",
-                "localField": "pago_mensualidad_id",
-                "foreignField": "id",  
-                "as": "pago"
-            }
-        },
-        {"$unwind": "$pago"},
-        {"$sort": {"created_at": -1}}
-    ]
-    
-    comprobantes = await db.comprobantes_pago_mensualidad.aggregate(pipeline).to_list(100)
+    # Comprobantes con información del pago
+    comprobantes = await repos.comprobantes.del_admin(
+        current_user.id,
+        fields=("id", "imagen_url", "estado", "comentario_superadmin", "fecha_revision", "created_at"),
+        pago_fields=("monto", "mes_año")
+    )
     
     result = []
     for comp in comprobantes:
@@ -1283,8 +1377,9 @@ async def get_mis_comprobantes(request: Request):
 
 # Obtener pago pendiente del admin (Admin)
 @api_router.get("/admin/pago-pendiente")
+@db_budget(3)
 async def get_pago_pendiente(request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     
     if current_user.rol != UserRole.ADMIN:
         raise HTTPException(
@@ -1293,25 +1388,19 @@ async def get_pago_pendiente(request: Request):
         )
     
     # Buscar pago pendiente
-    pago_pendiente = await db.pagos_mensualidad.find_one({
-        "admin_id": current_user.id,
-        "estado": EstadoPago.PENDIENTE
-    })
+    pago_pendiente = await repos.pagos.get_pendiente(
+        current_user.id, fields=("id", "monto", "mes_año", "fecha_vencimiento")
+    )
     
     if not pago_pendiente:
         return {"tiene_pago_pendiente": False}
     
-    # Obtener configuración del Super Admin para el alias bancario
-    config_superadmin = await db.configuracion_superadmin.find_one({})
-    alias_bancario = "No configurado"
-    if config_superadmin:
-        alias_bancario = config_superadmin.get("alias_bancario", "No configurado")
+    # Obtener configuración del Super Admin para el alias bancario (en memoria)
+    config_superadmin = await superadmin_config.get()
+    alias_bancario = config_superadmin.get("alias_bancario", "No configurado")
     
-    # Verificar si ya tiene comprobante
-    comprobante = await db.comprobantes_pago_mensualidad.find_one({
-        "pago_mensualidad_id": pago_pendiente["id"],
-        "estado": {"$in": [EstadoPago.PENDIENTE, EstadoPago.CONFIRMADO]}
-    })
+    # Verificar si ya tiene comprobante en revisión
+    comprobante = await repos.comprobantes.get_pendiente_de_pago(pago_pendiente["id"])
     
     return {
         "tiene_pago_pendiente": True,
@@ -1324,60 +1413,76 @@ async def get_pago_pendiente(request: Request):
         "estado_comprobante": comprobante["estado"] if comprobante else None
     }
 
+async def aprobar_comprobante_en_transaccion(comprobante_id: str, session=None):
+    """Approve a comprobante, confirm its pago and activate the lavadero.
+
+    Idempotent: if the comprobante was already approved (e.g. a retried
+    request) nothing is re-applied, unless the approval ran without a
+    transaction and was cut before confirming its pago; then the pago and
+    lavadero are completed with the values of the original fecha_revision.
+    A comprobante that was rejected is left as is (``conflicto``).
+    """
+    comprobante_doc = await repos.comprobantes.approve(comprobante_id, datetime.now(timezone.utc), session=session)
+    ya_aprobado = comprobante_doc is None
+    if ya_aprobado:
+        # No estaba PENDIENTE: un reintento (ya confirmado), rechazado o inexistente
+        comprobante_doc = await repos.comprobantes.get(comprobante_id, session=session)
+        if not comprobante_doc:
+            return None
+        if comprobante_doc["estado"] != EstadoPago.CONFIRMADO:
+            return {"conflicto": comprobante_doc["estado"]}
+        if session is not None:
+            # En una transacción la aprobación se confirmó junto con el pago y el lavadero
+            return {"ya_aprobado": True}
+    
+    # El pago actualizado trae el lavadero_id, sin volver a leerlo. En un
+    # reintento sólo si el pago sigue PENDIENTE: si ya se había confirmado, el
+    # vencimiento del lavadero no vuelve al de la fecha_revision original
+    pago_doc = await repos.pagos.confirm(
+        comprobante_doc["pago_mensualidad_id"], session=session, only_pending=ya_aprobado
+    )
+    if pago_doc:
+        fecha_revision = comprobante_doc["fecha_revision"]
+        if fecha_revision.tzinfo is None:
+            fecha_revision = fecha_revision.replace(tzinfo=timezone.utc)
+        await repos.lavaderos.update(pago_doc["lavadero_id"], {
+            "estado_operativo": EstadoAdmin.ACTIVO,
+            "fecha_vencimiento": fecha_revision + timedelta(days=30)
+        }, session=session)
+        lavadero_cache.invalidate(lavadero_id=pago_doc["lavadero_id"])
+    
+    return {"ya_aprobado": ya_aprobado}
+
 # Aprobar comprobante (Super Admin)
 @api_router.post("/superadmin/aprobar-comprobante/{comprobante_id}")
+@db_budget(4)  # comprobante, pago, lavadero y el commitTransaction
 async def aprobar_comprobante(comprobante_id: str, request: Request):
     await get_super_admin_user(request)
     
-    # Buscar comprobante
-    comprobante_doc = await db.comprobantes_pago_mensualidad.find_one({"id": comprobante_id})
-    if not comprobante_doc:
+    resultado = await run_in_transaction(
+        lambda session: aprobar_comprobante_en_transaccion(comprobante_id, session)
+    )
+    if resultado is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Comprobante no encontrado"
         )
-    
-    # Actualizar comprobante
-    await db.comprobantes_pago_mensualidad.update_one(
-        {"id": comprobante_id},
-        {
-            "$set": {
-                "estado": EstadoPago.CONFIRMADO,
-                "fecha_revision": datetime.now(timezone.utc),
-                "comentario_superadmin": "Pago confirmado"
-            }
-        }
-    )
-    
-    # Actualizar pago mensualidad
-    await db.pagos_mensualidad.update_one(
-        {"id": comprobante_doc["pago_mensualidad_id"]},
-        {"$set": {"estado": EstadoPago.CONFIRMADO}}
-    )
-    
-    # Buscar y activar lavadero
-    pago_doc = await db.pagos_mensualidad.find_one({"id": comprobante_doc["pago_mensualidad_id"]})
-    if pago_doc:
-        fecha_vencimiento = datetime.now(timezone.utc) + timedelta(days=30)
-        await db.lavaderos.update_one(
-            {"id": pago_doc["lavadero_id"]},
-            {
-                "$set": {
-                    "estado_operativo": EstadoAdmin.ACTIVO,
-                    "fecha_vencimiento": fecha_vencimiento
-                }
-            }
+    if "conflicto" in resultado:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Comprobante ya procesado ({resultado['conflicto']})"
         )
     
     return {"message": "Comprobante aprobado y lavadero activado"}
 
 # Rechazar comprobante (Super Admin)
 @api_router.post("/superadmin/rechazar-comprobante/{comprobante_id}")
+@db_budget(2)
 async def rechazar_comprobante(comprobante_id: str, rechazo_data: RechazarComprobanteRequest, request: Request):
     await get_super_admin_user(request)
     
     # Buscar comprobante
-    comprobante_doc = await db.comprobantes_pago_mensualidad.find_one({"id": comprobante_id})
+    comprobante_doc = await repos.comprobantes.get(comprobante_id)
     if not comprobante_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1385,41 +1490,120 @@ async def rechazar_comprobante(comprobante_id: str, rechazo_data: RechazarCompro
         )
     
     # Actualizar comprobante
-    await db.comprobantes_pago_mensualidad.update_one(
-        {"id": comprobante_id},
-        {
-            "$set": {
-                "estado": EstadoPago.RECHAZADO,
-                "fecha_revision": datetime.now(timezone.utc),
-                "comentario_superadmin": rechazo_data.comentario
-            }
-        }
-    )
+    await repos.comprobantes.reject(comprobante_id, rechazo_data.comentario, datetime.now(timezone.utc))
     
     return {"message": "Comprobante rechazado"}
 
+MAX_COMPROBANTES_POR_LOTE = 1000
+
+# Aprobar/rechazar comprobantes en lote (Super Admin)
+@api_router.post("/superadmin/comprobantes/procesar-lote")
+@db_budget(6)
+async def procesar_comprobantes_lote(lote: ProcesarComprobantesLoteRequest, request: Request):
+    await get_super_admin_user(request)
+    
+    if len(lote.decisiones) > MAX_COMPROBANTES_POR_LOTE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Se pueden procesar hasta {MAX_COMPROBANTES_POR_LOTE} comprobantes por lote"
+        )
+    
+    # Resultados en el orden recibido; "resultados" indexa el primero de cada id
+    items = []
+    resultados = {}
+    decisiones = {}
+    for item in lote.decisiones:
+        resultado = {"comprobante_id": item.comprobante_id, "decision": item.decision, "ok": False}
+        items.append(resultado)
+        if item.comprobante_id in resultados:
+            resultado["error"] = "Comprobante repetido en el lote"
+            continue
+        resultados[item.comprobante_id] = resultado
+        if item.decision not in ("APROBAR", "RECHAZAR"):
+            resultado["error"] = "La decisión debe ser APROBAR o RECHAZAR"
+        elif item.decision == "RECHAZAR" and not (item.comentario or "").strip():
+            resultado["error"] = "El comentario es requerido para rechazar"
+        else:
+            decisiones[item.comprobante_id] = item
+    
+    # Buscar todos los comprobantes del lote en una sola consulta
+    comprobantes = {}
+    if decisiones:
+        comprobantes = await repos.comprobantes.get_many(list(decisiones), fields=("estado", "pago_mensualidad_id"))
+    
+    for comprobante_id in list(decisiones):
+        comprobante_doc = comprobantes.get(comprobante_id)
+        if not comprobante_doc:
+            resultados[comprobante_id]["error"] = "Comprobante no encontrado"
+            del decisiones[comprobante_id]
+        elif comprobante_doc["estado"] != EstadoPago.PENDIENTE:
+            resultados[comprobante_id]["error"] = f"Comprobante ya procesado ({comprobante_doc['estado']})"
+            del decisiones[comprobante_id]
+    
+    # Pagos de los comprobantes aprobados, para saber qué lavaderos activar
+    pago_ids = [
+        comprobantes[comprobante_id]["pago_mensualidad_id"]
+        for comprobante_id, item in decisiones.items()
+        if item.decision == "APROBAR"
+    ]
+    lavadero_por_pago = {}
+    if pago_ids:
+        lavadero_por_pago = await repos.pagos.lavaderos_por_pago(pago_ids)
+    
+    ahora = datetime.now(timezone.utc)
+    fecha_vencimiento = ahora + timedelta(days=30)
+    aprobados = [comprobante_id for comprobante_id, item in decisiones.items() if item.decision == "APROBAR"]
+    rechazados = {
+        comprobante_id: item.comentario.strip()
+        for comprobante_id, item in decisiones.items() if item.decision == "RECHAZAR"
+    }
+    
+    # Una escritura masiva por colección; pagos y lavaderos sólo de los
+    # comprobantes que esta revisión cambió de verdad
+    aplicados = set(await repos.comprobantes.apply_decisions(aprobados, rechazados, ahora, str(uuid.uuid4())))
+    pagos_aprobados = []
+    for comprobante_id, item in decisiones.items():
+        if comprobante_id not in aplicados:
+            # Otra revisión lo procesó después de leerlo
+            resultados[comprobante_id]["error"] = "Comprobante procesado por otra revisión"
+            resultados[comprobante_id]["conflicto"] = True
+            continue
+        if item.decision == "APROBAR":
+            pagos_aprobados.append(comprobantes[comprobante_id]["pago_mensualidad_id"])
+            resultados[comprobante_id]["estado"] = EstadoPago.CONFIRMADO
+        else:
+            resultados[comprobante_id]["estado"] = EstadoPago.RECHAZADO
+        resultados[comprobante_id]["ok"] = True
+    lavaderos_a_activar = [lavadero_por_pago[p] for p in pagos_aprobados if p in lavadero_por_pago]
+    
+    if pagos_aprobados:
+        await repos.pagos.confirm_many(pagos_aprobados)
+    if lavaderos_a_activar:
+        await repos.lavaderos.activate(lavaderos_a_activar, fecha_vencimiento)
+        for lavadero_id in lavaderos_a_activar:
+            lavadero_cache.invalidate(lavadero_id=lavadero_id)
+    
+    return {
+        "procesados": sum(1 for item in items if item["ok"]),
+        "con_error": sum(1 for item in items if not item["ok"]),
+        "conflictos": sum(1 for item in items if item.get("conflicto")),
+        "resultados": items
+    }
+
 # ========== ENDPOINTS DE GESTIÓN DE ADMINS (SUPER ADMIN) ==========
 
 # Ver todos los admins (Super Admin)
-@api_router.get("/superadmin/admins") 
+@api_router.get("/superadmin/admins")
+@db_budget(2)
 async def get_all_admins(request: Request):
     await get_super_admin_user(request)
     
-    # Pipeline para obtener admins con información de sus lavaderos
-    pipeline = [
-        {"$match": {"rol": UserRole.ADMIN}},
-        {
-            "$lookup": {
-                "from": "lavaderos",
-                "localField": "id",
-                "foreignField": "admin_id",
-                "as": "lavadero"
-            }
-        },
-        {"$sort": {"created_at": -1}}
-    ]
-    
-    admins = await db.users.aggregate(pipeline).to_list(1000)
+    # Admins con información de sus lavaderos
+    admins = await repos.users.with_lavadero(
+        UserRole.ADMIN,
+        fields=("id", "nombre", "email", "has_password", "created_at", "is_active", "google_id"),
+        lavadero_fields=("id", "nombre", "estado_operativo", "fecha_vencimiento")
+    )
     
     result = []
     for admin in admins:
@@ -1428,7 +1612,8 @@ async def get_all_admins(request: Request):
             "admin_id": admin["id"],
             "nombre": admin["nombre"],
             "email": admin["email"],
-            "password_hash": admin.get("password_hash", "N/A"),
+            # Nunca el hash: sólo si el admin tiene contraseña
+            "has_password": admin["has_password"],
             "created_at": admin["created_at"],
             "is_active": admin["is_active"],
             "google_id": admin.get("google_id"),
@@ -1450,11 +1635,12 @@ class AdminUpdateRequest(BaseModel):
 
 # Actualizar admin (Super Admin)
 @api_router.put("/superadmin/admins/{admin_id}")
+@db_budget(5)
 async def update_admin(admin_id: str, update_data: AdminUpdateRequest, request: Request):
     await get_super_admin_user(request)
     
     # Verificar que el admin existe
-    admin_doc = await db.users.find_one({"id": admin_id, "rol": UserRole.ADMIN})
+    admin_doc = await repos.users.get_with_rol(admin_id, UserRole.ADMIN, fields=SOLO_ID)
     if not admin_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1467,8 +1653,7 @@ async def update_admin(admin_id: str, update_data: AdminUpdateRequest, request:
         update_fields["nombre"] = update_data.nombre
     if update_data.email is not None:
         # Verificar que el email no esté en uso por otro usuario
-        existing_user = await db.users.find_one({"email": update_data.email, "id": {"$ne": admin_id}})
-        if existing_user:
+        if await repos.users.email_in_use(update_data.email, exclude_id=admin_id):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="El email ya está en uso por otro usuario"
@@ -1486,48 +1671,170 @@ async def update_admin(admin_id: str, update_data: AdminUpdateRequest, request:
         )
     
     # Actualizar admin
-    await db.users.update_one(
-        {"id": admin_id},
-        {"$set": update_fields}
-    )
+    await repos.users.update(admin_id, update_fields)
+    # El token lleva email y estado: los emitidos antes del cambio dejan de valer
+    await token_revocations.revoke(admin_id)
     
     return {"message": "Admin actualizado correctamente"}
 
+class EstadoPurga(str):
+    EN_CURSO = "EN_CURSO"
+    COMPLETADA = "COMPLETADA"
+    ERROR = "ERROR"
+
+class PurgaTomada(Exception):
+    pass
+
+async def ejecutar_purga(purga: dict):
+    """Delete every document owned by an admin, tracking progress in its purga.
+
+    The deletes are independent of each other, so they run concurrently; all
+    of them are idempotent, so an interrupted purge can simply be re-run. The
+    caller must hold the purga (``owner``); the heartbeat is renewed while it
+    runs and every step stops if another worker has taken it over.
+    """
+    purga_id = purga["id"]
+    admin_id = purga["admin_id"]
+    lavadero_id = purga.get("lavadero_id")
+    
+    pasos = {
+        "pagos_mensualidad": lambda: repos.pagos.delete_by_admin(admin_id),
+        "comprobantes_pago_mensualidad": lambda: repos.comprobantes.delete_by_admin(admin_id),
+        "google_sessions": lambda: repos.users.delete_sessions(admin_id),
+    }
+    if lavadero_id:
+        pasos.update({
+            "configuracion_lavadero": lambda: repos.lavaderos.delete_config(lavadero_id),
+            "turnos": lambda: repos.turnos.delete_by_lavadero(lavadero_id),
+            "dias_no_laborales": lambda: repos.lavaderos.delete_dias_no_laborales(lavadero_id),
+        })
+    
+    async def avanzar(fields: dict, inc: Optional[dict] = None):
+        # Cada paso renueva el heartbeat, sólo si la purga sigue siendo nuestra
+        ahora = datetime.now(timezone.utc)
+        if not await repos.purgas.update(
+            purga_id, {**fields, "heartbeat_at": ahora, "actualizado_at": ahora}, inc=inc, owner=WORKER_ID
+        ):
+            raise PurgaTomada(purga_id)
+    
+    async def borrar(coleccion: str, operacion):
+        eliminados = int(await operacion())
+        await avanzar({f"pasos.{coleccion}": eliminados}, inc={"pasos_completados": 1})
+    
+    async def renovar():
+        # Un paso largo (miles de turnos) no debe dejar vencer el lease
+        while True:
+            await asyncio.sleep(PURGA_LEASE_SECONDS / 3)
+            try:
+                if not await repos.purgas.update(purga_id, {"heartbeat_at": datetime.now(timezone.utc)}, owner=WORKER_ID):
+                    return
+            except Exception:
+                logger.exception(f"No se pudo renovar el heartbeat de la purga {purga_id}")
+    
+    renovacion = asyncio.create_task(renovar())
+    try:
+        await avanzar({"estado": EstadoPurga.EN_CURSO, "pasos_totales": len(pasos) + 2, "pasos_completados": 0})
+        await asyncio.gather(*(borrar(coleccion, operacion) for coleccion, operacion in pasos.items()))
+        # El lavadero y el usuario al final, para que la purga siga siendo rastreable
+        await borrar("lavaderos", lambda: repos.lavaderos.delete_by_admin(admin_id))
+        await borrar("users", lambda: repos.users.delete(admin_id))
+        await avanzar({"estado": EstadoPurga.COMPLETADA, "finalizado_at": datetime.now(timezone.utc)})
+    except PurgaTomada:
+        logger.warning(f"La purga {purga_id} la tomó otro worker: se abandona")
+    except Exception as e:
+        logger.exception(f"Error en la purga {purga_id}")
+        await repos.purgas.update(
+            purga_id, {"estado": EstadoPurga.ERROR, "error": str(e), "actualizado_at": datetime.now(timezone.utc)},
+            owner=WORKER_ID
+        )
+    finally:
+        renovacion.cancel()
+
+def lanzar_purga(purga: dict, tareas: set):
+    # Contexto vacío: la purga no es parte del request que la lanzó (ni de su presupuesto de round trips)
+    task = asyncio.create_task(ejecutar_purga(purga), context=contextvars.Context())
+    tareas.add(task)
+    task.add_done_callback(tareas.discard)
+
+async def reanudar_purgas_interrumpidas():
+    """Re-run purges whose worker died mid-way (or failed), claiming each one first"""
+    estados = [EstadoPurga.EN_CURSO, EstadoPurga.ERROR]
+    lease = timedelta(seconds=PURGA_LEASE_SECONDS)
+    for purga_id in await repos.purgas.interrupted(estados, datetime.now(timezone.utc) - lease):
+        # Se reclama con el heartbeat vencido: si otro worker la tomó (o la renovó) entre tanto, no es nuestra
+        ahora = datetime.now(timezone.utc)
+        purga = await repos.purgas.claim(purga_id, WORKER_ID, estados, ahora - lease, ahora)
+        if purga is None:
+            continue
+        logger.info(f"Reanudando purga {purga_id}")
+        await ejecutar_purga(purga)
+
 # Eliminar admin (Super Admin)
-@api_router.delete("/superadmin/admins/{admin_id}")
+@api_router.delete("/superadmin/admins/{admin_id}", status_code=status.HTTP_202_ACCEPTED)
+@db_budget(7)
 async def delete_admin(admin_id: str, request: Request):
     await get_super_admin_user(request)
     
-    # Verificar que el admin existe
-    admin_doc = await db.users.find_one({"id": admin_id, "rol": UserRole.ADMIN})
+    # Verificar que el admin existe y no tiene una purga en curso
+    admin_doc = await repos.users.get_with_rol(admin_id, UserRole.ADMIN, exclude_purging=True, fields=SOLO_ID)
     if not admin_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Admin no encontrado"
         )
     
-    # Buscar y eliminar lavadero asociado
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": admin_id})
-    if lavadero_doc:
-        # Eliminar datos relacionados del lavadero
-        await db.lavaderos.delete_one({"admin_id": admin_id})
-        await db.pagos_mensualidad.delete_many({"admin_id": admin_id})
-        await db.comprobantes_pago_mensualidad.delete_many({"admin_id": admin_id})
-        await db.configuracion_lavadero.delete_many({"lavadero_id": lavadero_doc["id"]})
-        await db.turnos.delete_many({"lavadero_id": lavadero_doc["id"]})
-        await db.dias_no_laborales.delete_many({"lavadero_id": lavadero_doc["id"]})
+    lavadero_doc = await repos.lavaderos.get_by_admin(admin_id, fields=SOLO_ID)
+    ahora = datetime.now(timezone.utc)
+    purga = {
+        "id": str(uuid.uuid4()),
+        "admin_id": admin_id,
+        "lavadero_id": lavadero_doc["id"] if lavadero_doc else None,
+        "estado": EstadoPurga.EN_CURSO,
+        "pasos": {},
+        "owner": WORKER_ID,
+        "heartbeat_at": ahora,
+        "created_at": ahora,
+        "actualizado_at": ahora
+    }
+    await repos.purgas.insert(purga)
+    
+    # Deshabilitar de inmediato: el admin deja de poder entrar y el lavadero de listarse
+    await repos.users.mark_purging(admin_id, purga["id"])
+    await token_revocations.revoke(admin_id)
+    await repos.lavaderos.deactivate_by_admin(admin_id)
+    lavadero_cache.invalidate(admin_id=admin_id)
+    
+    # El borrado en cascada sigue en segundo plano
+    lanzar_purga(purga, request.app.state.background_tasks)
     
-    # Eliminar admin
-    await db.users.delete_one({"id": admin_id})
+    return {
+        "message": "Admin deshabilitado; sus datos se están eliminando en segundo plano",
+        "purga_id": purga["id"]
+    }
+
+# Ver progreso de una purga (Super Admin)
+@api_router.get("/superadmin/purgas/{purga_id}")
+@db_budget(1)
+async def get_purga(purga_id: str, request: Request):
+    await get_super_admin_user(request)
     
-    return {"message": "Admin y todos sus datos asociados eliminados correctamente"}
+    purga = await repos.purgas.get(purga_id)
+    if not purga:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Purga no encontrada"
+        )
+    return purga
 
 # Ver contraseña de admin (Super Admin)
 @api_router.get("/superadmin/admins/{admin_id}/password")
+@db_budget(1)
 async def get_admin_password_info(admin_id: str, request: Request):
     await get_super_admin_user(request)
     
-    admin_doc = await db.users.find_one({"id": admin_id, "rol": UserRole.ADMIN})
+    admin_doc = await repos.users.get_with_rol(
+        admin_id, UserRole.ADMIN, fields=("email", "nombre", "has_password", "google_id")
+    )
     if not admin_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1538,19 +1845,20 @@ async def get_admin_password_info(admin_id: str, request: Request):
         "admin_id": admin_id,
         "email": admin_doc["email"],
         "nombre": admin_doc["nombre"],
-        "has_password": admin_doc.get("password_hash") is not None,
+        "has_password": admin_doc["has_password"],
         "is_google_user": admin_doc.get("google_id") is not None,
         # Por seguridad, no devolvemos el hash completo, solo información
-        "password_info": "Contraseña establecida" if admin_doc.get("password_hash") else "Sin contraseña"
+        "password_info": "Contraseña establecida" if admin_doc["has_password"] else "Sin contraseña"
     }
 
 # Crear admin desde Super Admin (para testing)
 @api_router.post("/superadmin/crear-admin")
+@db_budget(7)
 async def crear_admin_superadmin(admin_data: AdminLavaderoRegister, request: Request):
     await get_super_admin_user(request)
     
     # Check if user already exists
-    existing_user = await get_user_by_email(admin_data.email)
+    existing_user = await repos.users.get_by_email(admin_data.email, fields=SOLO_ID)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -1558,10 +1866,7 @@ async def crear_admin_superadmin(admin_data: AdminLavaderoRegister, request: Req
         )
     
     # Check if lavadero name already exists (case-insensitive)
-    existing_lavadero = await db.lavaderos.find_one({
-        "nombre": {"$regex": f"^{admin_data.lavadero.nombre}$", "$options": "i"}
-    })
-    if existing_lavadero:
+    if await repos.lavaderos.name_exists(admin_data.lavadero.nombre):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Ya existe un lavadero con ese nombre"
@@ -1577,15 +1882,10 @@ async def crear_admin_superadmin(admin_data: AdminLavaderoRegister, request: Req
     )
     
     # Insert admin to database
-    admin_dict = new_admin.dict()
-    await db.users.insert_one(admin_dict)
+    await repos.users.insert(new_admin.dict())
     
     # Guardar credencial en tabla temporal para testing
-    await db.temp_credentials.insert_one({
-        "admin_email": admin_data.email,
-        "password": admin_data.password,
-        "created_at": datetime.now(timezone.utc)
-    })
+    await repos.users.insert_temp_credential(admin_data.email, admin_data.password, datetime.now(timezone.utc))
     
     # Create lavadero
     new_lavadero = Lavadero(
@@ -1597,23 +1897,13 @@ async def crear_admin_superadmin(admin_data: AdminLavaderoRegister, request: Req
     )
     
     # Insert lavadero to database
-    lavadero_dict = new_lavadero.dict()
-    await db.lavaderos.insert_one(lavadero_dict)
+    await repos.lavaderos.insert(new_lavadero.dict())
     
     # Crear pago mensualidad pendiente (igual que en registro normal)
-    # Obtener configuración super admin
-    config_super = await db.configuracion_superadmin.find_one({})
-    if not config_super:
-        # Crear configuración por defecto si no existe
-        default_config = ConfiguracionSuperAdmin(
-            alias_bancario="superadmin.alias.mp",
-            precio_mensualidad=10000.0
-        )
-        await db.configuracion_superadmin.insert_one(default_config.dict())
-        config_super = default_config.dict()
+    # Obtener configuración super admin (en memoria)
+    config_super = await superadmin_config.get()
     
     # Crear pago mensualidad
-    from datetime import timedelta
     fecha_vencimiento = datetime.now(timezone.utc) + timedelta(days=30)
     
     pago_mensualidad = PagoMensualidad(
@@ -1624,7 +1914,7 @@ async def crear_admin_superadmin(admin_data: AdminLavaderoRegister, request: Req
         fecha_vencimiento=fecha_vencimiento
     )
     
-    await db.pagos_mensualidad.insert_one(pago_mensualidad.dict())
+    await repos.pagos.insert(pago_mensualidad.dict())
     
     return {
         "message": "Admin y lavadero creados exitosamente por Super Admin",
@@ -1636,11 +1926,12 @@ async def crear_admin_superadmin(admin_data: AdminLavaderoRegister, request: Req
 
 # Toggle estado de lavadero (Activar/Desactivar) - Super Admin para testing
 @api_router.post("/superadmin/toggle-lavadero/{admin_id}")
+@db_budget(5)
 async def toggle_lavadero_estado(admin_id: str, request: Request):
     await get_super_admin_user(request)
     
     # Buscar admin
-    admin_doc = await db.users.find_one({"id": admin_id, "rol": UserRole.ADMIN})
+    admin_doc = await repos.users.get_with_rol(admin_id, UserRole.ADMIN, fields=SOLO_ID)
     if not admin_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1648,7 +1939,7 @@ async def toggle_lavadero_estado(admin_id: str, request: Request):
         )
     
     # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": admin_id})
+    lavadero_doc = await repos.lavaderos.get_by_admin(admin_id, fields=("id", "estado_operativo"))
     if not lavadero_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1661,76 +1952,52 @@ async def toggle_lavadero_estado(admin_id: str, request: Request):
     if estado_actual == EstadoAdmin.ACTIVO:
         # Desactivar: cambiar a PENDIENTE_APROBACION
         nuevo_estado = EstadoAdmin.PENDIENTE_APROBACION
-        update_data = {
-            "$set": {
-                "estado_operativo": nuevo_estado
-            },
-            "$unset": {
-                "fecha_vencimiento": ""
-            }
-        }
+        campos = {"estado_operativo": nuevo_estado}
+        quitar = ["fecha_vencimiento"]
         message = "Lavadero desactivado - admin debe subir nuevo comprobante para reactivación"
         
-        # Crear nuevo pago PENDIENTE para que el admin pueda subir comprobante
-        config_super = await db.configuracion_superadmin.find_one({})
-        if config_super:
-            # Verificar si ya existe un pago PENDIENTE para este admin en este mes
-            mes_actual = datetime.now().strftime("%Y-%m")
-            pago_pendiente_existente = await db.pagos_mensualidad.find_one({
-                "admin_id": admin_id,
-                "mes_año": mes_actual,
-                "estado": EstadoPago.PENDIENTE
-            })
-            
-            if not pago_pendiente_existente:
-                # Crear nuevo pago PENDIENTE
-                fecha_vencimiento_pendiente = datetime.now(timezone.utc) + timedelta(days=30)
-                nuevo_pago = PagoMensualidad(
-                    admin_id=admin_id,
-                    lavadero_id=lavadero_doc["id"],
-                    monto=config_super.get("precio_mensualidad", 10000.0),
-                    mes_año=mes_actual,
-                    estado=EstadoPago.PENDIENTE,
-                    fecha_vencimiento=fecha_vencimiento_pendiente
-                )
-                await db.pagos_mensualidad.insert_one(nuevo_pago.dict())
-                message += f" - Nuevo pago PENDIENTE creado (${nuevo_pago.monto})"
+        # Dejar el pago del mes en PENDIENTE para que el admin pueda subir comprobante
+        # (upsert: el índice único admin_id + mes_año impide duplicarlo)
+        config_super = await superadmin_config.get()
+        mes_actual = datetime.now().strftime("%Y-%m")
+        nuevo_pago = PagoMensualidad(
+            admin_id=admin_id,
+            lavadero_id=lavadero_doc["id"],
+            monto=config_super.get("precio_mensualidad", 10000.0),
+            mes_año=mes_actual,
+            estado=EstadoPago.PENDIENTE,
+            fecha_vencimiento=datetime.now(timezone.utc) + timedelta(days=30)
+        )
+        cambio = await repos.pagos.reopen_month(nuevo_pago.dict())
+        if cambio == "creado":
+            message += f" - Nuevo pago PENDIENTE creado (${nuevo_pago.monto})"
+        elif cambio == "reabierto":
+            message += f" - El pago de {mes_actual} vuelve a PENDIENTE"
         
     else:
         # Activar: cambiar a ACTIVO
         nuevo_estado = EstadoAdmin.ACTIVO
         fecha_vencimiento = datetime.now(timezone.utc) + timedelta(days=30)
-        update_data = {
-            "$set": {
-                "estado_operativo": nuevo_estado,
-                "fecha_vencimiento": fecha_vencimiento
-            }
-        }
+        campos = {"estado_operativo": nuevo_estado, "fecha_vencimiento": fecha_vencimiento}
+        quitar = []
         message = "Lavadero activado exitosamente (sin proceso de pago)"
         
-        # Crear pago mensualidad como confirmado (simulado) solo al activar
-        config_super = await db.configuracion_superadmin.find_one({})
-        if config_super:
-            # Verificar si ya existe un pago para este mes
-            mes_actual = datetime.now().strftime("%Y-%m")
-            pago_existente = await db.pagos_mensualidad.find_one({
-                "admin_id": admin_id,
-                "mes_año": mes_actual
-            })
-            
-            if not pago_existente:
-                pago_mensualidad = PagoMensualidad(
-                    admin_id=admin_id,
-                    lavadero_id=lavadero_doc["id"],
-                    monto=config_super.get("precio_mensualidad", 10000.0),
-                    mes_año=mes_actual,
-                    estado=EstadoPago.CONFIRMADO,
-                    fecha_vencimiento=fecha_vencimiento
-                )
-                await db.pagos_mensualidad.insert_one(pago_mensualidad.dict())
+        # Crear pago mensualidad como confirmado (simulado) solo si no hay pago este mes
+        config_super = await superadmin_config.get()
+        mes_actual = datetime.now().strftime("%Y-%m")
+        pago_mensualidad = PagoMensualidad(
+            admin_id=admin_id,
+            lavadero_id=lavadero_doc["id"],
+            monto=config_super.get("precio_mensualidad", 10000.0),
+            mes_año=mes_actual,
+            estado=EstadoPago.CONFIRMADO,
+            fecha_vencimiento=fecha_vencimiento
+        )
+        await repos.pagos.ensure_month(pago_mensualidad.dict())
     
     # Actualizar lavadero
-    await db.lavaderos.update_one({"admin_id": admin_id}, update_data)
+    await repos.lavaderos.update_by_admin(admin_id, campos, unset=quitar)
+    lavadero_cache.invalidate(admin_id=admin_id)
     
     response_data = {
         "message": message,
@@ -1743,12 +2010,107 @@ async def toggle_lavadero_estado(admin_id: str, request: Request):
     
     return response_data
 
+# ========== FACTURACIÓN MENSUAL ==========
+
+FACTURACION_BATCH_SIZE = 5000
+
+def siguiente_mes(fecha: datetime) -> str:
+    año, mes = (fecha.year + 1, 1) if fecha.month == 12 else (fecha.year, fecha.month + 1)
+    return f"{año:04d}-{mes:02d}"
+
+class FacturacionNoDisponible(Exception):
+    pass
+
+async def generar_pagos_mensuales(mes_año: str) -> dict:
+    """Create the PENDIENTE pago of ``mes_año`` for every billable lavadero.
+
+    Reruns are no-ops: the unique (admin_id, mes_año) index rejects pagos that
+    already exist, so no per-admin existence check is needed. Without that
+    index it refuses to run.
+
+    Round trips: 2 + 2 per batch of FACTURACION_BATCH_SIZE lavaderos (the
+    index check and the find, then a getMore and an insert per batch).
+    """
+    if not await repos.pagos.unique_month_index_ready():
+        try:
+            await repos.pagos.ensure_unique_month()
+        except Exception as e:
+            raise FacturacionNoDisponible(f"Falta el índice único de pagos por admin y mes: {e}") from e
+    config_super = await superadmin_config.get()
+    monto = config_super.get("precio_mensualidad", 10000.0)
+    año, mes = (int(parte) for parte in mes_año.split("-"))
+    # Vence a los 30 días de iniciado el mes facturado
+    fecha_vencimiento = datetime(año, mes, 1, tzinfo=timezone.utc) + timedelta(days=30)
+    ahora = datetime.now(timezone.utc)
+    
+    # Lavaderos activos o vencidos: ambos deben pagar el mes siguiente
+    lavaderos_facturables = repos.lavaderos.billable(batch_size=FACTURACION_BATCH_SIZE)
+    
+    lotes = 0
+    async def insertar_lote(pagos):
+        nonlocal lotes
+        lotes += 1
+        if lotes > 1:
+            # El presupuesto de la ruta cubre el primer lote
+            extend_budget(2)
+        return await repos.pagos.insert_new(pagos)
+    
+    lavaderos = 0
+    omitidos = 0
+    lote = []
+    async for lavadero in lavaderos_facturables:
+        lavaderos += 1
+        lote.append({
+            "id": str(uuid.uuid4()),
+            "admin_id": lavadero["admin_id"],
+            "lavadero_id": lavadero["id"],
+            "monto": monto,
+            "mes_año": mes_año,
+            "estado": EstadoPago.PENDIENTE,
+            "fecha_vencimiento": fecha_vencimiento,
+            "created_at": ahora
+        })
+        if len(lote) >= FACTURACION_BATCH_SIZE:
+            omitidos += await insertar_lote(lote)
+            lote = []
+    if lote:
+        omitidos += await insertar_lote(lote)
+    
+    resultado = {
+        "mes_año": mes_año,
+        "lavaderos": lavaderos,
+        "creados": lavaderos - omitidos,
+        "omitidos": omitidos
+    }
+    logger.info(f"Facturación mensual: {resultado}")
+    return resultado
+
+# Generar pagos del mes siguiente para todos los lavaderos (Super Admin)
+@api_router.post("/superadmin/facturacion/generar")
+@db_budget(4)  # un lote; generar_pagos_mensuales suma 2 por cada lote extra
+async def generar_facturacion_mensual(request: Request, mes_año: Optional[str] = None):
+    await get_super_admin_user(request)
+    
+    if mes_año is None:
+        mes_año = siguiente_mes(datetime.now(timezone.utc))
+    elif not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", mes_año):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El mes debe tener formato AAAA-MM"
+        )
+    
+    try:
+        return await generar_pagos_mensuales(mes_año)
+    except FacturacionNoDisponible as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
 # ========== ENDPOINTS DE CONFIGURACIÓN DE LAVADERO (ADMIN) ==========
 
 # Obtener configuración del lavadero (Admin)
 @api_router.get("/admin/configuracion")
+@db_budget(2)
 async def get_configuracion_lavadero(request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     
     if current_user.rol != UserRole.ADMIN:
         raise HTTPException(
@@ -1756,16 +2118,14 @@ async def get_configuracion_lavadero(request: Request):
             detail="Solo los administradores pueden acceder a esta configuración"
         )
     
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
+    # Buscar lavadero del admin (caché)
+    entry = await get_lavadero_del_admin(current_user)
+    if not entry:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Lavadero no encontrado"
         )
-    
-    # Buscar configuración existente
-    config_doc = await db.configuracion_lavadero.find_one({"lavadero_id": lavadero_doc["id"]})
+    lavadero_doc, config_doc = entry
     
     if not config_doc:
         # Crear configuración por defecto si no existe
@@ -1790,19 +2150,17 @@ async def get_configuracion_lavadero(request: Request):
             esta_abierto=False
         )
         config_dict = default_config.dict()
-        await db.configuracion_lavadero.insert_one(config_dict)
-        return default_config.dict()
+        await repos.lavaderos.insert_config(config_dict)
+        lavadero_cache.put(lavadero_doc, config_dict)
+        return config_dict
     
-    # Remove MongoDB ObjectId from the document
-    config_dict = dict(config_doc)
-    if '_id' in config_dict:
-        del config_dict['_id']
-    return config_dict
+    return config_doc
 
 # Actualizar configuración del lavadero (Admin)
 @api_router.put("/admin/configuracion")
+@db_budget(2)
 async def update_configuracion_lavadero(config_data: ConfiguracionLavaderoCreate, request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     
     if current_user.rol != UserRole.ADMIN:
         raise HTTPException(
@@ -1810,13 +2168,14 @@ async def update_configuracion_lavadero(config_data: ConfiguracionLavaderoCreate
             detail="Solo los administradores pueden modificar la configuración"
         )
     
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
+    # Buscar lavadero del admin (caché)
+    entry = await get_lavadero_del_admin(current_user)
+    if not entry:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Lavadero no encontrado"
         )
+    lavadero_doc, _ = entry
     
     # Validaciones básicas
     if not (0 <= config_data.duracion_turno_minutos <= 480):  # Max 8 horas
@@ -1832,47 +2191,47 @@ async def update_configuracion_lavadero(config_data: ConfiguracionLavaderoCreate
         )
     
     # Actualizar configuración
-    update_data = {
-        "$set": {
-            "hora_apertura": config_data.hora_apertura,
-            "hora_cierre": config_data.hora_cierre,
-            "duracion_turno_minutos": config_data.duracion_turno_minutos,
-            "dias_laborales": config_data.dias_laborales,
-            "alias_bancario": config_data.alias_bancario,
-            "precio_turno": config_data.precio_turno,
-            # Nuevos campos para tipos de vehículos
-            "servicio_motos": config_data.servicio_motos,
-            "servicio_autos": config_data.servicio_autos,
-            "servicio_camionetas": config_data.servicio_camionetas,
-            "precio_motos": config_data.precio_motos,
-            "precio_autos": config_data.precio_autos,
-            "precio_camionetas": config_data.precio_camionetas,
-            # Ubicación del lavadero
-            "latitud": config_data.latitud,
-            "longitud": config_data.longitud,
-            "direccion_completa": config_data.direccion_completa
-        }
-    }
-    
-    result = await db.configuracion_lavadero.update_one(
-        {"lavadero_id": lavadero_doc["id"]},
-        update_data
+    nueva_config = ConfiguracionLavadero(
+        lavadero_id=lavadero_doc["id"],
+        **config_data.dict()
     )
+    al_crear = {
+        "id": nueva_config.id,
+        "lavadero_id": lavadero_doc["id"],
+        "esta_abierto": nueva_config.esta_abierto,
+        "created_at": nueva_config.created_at
+    }
+    campos = {
+        "hora_apertura": config_data.hora_apertura,
+        "hora_cierre": config_data.hora_cierre,
+        "duracion_turno_minutos": config_data.duracion_turno_minutos,
+        "dias_laborales": config_data.dias_laborales,
+        "alias_bancario": config_data.alias_bancario,
+        "precio_turno": config_data.precio_turno,
+        # Nuevos campos para tipos de vehículos
+        "servicio_motos": config_data.servicio_motos,
+        "servicio_autos": config_data.servicio_autos,
+        "servicio_camionetas": config_data.servicio_camionetas,
+        "precio_motos": config_data.precio_motos,
+        "precio_autos": config_data.precio_autos,
+        "precio_camionetas": config_data.precio_camionetas,
+        # Ubicación del lavadero
+        "latitud": config_data.latitud,
+        "longitud": config_data.longitud,
+        "direccion_completa": config_data.direccion_completa
+    }
     
-    if result.modified_count == 0:
-        # Si no existe configuración, crear nueva
-        nueva_config = ConfiguracionLavadero(
-            lavadero_id=lavadero_doc["id"],
-            **config_data.dict()
-        )
-        await db.configuracion_lavadero.insert_one(nueva_config.dict())
+    # Upsert: crea la configuración si no existía, y write-through a la caché
+    config_actualizada = await repos.lavaderos.upsert_config(lavadero_doc["id"], campos, al_crear)
+    lavadero_cache.put(lavadero_doc, config_actualizada)
     
     return {"message": "Configuración actualizada exitosamente"}
 
 # Obtener días no laborales (Admin)
 @api_router.get("/admin/dias-no-laborales")
+@db_budget(2)
 async def get_dias_no_laborales(request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     
     if current_user.rol != UserRole.ADMIN:
         raise HTTPException(
@@ -1880,32 +2239,23 @@ async def get_dias_no_laborales(request: Request):
             detail="Solo los administradores pueden acceder a esta información"
         )
     
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
+    # Buscar lavadero del admin (caché)
+    entry = await get_lavadero_del_admin(current_user)
+    if not entry:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Lavadero no encontrado"
         )
+    lavadero_doc, _ = entry
     
     # Obtener días no laborales del lavadero
-    dias_cursor = db.dias_no_laborales.find({"lavadero_id": lavadero_doc["id"]})
-    dias = await dias_cursor.to_list(1000)
-    
-    # Convert MongoDB documents to proper format (remove _id field)
-    result = []
-    for dia in dias:
-        dia_dict = dict(dia)
-        if '_id' in dia_dict:
-            del dia_dict['_id']  # Remove MongoDB ObjectId
-        result.append(dia_dict)
-    
-    return result
+    return await repos.lavaderos.list_dias_no_laborales(lavadero_doc["id"])
 
 # Agregar día no laboral (Admin)
 @api_router.post("/admin/dias-no-laborales")
+@db_budget(3)
 async def add_dia_no_laboral(dia_data: DiaNoLaboralCreate, request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     
     if current_user.rol != UserRole.ADMIN:
         raise HTTPException(
@@ -1913,13 +2263,14 @@ async def add_dia_no_laboral(dia_data: DiaNoLaboralCreate, request: Request):
             detail="Solo los administradores pueden agregar días no laborales"
         )
     
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
+    # Buscar lavadero del admin (caché)
+    entry = await get_lavadero_del_admin(current_user)
+    if not entry:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Lavadero no encontrado"
         )
+    lavadero_doc, _ = entry
     
     # Verificar que la fecha no esté en el pasado
     fecha_inicio_dia = dia_data.fecha.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -1930,12 +2281,7 @@ async def add_dia_no_laboral(dia_data: DiaNoLaboralCreate, request: Request):
         )
     
     # Verificar si ya existe ese día
-    existing_dia = await db.dias_no_laborales.find_one({
-        "lavadero_id": lavadero_doc["id"],
-        "fecha": fecha_inicio_dia
-    })
-    
-    if existing_dia:
+    if await repos.lavaderos.dia_no_laboral_exists(lavadero_doc["id"], fecha_inicio_dia):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Este día ya está marcado como no laboral"
@@ -1948,14 +2294,15 @@ async def add_dia_no_laboral(dia_data: DiaNoLaboralCreate, request: Request):
         motivo=dia_data.motivo
     )
     
-    await db.dias_no_laborales.insert_one(nuevo_dia.dict())
+    await repos.lavaderos.insert_dia_no_laboral(nuevo_dia.dict())
     
     return {"message": "Día no laboral agregado exitosamente", "dia": nuevo_dia.dict()}
 
 # Eliminar día no laboral (Admin)
 @api_router.delete("/admin/dias-no-laborales/{dia_id}")
+@db_budget(2)
 async def delete_dia_no_laboral(dia_id: str, request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     
     if current_user.rol != UserRole.ADMIN:
         raise HTTPException(
@@ -1963,21 +2310,17 @@ async def delete_dia_no_laboral(dia_id: str, request: Request):
             detail="Solo los administradores pueden eliminar días no laborales"
         )
     
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
+    # Buscar lavadero del admin (caché)
+    entry = await get_lavadero_del_admin(current_user)
+    if not entry:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Lavadero no encontrado"
         )
+    lavadero_doc, _ = entry
     
     # Eliminar día no laboral
-    result = await db.dias_no_laborales.delete_one({
-        "id": dia_id,
-        "lavadero_id": lavadero_doc["id"]
-    })
-    
-    if result.deleted_count == 0:
+    if not await repos.lavaderos.delete_dia_no_laboral(dia_id, lavadero_doc["id"]):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Día no laboral no encontrado"
@@ -1987,8 +2330,9 @@ async def delete_dia_no_laboral(dia_id: str, request: Request):
 
 # Toggle estado de apertura del lavadero (Admin)
 @api_router.post("/admin/toggle-apertura")
+@db_budget(2)
 async def toggle_apertura_lavadero(request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_current_principal(request)
     
     if current_user.rol != UserRole.ADMIN:
         raise HTTPException(
@@ -1996,30 +2340,24 @@ async def toggle_apertura_lavadero(request: Request):
             detail="Solo los administradores pueden cambiar el estado de apertura"
         )
     
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
+    # Buscar lavadero del admin (caché)
+    entry = await get_lavadero_del_admin(current_user)
+    if not entry:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Lavadero no encontrado"
         )
+    lavadero_doc, config_doc = entry
     
-    # Buscar configuración del lavadero
-    config_doc = await db.configuracion_lavadero.find_one({"lavadero_id": lavadero_doc["id"]})
+    # Toggle atómico en la base (no depende del valor en caché) y write-through
+    config_doc = await repos.lavaderos.toggle_apertura(lavadero_doc["id"])
     if not config_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Configuración del lavadero no encontrada"
         )
-    
-    # Toggle del estado
-    nuevo_estado = not config_doc.get("esta_abierto", False)
-    
-    # Actualizar configuración
-    await db.configuracion_lavadero.update_one(
-        {"lavadero_id": lavadero_doc["id"]},
-        {"$set": {"esta_abierto": nuevo_estado}}
-    )
+    lavadero_cache.put(lavadero_doc, config_doc)
+    nuevo_estado = config_doc["esta_abierto"]
     
     return {
         "message": f"Lavadero {'abierto' if nuevo_estado else 'cerrado'} exitosamente",
@@ -2032,30 +2370,15 @@ async def toggle_apertura_lavadero(request: Request):
 
 # Obtener configuración del Super Admin
 @api_router.get("/superadmin/configuracion")
+@db_budget(1)
 async def get_configuracion_superadmin(request: Request):
     await get_super_admin_user(request)
     
-    # Buscar configuración existente
-    config_doc = await db.configuracion_superadmin.find_one({})
-    
-    if not config_doc:
-        # Crear configuración por defecto si no existe
-        default_config = ConfiguracionSuperAdmin(
-            alias_bancario="superadmin.sistema.mp",
-            precio_mensualidad=10000.0
-        )
-        config_dict = default_config.dict()
-        await db.configuracion_superadmin.insert_one(config_dict)
-        return default_config.dict()
-    
-    # Remove MongoDB ObjectId from the document
-    config_dict = dict(config_doc)
-    if '_id' in config_dict:
-        del config_dict['_id']
-    return config_dict
+    return await superadmin_config.get()
 
 # Actualizar configuración del Super Admin
 @api_router.put("/superadmin/configuracion")
+@db_budget(2)
 async def update_configuracion_superadmin(request: Request, config_data: dict):
     await get_super_admin_user(request)
     
@@ -2082,35 +2405,11 @@ async def update_configuracion_superadmin(request: Request, config_data: dict):
             detail="El precio mensualidad debe ser un número válido mayor a cero"
         )
     
-    # Buscar configuración existente
-    existing_config = await db.configuracion_superadmin.find_one({})
-    
-    update_data = {
-        "$set": {
-            "alias_bancario": config_data["alias_bancario"].strip(),
-            "precio_mensualidad": precio
-        }
-    }
-    
-    if existing_config:
-        # Actualizar configuración existente
-        result = await db.configuracion_superadmin.update_one(
-            {"id": existing_config["id"]},
-            update_data
-        )
-        
-        if result.modified_count == 0:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="No se pudo actualizar la configuración"
-            )
-    else:
-        # Crear nueva configuración si no existe
-        nueva_config = ConfiguracionSuperAdmin(
-            alias_bancario=config_data["alias_bancario"].strip(),
-            precio_mensualidad=precio
-        )
-        await db.configuracion_superadmin.insert_one(nueva_config.dict())
+    # Escribir y actualizar la copia en memoria de este worker
+    await superadmin_config.update({
+        "alias_bancario": config_data["alias_bancario"].strip(),
+        "precio_mensualidad": precio
+    })
     
     return {
         "message": "Configuración actualizada exitosamente",
@@ -2120,6 +2419,7 @@ async def update_configuracion_superadmin(request: Request, config_data: dict):
 
 # Obtener credenciales para testing (Super Admin)
 @api_router.get("/superadmin/credenciales-testing")
+@db_budget(3)
 async def get_credenciales_testing(request: Request):
     await get_super_admin_user(request)
     
@@ -2127,8 +2427,7 @@ async def get_credenciales_testing(request: Request):
     # En producción debería ser removida por seguridad
     
     # Obtener todos los admins
-    admins_cursor = db.users.find({"rol": UserRole.ADMIN})
-    admins = await admins_cursor.to_list(1000)
+    admins = await repos.users.list(rol=UserRole.ADMIN, fields=("email", "nombre", "password_hash"))
     
     # Lista ampliada de contraseñas comunes para testing
     common_passwords = [
@@ -2141,6 +2440,9 @@ async def get_credenciales_testing(request: Request):
         "pass", "pass123", "admin2024", "user123"
     ]
     
+    # Credenciales temporales de todos los admins en una sola consulta
+    temp_credentials = await repos.users.temp_credentials([admin["email"] for admin in admins])
+    
     result = []
     for admin in admins:
         # Para cada admin, probar las contraseñas comunes
@@ -2157,9 +2459,8 @@ async def get_credenciales_testing(request: Request):
                     continue
         
         # También verificar si hay una entrada en la tabla temporal de credenciales
-        temp_cred = await db.temp_credentials.find_one({"admin_email": admin["email"]})
-        if temp_cred:
-            plain_password = temp_cred["password"]
+        if admin["email"] in temp_credentials:
+            plain_password = temp_credentials[admin["email"]]
         
         result.append({
             "email": admin["email"],
@@ -2171,6 +2472,7 @@ async def get_credenciales_testing(request: Request):
 
 # Endpoint específico para servir imágenes de comprobantes
 @api_router.get("/uploads/comprobantes/{filename}")
+@db_budget(0)
 async def get_comprobante_image(filename: str):
     file_path = COMPROBANTES_DIR / filename
     if not file_path.exists():
@@ -2192,25 +2494,158 @@ async def get_comprobante_image(filename: str):
     
     return Response(content, media_type=content_type)
 
+# Estadísticas de las cachés en memoria de este worker (Super Admin)
+@api_router.get("/superadmin/cache-stats")
+@db_budget(0)
+async def get_cache_stats(request: Request):
+    await get_super_admin_user(request)
+    return {"lavaderos": lavadero_cache.stats()}
+
+# Perfiles de requests capturados con X-Profile-Request (Super Admin)
+@api_router.get("/superadmin/perfiles")
+@db_budget(1)
+async def get_perfiles(request: Request):
+    await get_super_admin_user(request)
+    return await repos.perfiles.list()
+
+# Descargar un perfil en formato speedscope (Super Admin)
+@api_router.get("/superadmin/perfiles/{perfil_id}")
+@db_budget(1)
+async def get_perfil(perfil_id: str, request: Request):
+    await get_super_admin_user(request)
+    speedscope = await repos.perfiles.get_speedscope(perfil_id)
+    if speedscope is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Perfil no encontrado"
+        )
+    return Response(
+        content=speedscope,
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="{perfil_id}.speedscope.json"'}
+    )
+
+# Formas de consulta que más tiempo acumulan en el log de consultas lentas (Super Admin)
+@api_router.get("/superadmin/slow-queries")
+@db_budget(2)
+async def get_slow_queries(request: Request, limit: int = 20):
+    await get_super_admin_user(request)
+    limit = max(1, min(limit, 100))
+    
+    top = await slow_query_log.collection.aggregate([
+        {"$group": {
+            "_id": "$shape",
+            "coleccion": {"$first": "$coleccion"},
+            "veces": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "max_ms": {"$max": "$duration_ms"},
+            "ultima_vez": {"$max": "$ts"},
+            "requests": {"$addToSet": "$request"}
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": limit}
+    ]).to_list(limit)
+    
+    # El explain más reciente de cada forma, en una sola consulta
+    shapes = [t["_id"] for t in top]
+    explains = {}
+    async for doc in slow_query_log.collection.find(
+        {"shape": {"$in": shapes}, "explain": {"$ne": None}},
+        {"_id": 0, "shape": 1, "explain": 1}
+    ).sort("ts", -1):
+        explains.setdefault(doc["shape"], doc["explain"])
+    
+    return [
+        {
+            "shape": t["_id"],
+            "coleccion": t["coleccion"],
+            "veces": t["veces"],
+            "total_ms": round(t["total_ms"], 3),
+            "promedio_ms": round(t["total_ms"] / t["veces"], 3),
+            "max_ms": t["max_ms"],
+            "ultima_vez": t["ultima_vez"],
+            "requests": [r for r in t["requests"] if r][:10],
+            "explain": explains.get(t["_id"])
+        }
+        for t in top
+    ]
+
 # Health check
 @api_router.get("/health")
+@db_budget(0)
 async def health_check():
     return {"status": "ok", "message": "Sistema de gestión de lavaderos funcionando"}
 
-# Include router
-app.include_router(api_router)
+# Liveness: el proceso responde; no depende de Mongo para no reiniciar workers sanos
+@api_router.get("/health/live")
+@db_budget(0)
+async def liveness():
+    return {"status": "ok"}
+
+async def comprobar_readiness() -> dict:
+    mongo, uploads = await asyncio.gather(mongo_pinger.ping(), storage_writable(COMPROBANTES_DIR))
+    # Sin el índice de hashes cargado no se marcarían los comprobantes duplicados
+    indice_phash = {"ok": phash_sync.cargado, "imagenes": len(phash_index)}
+    loop = asyncio.get_running_loop()
+    return {
+        "ready": mongo["ok"] and uploads["ok"] and indice_phash["ok"],
+        "checks": {"mongo": mongo, "uploads": uploads, "indice_phash": indice_phash},
+        "mongo_pool": {**pool_stats.snapshot(), "max_size": client.options.pool_options.max_pool_size},
+        "event_loop_lag_ms": round(loop_monitor.last_lag * 1000, 2),
+        "executor_queue": {
+            "motor": executor_queue_depth(getattr(motor_framework, "_EXECUTOR", None)),
+            "default": executor_queue_depth(getattr(loop, "_default_executor", None)),
+            "imagenes": image_pool_pending()
+        },
+        "checked_at": datetime.now(timezone.utc).isoformat()
+    }
+
+# Cacheado ~1 s: las probes del balanceador no llegan a Mongo en cada llamada
+readiness = CachedCheck(comprobar_readiness, ttl=float(os.environ.get("READINESS_CACHE_SECONDS", 1)))
+
+# Readiness: 503 si Mongo no responde a tiempo, no se puede escribir en uploads
+# o el índice de hashes de comprobantes todavía no se cargó
+@api_router.get("/health/ready")
+@db_budget(1)
+async def readiness_check():
+    resultado = await readiness.get()
+    return JSONResponse(
+        content=resultado,
+        status_code=status.HTTP_200_OK if resultado["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+# Profiler por request, sólo para super admins que envían X-Profile-Request
+async def puede_perfilar(scope) -> bool:
+    try:
+        principal = await get_current_principal(Request(scope))
+    except HTTPException:
+        return False
+    return principal.rol == UserRole.SUPER_ADMIN
 
-# CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
+async def guardar_perfil(perfil: dict):
+    try:
+        await repos.perfiles.insert({
+            **perfil,
+            # Como texto: el formato speedscope usa claves con "$"
+            "speedscope": json.dumps(perfil["speedscope"]),
+            "created_at": datetime.now(timezone.utc)
+        })
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el perfil {perfil['id']}: {e}")
+
+LAVADERO_CACHE_METRICS = metrics_registry.gauge(
+    "lavadero_cache", "Estado de la caché de lavaderos (size, hits, misses, evictions)", ("stat",)
 )
 
-# Mount static files DESPUÉS de CORS
-app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
+def actualizar_metricas_cache():
+    stats = lavadero_cache.stats()
+    for stat in ("size", "hits", "misses", "evictions"):
+        LAVADERO_CACHE_METRICS.set((stat,), stats[stat])
+
+metrics_registry.add_collector(actualizar_metricas_cache)
+
+async def metrics():
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 # Configure logging
 logging.basicConfig(
@@ -2219,6 +2654,190 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def marcar_lavaderos_vencidos():
+    """Move every active lavadero past its fecha_vencimiento to VENCIDO"""
+    vencidos = await repos.lavaderos.expire(datetime.now(timezone.utc))
+    if vencidos:
+        lavadero_cache.clear()
+        logger.info(f"Lavaderos marcados como vencidos: {vencidos}")
+
+INDICES = [
+    # Barrido de vencimientos: una sola consulta indexada por tick
+    ("lavaderos", [("estado_operativo", 1), ("fecha_vencimiento", 1)], {}),
+    # Lavadero de un admin y chequeo de propiedad resuelto sólo con el índice
+    ("lavaderos", [("admin_id", 1), ("id", 1)], {}),
+    ("dias_no_laborales", [("lavadero_id", 1), ("fecha", 1)], {}),
+    # Purgas de admins: búsqueda por id y reanudación de las interrumpidas
+    ("purgas", [("id", 1)], {"unique": True}),
+    ("purgas", [("estado", 1), ("heartbeat_at", 1)], {}),
+    # Revocaciones de tokens: se borran solas cuando ya no queda token que revocar
+    ("token_revocations", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ("token_revocations", [("updated_at", 1)], {}),
+    # Sesiones de Google: se borran solas al vencer, un documento por token y
+    # búsqueda de sesión resuelta sólo con el índice
+    ("google_sessions", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ("google_sessions", [("session_token", 1)], {"unique": True}),
+    ("google_sessions", [("session_token", 1), ("expires_at", 1), ("user_id", 1)], {}),
+    # Estadísticas del dashboard: turnos por estado y comprobantes de cada turno
+    ("turnos", [("lavadero_id", 1), ("estado", 1)], {}),
+    ("turnos", [("cliente_id", 1), ("estado", 1)], {}),
+    ("comprobantes_pago", [("turno_id", 1), ("estado", 1)], {}),
+    # Sincronización del índice de hashes: comprobantes subidos desde la última pasada
+    ("comprobantes_pago_mensualidad", [("created_at", 1)], {}),
+    # Perfiles de requests: se conservan una semana
+    ("perfiles", [("id", 1)], {"unique": True}),
+    ("perfiles", [("created_at", 1)], {"expireAfterSeconds": 7 * 24 * 3600}),
+]
+
+async def ensure_indexes():
+    async def crear(coleccion, claves, opciones):
+        try:
+            await db[coleccion].create_index(claves, **opciones)
+        except Exception as e:
+            logger.error(f"No se pudo crear el índice {claves} en {coleccion}: {e}")
+    async def pago_unico_por_mes():
+        # Un pago por admin y mes: hace idempotente la facturación mensual. Si
+        # hay duplicados de antes del índice se fusionan y se vuelve a intentar
+        try:
+            eliminados = await repos.pagos.ensure_unique_month()
+            if eliminados:
+                logger.warning(f"Se eliminaron {eliminados} pagos duplicados para crear el índice único")
+        except Exception as e:
+            logger.error(f"No se pudo crear el índice único de pagos (la facturación no va a correr): {e}")
+    # Independientes entre sí: en paralelo, el arranque no paga un round trip por índice
+    await asyncio.gather(pago_unico_por_mes(), *(crear(*indice) for indice in INDICES))
+
+SHUTDOWN_TIMEOUT_SECONDS = float(os.environ.get("SHUTDOWN_TIMEOUT_SECONDS", 10))
+
+def iniciar_tareas_de_fondo(con_mongo: bool = True) -> set:
+    """Start the schedulers and watchers every worker runs.
+
+    Without MongoDB (``con_mongo=False``) only the tasks that do not need it
+    run: there are no leases, slow-query log or superadmin change stream.
+    """
+    tareas = {
+        loop_monitor.start(),
+        asyncio.create_task(phash_sync.run()),
+        asyncio.create_task(token_revocations.poll()),
+    }
+    if not con_mongo:
+        return tareas
+    # El lease dura dos ticks para que el worker que lo tiene lo renueve antes de perderlo
+    vencimientos_lease = MongoLease(
+        db, "vencimiento_lavaderos", timedelta(seconds=2 * VENCIMIENTO_SWEEP_INTERVAL_SECONDS)
+    )
+    # Cada purga se reclama por separado: este lease sólo evita que todos los workers las busquen a la vez
+    purgas_lease = MongoLease(db, "purgas_interrumpidas", timedelta(minutes=10))
+    return tareas | {
+        asyncio.create_task(superadmin_config.watch()),
+        asyncio.create_task(slow_query_log.run()),
+        asyncio.create_task(run_periodic(
+            "purgas_interrumpidas", 300, reanudar_purgas_interrumpidas, purgas_lease
+        )),
+        asyncio.create_task(run_periodic(
+            "vencimiento_lavaderos",
+            VENCIMIENTO_SWEEP_INTERVAL_SECONDS,
+            marcar_lavaderos_vencidos,
+            vencimientos_lease
+        ))
+    }
+
+async def _medir(fases: dict, nombre: str, paso):
+    """Await ``paso``, logging its failure instead of aborting startup, and time it"""
+    inicio = time.perf_counter()
+    try:
+        await paso
+    except Exception as e:
+        logger.error(f"Arranque: falló {nombre}: {e}")
+    fases[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    inicio = time.perf_counter()
+    fases = {}
+    await _medir(fases, "uploads", asyncio.to_thread(COMPROBANTES_DIR.mkdir, parents=True, exist_ok=True))
+    conectar()
+    if app.state.repositorios is not None:
+        usar_repositorios(app.state.repositorios)
+    # Con repositorios en memoria no hay Mongo: ni índices, ni leases, ni log de consultas lentas
+    con_mongo = isinstance(repos, MongoRepositories)
+    if con_mongo:
+        slow_query_log.bind(db, asyncio.get_running_loop())
+        # Índices y cachés no dependen entre sí: se preparan en paralelo
+        await asyncio.gather(
+            _medir(fases, "indices", ensure_indexes()),
+            _medir(fases, "superadmin_config", superadmin_config.load()),
+            _medir(fases, "slow_queries", slow_query_log.ensure_collection()),
+            _medir(fases, "token_revocations", token_revocations.load()),
+        )
+    else:
+        superadmin_config.load_default()
+    app.state.background_tasks = iniciar_tareas_de_fondo(con_mongo)
+    app.state.arranque = {"total_ms": round((time.perf_counter() - inicio) * 1000, 1), "fases": fases}
+    logger.info(f"Arranque en {app.state.arranque['total_ms']} ms: {fases}")
+    try:
+        yield
+    finally:
+        inicio = time.perf_counter()
+        # Cancelar y esperar: las purgas cortadas se reanudan en otro arranque
+        tareas = list(app.state.background_tasks)
+        for task in tareas:
+            task.cancel()
+        if tareas:
+            _, pendientes = await asyncio.wait(tareas, timeout=SHUTDOWN_TIMEOUT_SECONDS)
+            if pendientes:
+                logger.warning(f"Apagado: {len(pendientes)} tareas no terminaron en {SHUTDOWN_TIMEOUT_SECONDS} s")
+        loop_monitor.stop()
+        await auth_client.aclose()
+        client.close()
+        shutdown_image_pool()
+        logger.info(f"Apagado en {round((time.perf_counter() - inicio) * 1000, 1)} ms")
+
+def create_app(repositorios=None) -> FastAPI:
+    """Build the ASGI app; the database and background work live in its lifespan.
+
+    ``repositorios`` replaces the Mongo repositories (e.g. MemoryRepositories).
+    """
+    app = FastAPI(title="Demo Authentication API", lifespan=lifespan)
+    app.state.repositorios = repositorios
+    app.state.background_tasks = set()
+    app.include_router(api_router)
+    
+    # CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Ruta de cada tarea de request, para nombrarla cuando bloquea el event loop
+    app.add_middleware(RequestTaskMiddleware)
+    
+    app.add_middleware(
+        ProfilingMiddleware,
+        authorize=puede_perfilar,
+        save=guardar_perfil,
+        interval=float(os.environ.get("PROFILER_INTERVAL_MS", 1)) / 1000
+    )
+    
+    # Round trips a Mongo por request (dentro de las métricas, para que cuente su tiempo)
+    app.add_middleware(
+        DbTracingMiddleware,
+        debug_headers=DEBUG,
+        slow_request_ms=SLOW_REQUEST_MS,
+        repeated_query_threshold=REPEATED_QUERY_THRESHOLD
+    )
+    
+    # Métricas por ruta: agregado al final para que envuelva también a CORS
+    app.add_middleware(MetricsMiddleware)
+    
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+    
+    # Mount static files DESPUÉS de CORS (el directorio se crea en el lifespan)
+    app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR), check_dir=False), name="uploads")
+    return app
+
+# uvicorn server:app (o --factory server:create_app)
+app = create_app()
@@ -0,0 +1,177 @@
+"""Registro de consultas lentas de MongoDB con su plan de ejecución.
+
+``SlowQueryLog`` es un CommandListener: cuando un comando supera el umbral
+encola su forma (ver ``db_tracing.command_shape``), colección, duración y
+request de origen. Una tarea de fondo corre ``explain`` con
+``executionStats`` sobre el mismo comando, como mucho una vez por forma
+cada ``explain_interval`` segundos, y guarda el registro en una colección
+capped, así que el espacio que ocupa el log está acotado.
+
+El listener corre en los hilos del executor de Motor: nunca hace I/O, sólo
+pasa el registro al event loop.
+"""
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Dict, Optional, Tuple
+import asyncio
+import logging
+import threading
+
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid
+
+from db_tracing import command_shape, current_stats
+
+logger = logging.getLogger(__name__)
+
+COMANDOS_EXPLICABLES = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+# Campos de sesión/transporte que explain no acepta dentro del comando
+CAMPOS_DE_SESION = {"lsid", "txnNumber", "autocommit", "startTransaction"}
+
+
+def _plan_stages(plan) -> list:
+    etapas = []
+    while isinstance(plan, dict):
+        if "stage" in plan:
+            etapas.append(plan["stage"])
+        if "inputStages" in plan:
+            for hijo in plan["inputStages"]:
+                etapas.extend(_plan_stages(hijo))
+            break
+        plan = plan.get("inputStage") or plan.get("queryPlan")
+    return etapas
+
+
+def _buscar(doc, clave):
+    """First value under ``clave`` anywhere in an explain document"""
+    if isinstance(doc, dict):
+        if clave in doc:
+            return doc[clave]
+        hijos = doc.values()
+    elif isinstance(doc, list):
+        hijos = doc
+    else:
+        return None
+    for hijo in hijos:
+        encontrado = _buscar(hijo, clave)
+        if encontrado is not None:
+            return encontrado
+    return None
+
+
+def summarize_explain(explain: dict) -> dict:
+    """Keep what matters for triage: plan stages and examined vs returned"""
+    stats = _buscar(explain, "executionStats") or {}
+    winning = _buscar(explain, "winningPlan") or {}
+    return {
+        "plan": _plan_stages(winning),
+        "executionTimeMillis": stats.get("executionTimeMillis"),
+        "totalKeysExamined": stats.get("totalKeysExamined"),
+        "totalDocsExamined": stats.get("totalDocsExamined"),
+        "nReturned": stats.get("nReturned"),
+    }
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    def __init__(self, threshold_ms: float = 100, collection_name: str = "slow_queries",
+                 size_bytes: int = 16 * 1024 * 1024, explain_interval: float = 300, queue_size: int = 1000):
+        self.threshold_ms = threshold_ms
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self.explain_interval = explain_interval
+        self.queue_size = queue_size
+        self.db = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._lock = threading.Lock()
+        self._comandos: Dict[int, Tuple[str, dict, Optional[str]]] = {}
+        self._ultimo_explain: Dict[str, float] = {}
+        self.descartados = 0
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    def bind(self, db, loop: asyncio.AbstractEventLoop):
+        self.db = db
+        self._loop = loop
+        self._queue = asyncio.Queue(self.queue_size)
+
+    async def ensure_collection(self):
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass  # ya existe
+        await self.collection.create_index([("shape", 1), ("ts", -1)])
+
+    # --- CommandListener (hilos del executor) ---
+
+    def _propio(self, event) -> bool:
+        return event.command_name == "explain" or event.command.get(event.command_name) == self.collection_name
+
+    def started(self, event):
+        if self._loop is None or event.command_name not in COMANDOS_EXPLICABLES or self._propio(event):
+            return
+        stats = current_stats()
+        with self._lock:
+            self._comandos[event.request_id] = (event.database_name, event.command, stats.label if stats else None)
+
+    def succeeded(self, event):
+        with self._lock:
+            pendiente = self._comandos.pop(event.request_id, None)
+        if pendiente is None:
+            return
+        duracion_ms = event.duration_micros / 1000
+        if duracion_ms < self.threshold_ms:
+            return
+        database, comando, origen = pendiente
+        shape = command_shape(event.command_name, comando)
+        ahora = monotonic()
+        with self._lock:
+            explicar = ahora - self._ultimo_explain.get(shape, float("-inf")) >= self.explain_interval
+            if explicar:
+                self._ultimo_explain[shape] = ahora
+        registro = {
+            "ts": datetime.now(timezone.utc),
+            "shape": shape,
+            "coleccion": comando.get(event.command_name),
+            "comando": event.command_name,
+            "duration_ms": round(duracion_ms, 3),
+            "request": origen,
+            "explain": None,
+        }
+        item = (registro, (database, comando) if explicar else None)
+        self._loop.call_soon_threadsafe(self._encolar, item)
+
+    def failed(self, event):
+        with self._lock:
+            self._comandos.pop(event.request_id, None)
+
+    def _encolar(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.descartados += 1
+
+    # --- Tarea de fondo (event loop) ---
+
+    async def _explain(self, database: str, comando: dict) -> dict:
+        limpio = {k: v for k, v in comando.items() if not k.startswith("$") and k not in CAMPOS_DE_SESION}
+        explain = await self.db.client[database].command(
+            {"explain": limpio, "verbosity": "executionStats"}
+        )
+        return summarize_explain(explain)
+
+    async def run(self):
+        while True:
+            registro, explicar = await self._queue.get()
+            if explicar is not None:
+                try:
+                    registro["explain"] = await self._explain(*explicar)
+                except Exception as e:
+                    registro["explain_error"] = str(e)
+            try:
+                await self.collection.insert_one(registro)
+            except Exception as e:
+                logger.warning(f"No se pudo guardar la consulta lenta {registro['shape']}: {e}")
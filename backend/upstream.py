@@ -0,0 +1,137 @@
+"""Cliente HTTP asíncrono para servicios externos (p. ej. el de autenticación).
+
+Un ``httpx.AsyncClient`` por servicio, compartido por todos los requests:
+pool de conexiones con keep-alive, un presupuesto de tiempo por llamada que
+incluye la espera por un lugar en el semáforo de concurrencia, y un circuit
+breaker que, tras varias fallas seguidas, corta las llamadas durante
+``reset_timeout`` segundos en lugar de hacer esperar a cada request.
+"""
+from time import monotonic
+from typing import Optional
+import asyncio
+import logging
+
+import httpx
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "upstream_requests_total", "Llamadas a servicios externos por resultado", ("upstream", "result")
+)
+
+
+class UpstreamError(Exception):
+    """The upstream call failed or returned a server error"""
+
+
+class UpstreamTimeout(UpstreamError):
+    """The call did not finish within its time budget"""
+
+
+class CircuitOpenError(UpstreamError):
+    """The circuit breaker is open: the upstream is not being called"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # Inicio de la llamada de prueba en curso (medio abierto)
+        self.trial_started_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        estado = self.state
+        if estado != "half-open":
+            return estado == "closed"
+        # Medio abierto: pasa una sola llamada de prueba a la vez; si falla, vuelve a abrirse.
+        # Una prueba que no terminó en reset_timeout (cancelada) deja lugar a otra
+        ahora = monotonic()
+        if self.trial_started_at is not None and ahora - self.trial_started_at < self.reset_timeout:
+            return False
+        self.trial_started_at = ahora
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_started_at = None
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = monotonic()
+
+
+class UpstreamClient:
+    def __init__(self, nombre: str, base_url: str, timeout: float = 5, max_connections: int = 20,
+                 max_concurrency: int = 20, breaker: Optional[CircuitBreaker] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.nombre = nombre
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.breaker = breaker or CircuitBreaker()
+        self.transport = transport
+        self._semaforo = asyncio.Semaphore(max_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                transport=self.transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self._semaforo:
+            return await self.client.request(method, url, **kwargs)
+
+    async def request(self, method: str, url: str, budget: Optional[float] = None, **kwargs) -> httpx.Response:
+        """Call the upstream within ``budget`` seconds (default: the client timeout)"""
+        if not self.breaker.allow():
+            UPSTREAM_REQUESTS.inc((self.nombre, "circuit_open"))
+            raise CircuitOpenError(f"{self.nombre}: circuito abierto")
+        try:
+            response = await asyncio.wait_for(self._request(method, url, **kwargs), budget or self.timeout)
+        except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+            self.breaker.record_failure()
+            UPSTREAM_REQUESTS.inc((self.nombre, "timeout"))
+            raise UpstreamTimeout(f"{self.nombre}: sin respuesta en {budget or self.timeout} s") from e
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            UPSTREAM_REQUESTS.inc((self.nombre, "error"))
+            raise UpstreamError(f"{self.nombre}: {e}") from e
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            UPSTREAM_REQUESTS.inc((self.nombre, "error"))
+            raise UpstreamError(f"{self.nombre}: respondió {response.status_code}")
+        self.breaker.record_success()
+        UPSTREAM_REQUESTS.inc((self.nombre, "ok"))
+        return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
@@ -0,0 +1,63 @@
+"""
+Utilidades compartidas por los benchmarks: rutas, variables de entorno del
+backend y un contador de comandos de MongoDB (round trips).
+"""
+import sys
+import threading
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT_DIR / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+load_dotenv(BACKEND_DIR / ".env")
+
+# Comandos internos del driver que no cuentan como consultas de la aplicación
+COMANDOS_IGNORADOS = {"hello", "ismaster", "isMaster", "endSessions", "saslStart", "saslContinue", "ping"}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands and the time spent on them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.commands = 0
+            self.duration_ms = 0.0
+            self.by_name = {}
+
+    def started(self, event):
+        if event.command_name in COMANDOS_IGNORADOS:
+            return
+        with self._lock:
+            self.commands += 1
+            self.by_name[event.command_name] = self.by_name.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        if event.command_name in COMANDOS_IGNORADOS:
+            return
+        with self._lock:
+            self.duration_ms += event.duration_micros / 1000
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+def install_counter() -> CommandCounter:
+    """Register a global counter; must run before any MongoClient is created"""
+    counter = CommandCounter()
+    monitoring.register(counter)
+    return counter
+
+
+def percentile(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
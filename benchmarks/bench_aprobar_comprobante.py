@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark de aprobación de comprobantes: flujo anterior (5 llamadas
+secuenciales, sin transacción) contra aprobar_comprobante_en_transaccion.
+Reporta latencia y round trips a Mongo por aprobación.
+
+Necesita MONGO_URL y DB_NAME (backend/.env). Crea y borra sus propios datos.
+
+Uso: python benchmarks/bench_aprobar_comprobante.py [--n 200]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from _common import install_counter, percentile
+
+counter = install_counter()
+
+import server  # noqa: E402
+from server import EstadoAdmin, EstadoPago  # noqa: E402
+
+# Sin lifespan: el cliente de Mongo se abre a mano
+db = server.conectar()
+
+PREFIJO = "bench-aprobacion-"
+
+
+async def aprobar_comprobante_anterior(comprobante_id: str):
+    """Copy of the original handler body, kept as the baseline"""
+    comprobante_doc = await db.comprobantes_pago_mensualidad.find_one({"id": comprobante_id})
+    await db.comprobantes_pago_mensualidad.update_one(
+        {"id": comprobante_id},
+        {"$set": {
+            "estado": EstadoPago.CONFIRMADO,
+            "fecha_revision": datetime.now(timezone.utc),
+            "comentario_superadmin": "Pago confirmado"
+        }}
+    )
+    await db.pagos_mensualidad.update_one(
+        {"id": comprobante_doc["pago_mensualidad_id"]},
+        {"$set": {"estado": EstadoPago.CONFIRMADO}}
+    )
+    pago_doc = await db.pagos_mensualidad.find_one({"id": comprobante_doc["pago_mensualidad_id"]})
+    if pago_doc:
+        await db.lavaderos.update_one(
+            {"id": pago_doc["lavadero_id"]},
+            {"$set": {
+                "estado_operativo": EstadoAdmin.ACTIVO,
+                "fecha_vencimiento": datetime.now(timezone.utc) + timedelta(days=30)
+            }}
+        )
+
+
+async def aprobar_comprobante_nuevo(comprobante_id: str):
+    await server.run_in_transaction(
+        lambda session: server.aprobar_comprobante_en_transaccion(comprobante_id, session)
+    )
+
+
+async def sembrar(n: int):
+    ahora = datetime.now(timezone.utc)
+    lavaderos, pagos, comprobantes = [], [], []
+    for _ in range(n):
+        admin_id, lavadero_id, pago_id = (PREFIJO + str(uuid.uuid4()) for _ in range(3))
+        lavaderos.append({"id": lavadero_id, "admin_id": admin_id, "nombre": lavadero_id, "direccion": "-",
+                          "estado_operativo": EstadoAdmin.PENDIENTE_APROBACION, "is_active": True, "created_at": ahora})
+        pagos.append({"id": pago_id, "admin_id": admin_id, "lavadero_id": lavadero_id, "monto": 10000.0,
+                      "mes_año": ahora.strftime("%Y-%m"), "estado": EstadoPago.PENDIENTE,
+                      "fecha_vencimiento": ahora + timedelta(days=30), "created_at": ahora})
+        comprobantes.append({"id": PREFIJO + str(uuid.uuid4()), "pago_mensualidad_id": pago_id, "admin_id": admin_id,
+                             "imagen_url": "/uploads/comprobantes/bench.webp", "estado": EstadoPago.PENDIENTE,
+                             "created_at": ahora})
+    await db.lavaderos.insert_many(lavaderos)
+    await db.pagos_mensualidad.insert_many(pagos)
+    await db.comprobantes_pago_mensualidad.insert_many(comprobantes)
+    return [c["id"] for c in comprobantes]
+
+
+async def limpiar():
+    filtro = {"id": {"$regex": f"^{PREFIJO}"}}
+    await db.lavaderos.delete_many(filtro)
+    await db.pagos_mensualidad.delete_many(filtro)
+    await db.comprobantes_pago_mensualidad.delete_many(filtro)
+
+
+async def medir(nombre, funcion, ids):
+    latencias, round_trips = [], []
+    for comprobante_id in ids:
+        counter.reset()
+        inicio = time.perf_counter()
+        await funcion(comprobante_id)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        round_trips.append(counter.commands)
+    print(f"{nombre:<10} p50={statistics.median(latencias):6.2f} ms  p95={percentile(latencias, 95):6.2f} ms  "
+          f"round trips={statistics.mean(round_trips):.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200)
+    args = parser.parse_args()
+
+    await limpiar()
+    try:
+        print(f"transacciones: {'sí' if await server.transacciones_soportadas() else 'no (standalone)'}")
+        await medir("antes", aprobar_comprobante_anterior, await sembrar(args.n))
+        ids = await sembrar(args.n)
+        await medir("después", aprobar_comprobante_nuevo, ids)
+        await medir("reintento", aprobar_comprobante_nuevo, ids)
+    finally:
+        await limpiar()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
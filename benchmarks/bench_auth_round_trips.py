@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark de autenticación en las rutas del admin: token antiguo (sólo
+sub=email, se lee el usuario y se busca su lavadero) contra el token con
+claims (uid, rol, lavadero_id). Reporta round trips a Mongo por request.
+
+La primera parte resuelve el principal sin base de datos y no necesita
+Mongo. La segunda llama a las rutas reales y necesita MONGO_URL y DB_NAME
+(backend/.env); crea y borra sus propios datos.
+
+Uso: python benchmarks/bench_auth_round_trips.py [--n 200] [--sin-mongo]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from _common import install_counter, percentile
+
+counter = install_counter()
+
+import httpx  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+import server  # noqa: E402
+from server import EstadoAdmin, Principal, UserRole, build_claims  # noqa: E402
+
+# Sin lifespan: el cliente de Mongo se abre a mano
+db = server.conectar()
+
+PREFIJO = "bench-auth-"
+RUTAS_ADMIN = [
+    ("GET", "/api/admin/configuracion"),
+    ("GET", "/api/admin/dias-no-laborales"),
+    ("GET", "/api/admin/mis-comprobantes"),
+    ("GET", "/api/admin/pago-pendiente"),
+    ("GET", "/api/dashboard/stats"),
+]
+
+
+def _request(token: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    })
+
+
+async def medir_principal(n: int):
+    principal = Principal(id="u-1", email="admin@bench.com", rol=UserRole.ADMIN, lavadero_id="lav-1")
+    token = server.create_access_token(build_claims(principal), timedelta(minutes=30))
+    request = _request(token)
+    counter.reset()
+    inicio = time.perf_counter()
+    for _ in range(n):
+        await server.get_current_principal(request)
+    por_llamada = (time.perf_counter() - inicio) / n * 1e6
+    print(f"get_current_principal: {por_llamada:.1f} µs/llamada, round trips={counter.commands / n:.1f}")
+
+
+async def sembrar():
+    ahora = datetime.now(timezone.utc)
+    admin = server.User(email=f"{uuid.uuid4().hex[:8]}@bench-auth.com", nombre=PREFIJO + "admin",
+                        rol=UserRole.ADMIN, password_hash=server.get_password_hash("bench"))
+    lavadero_id = PREFIJO + str(uuid.uuid4())
+    await db.users.insert_one({**admin.dict(), "id": PREFIJO + admin.id})
+    await db.lavaderos.insert_one({"id": lavadero_id, "admin_id": PREFIJO + admin.id, "nombre": lavadero_id,
+                                   "direccion": "-", "estado_operativo": EstadoAdmin.ACTIVO, "is_active": True,
+                                   "fecha_vencimiento": ahora + timedelta(days=30), "created_at": ahora})
+    return admin.email
+
+
+async def limpiar():
+    filtro = {"id": {"$regex": f"^{PREFIJO}"}}
+    await db.users.delete_many(filtro)
+    await db.lavaderos.delete_many(filtro)
+    await db.configuracion_lavadero.delete_many({"lavadero_id": {"$regex": f"^{PREFIJO}"}})
+
+
+async def medir_rutas(cliente, nombre, token, n):
+    headers = {"Authorization": f"Bearer {token}"}
+    print(nombre)
+    for metodo, ruta in RUTAS_ADMIN:
+        await cliente.request(metodo, ruta, headers=headers)  # calentar la caché
+        latencias, round_trips = [], []
+        for _ in range(n):
+            counter.reset()
+            inicio = time.perf_counter()
+            respuesta = await cliente.request(metodo, ruta, headers=headers)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            round_trips.append(counter.commands)
+        print(f"  {metodo} {ruta:<32} {respuesta.status_code} p50={statistics.median(latencias):6.2f} ms  "
+              f"p95={percentile(latencias, 95):6.2f} ms  round trips={statistics.mean(round_trips):.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200)
+    parser.add_argument("--sin-mongo", action="store_true")
+    args = parser.parse_args()
+
+    await medir_principal(args.n * 50)
+    if args.sin_mongo:
+        return
+
+    await limpiar()
+    try:
+        email = await sembrar()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as cliente:
+            login = await cliente.post("/api/login", json={"email": email, "password": "bench"})
+            token_claims = login.json()["access_token"]
+            token_antiguo = server.create_access_token({"sub": email}, timedelta(minutes=30))
+            await medir_rutas(cliente, "token antiguo (sub)", token_antiguo, args.n)
+            await medir_rutas(cliente, "token con claims", token_claims, args.n)
+    finally:
+        await limpiar()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
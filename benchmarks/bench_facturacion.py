@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la facturación mensual: siembra N lavaderos activos, corre
+generar_pagos_mensuales dos veces (la segunda debe omitir todo) y reporta
+tiempos y conteos.
+
+Necesita MONGO_URL y DB_NAME (backend/.env). Crea y borra sus propios datos.
+
+Uso: python benchmarks/bench_facturacion.py [--n 50000]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+
+from _common import install_counter
+
+counter = install_counter()
+
+import server  # noqa: E402
+from server import EstadoAdmin  # noqa: E402
+
+# Sin lifespan: el cliente de Mongo se abre a mano
+db = server.conectar()
+
+PREFIJO = "bench-facturacion-"
+MES = "2099-01"
+
+
+async def sembrar(n: int):
+    ahora = datetime.now(timezone.utc)
+    lavaderos = [
+        {"id": PREFIJO + str(uuid.uuid4()), "admin_id": PREFIJO + str(uuid.uuid4()), "nombre": f"{PREFIJO}{i}",
+         "direccion": "-", "estado_operativo": EstadoAdmin.ACTIVO, "is_active": True, "created_at": ahora}
+        for i in range(n)
+    ]
+    for inicio in range(0, n, 10000):
+        await db.lavaderos.insert_many(lavaderos[inicio:inicio + 10000], ordered=False)
+
+
+async def limpiar():
+    await db.lavaderos.delete_many({"id": {"$regex": f"^{PREFIJO}"}})
+    await db.pagos_mensualidad.delete_many({"mes_año": MES})
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=50_000)
+    args = parser.parse_args()
+
+    await server.ensure_indexes()
+    await limpiar()
+    try:
+        await sembrar(args.n)
+        for corrida in ("primera", "reintento"):
+            counter.reset()
+            inicio = time.perf_counter()
+            resultado = await server.generar_pagos_mensuales(MES)
+            print(f"{corrida:<10} {time.perf_counter() - inicio:6.2f} s  creados={resultado['creados']} "
+                  f"omitidos={resultado['omitidos']}  round trips={counter.commands}")
+    finally:
+        await limpiar()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark de normalización de comprobantes sobre las imágenes de ejemplo
+en uploads/comprobantes: bytes guardados antes/después y tiempo por imagen.
+
+Uso: python benchmarks/bench_image_normalization.py [--formato webp|jpeg] [--max-dimension 1280]
+"""
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from _common import ROOT_DIR
+from image_processing import ImageSettings, InvalidImageError, normalize_image
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--formato", default="webp", choices=["webp", "jpeg"])
+    parser.add_argument("--max-dimension", type=int, default=1280)
+    parser.add_argument("--calidad", type=int, default=None)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--dir", default=str(ROOT_DIR / "uploads" / "comprobantes"))
+    args = parser.parse_args()
+
+    settings = ImageSettings(
+        max_dimension=args.max_dimension,
+        formato=args.formato,
+        calidad=args.calidad or (80 if args.formato == "webp" else 85),
+    )
+
+    total_original = 0
+    total_normalizado = 0
+    tiempos = []
+    print(f"{'archivo':<20} {'original':>10} {'normalizado':>12} {'ratio':>7} {'ms':>8}")
+    for path in sorted(Path(args.dir).glob("comprobante_*")):
+        data = path.read_bytes()
+        try:
+            muestras = []
+            for _ in range(args.repeticiones):
+                inicio = time.perf_counter()
+                resultado = normalize_image(data, settings)
+                muestras.append((time.perf_counter() - inicio) * 1000)
+        except InvalidImageError:
+            print(f"{path.name[-20:]:<20} {len(data):>10} {'inválida':>12}")
+            continue
+        ms = statistics.median(muestras)
+        tiempos.append(ms)
+        total_original += len(data)
+        total_normalizado += len(resultado.content)
+        ratio = len(data) / len(resultado.content)
+        print(f"{path.name[-20:]:<20} {len(data):>10} {len(resultado.content):>12} {ratio:>6.1f}x {ms:>8.1f}")
+
+    if total_normalizado:
+        print("-" * 61)
+        print(f"{'total':<20} {total_original:>10} {total_normalizado:>12} "
+              f"{total_original / total_normalizado:>6.1f}x {statistics.median(tiempos):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Costo por request de MetricsMiddleware: la misma app ASGI mínima llamada
+directamente y envuelta por el middleware, con el scope que deja el router
+de la app real (endpoint de una ruta con parámetros). El objetivo es que la
+diferencia quede por debajo de 50 µs por request.
+
+No necesita MongoDB.
+
+Uso: python benchmarks/bench_metrics_middleware.py [--n 200000]
+"""
+import argparse
+import asyncio
+import time
+
+import _common  # noqa: F401  (rutas y .env del backend)
+
+import server  # noqa: E402
+from metrics import MetricsMiddleware  # noqa: E402
+
+OBJETIVO_US = 50
+
+
+async def app_minima(scope, receive, send):
+    # Lo que haría el router: marcar la ruta que coincidió
+    scope["endpoint"] = server.get_purga
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def medir(app, n):
+    scope_base = {"type": "http", "method": "GET", "path": "/api/superadmin/purgas/x", "app": server.app}
+    for _ in range(1000):
+        await app(dict(scope_base), receive, send)
+    inicio = time.perf_counter()
+    for _ in range(n):
+        await app(dict(scope_base), receive, send)
+    return (time.perf_counter() - inicio) / n * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200000)
+    args = parser.parse_args()
+
+    sin = await medir(app_minima, args.n)
+    con = await medir(MetricsMiddleware(app_minima), args.n)
+    overhead = con - sin
+    print(f"sin middleware: {sin:.2f} µs/request")
+    print(f"con middleware: {con:.2f} µs/request")
+    print(f"overhead:       {overhead:.2f} µs/request (objetivo < {OBJETIVO_US} µs) "
+          f"{'OK' if overhead < OBJETIVO_US else 'EXCEDIDO'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark del índice multi-hash de comprobantes: tiempo de búsqueda de
+casi-duplicados (distancia de Hamming <= k) sobre N hashes de 64 bits.
+
+Uso: python benchmarks/bench_phash_index.py [--n 1000000] [--k 6]
+"""
+import argparse
+import random
+import statistics
+import time
+
+import _common  # noqa: F401  (agrega backend/ al path)
+from phash_index import MultiIndexHashTable
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--consultas", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    indice = MultiIndexHashTable()
+    hashes = []
+    inicio = time.perf_counter()
+    for i in range(args.n):
+        valor = rng.getrandbits(64)
+        hashes.append(valor)
+        indice.add(str(i), valor)
+    print(f"carga de {args.n} hashes: {time.perf_counter() - inicio:.1f} s")
+
+    # Mitad de las consultas son variantes de hashes existentes (duplicados reales)
+    tiempos = []
+    encontrados = 0
+    for j in range(args.consultas):
+        if j % 2 == 0:
+            consulta = rng.choice(hashes)
+            for bit in rng.sample(range(64), rng.randint(0, args.k)):
+                consulta ^= 1 << bit
+        else:
+            consulta = rng.getrandbits(64)
+        t0 = time.perf_counter()
+        resultado = indice.search(consulta, args.k)
+        tiempos.append((time.perf_counter() - t0) * 1_000_000)
+        encontrados += bool(resultado)
+
+    tiempos.sort()
+    print(f"k={args.k} consultas={args.consultas} con coincidencia={encontrados}")
+    print(f"p50={statistics.median(tiempos):.0f} µs  "
+          f"p95={tiempos[int(len(tiempos) * 0.95)]:.0f} µs  "
+          f"p99={tiempos[int(len(tiempos) * 0.99)]:.0f} µs")
+
+
+if __name__ == "__main__":
+    main()
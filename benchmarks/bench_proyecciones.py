@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Benchmark de las lecturas con proyección: para cada camino de lectura
+compara el documento entero (antes) con sólo los campos que usa la ruta
+(después). Reporta los bytes que llegan de MongoDB por lectura y el CPU del
+proceso para decodificarlos y armar los modelos.
+
+Necesita MONGO_URL y DB_NAME (backend/.env). Crea y borra sus propios datos.
+
+Uso: python benchmarks/bench_proyecciones.py [--admins 200] [--repeticiones 200]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import bson
+from pymongo import monitoring
+
+from _common import install_counter
+
+counter = install_counter()
+
+
+class ReplyBytes(monitoring.CommandListener):
+    """Bytes of every command reply, while ``activo``"""
+
+    def __init__(self):
+        self.activo = False
+        self.bytes = 0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if self.activo:
+            self.bytes += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+
+reply_bytes = ReplyBytes()
+monitoring.register(reply_bytes)
+
+import server  # noqa: E402
+from server import (  # noqa: E402
+    CAMPOS_CONFIGURACION, CAMPOS_LAVADERO, CAMPOS_USER_RESPONSE, CAMPOS_USUARIO, SOLO_ID,
+    ComprobantePagoMensualidad, ConfiguracionLavadero, EstadoAdmin, EstadoPago, Lavadero, PagoMensualidad, User,
+    UserResponse, UserRole
+)
+
+# Sin lifespan: el cliente de Mongo se abre a mano
+db = server.conectar()
+repos = server.repos
+
+PREFIJO = "bench-proyecciones-"
+
+
+async def sembrar(n: int) -> list:
+    password_hash = server.get_password_hash("bench")
+    admins, lavaderos, configuraciones, pagos, comprobantes = [], [], [], [], []
+    for i in range(n):
+        admin = User(email=f"{PREFIJO}{i}@example.com", nombre=f"{PREFIJO}{i}", rol=UserRole.ADMIN,
+                     password_hash=password_hash)
+        lavadero = Lavadero(nombre=f"{PREFIJO}{i}", direccion="Calle 123", descripcion="Lavadero de prueba " * 5,
+                            admin_id=admin.id, estado_operativo=EstadoAdmin.ACTIVO,
+                            fecha_vencimiento=datetime.now(timezone.utc) + timedelta(days=30))
+        config = ConfiguracionLavadero(lavadero_id=lavadero.id, hora_apertura="08:00", hora_cierre="18:00",
+                                       duracion_turno_minutos=60, dias_laborales=[1, 2, 3, 4, 5],
+                                       alias_bancario="bench.alias.mp", precio_turno=5000.0)
+        pago = PagoMensualidad(admin_id=admin.id, lavadero_id=lavadero.id, monto=10000.0, mes_año="2099-01",
+                               estado=EstadoPago.PENDIENTE,
+                               fecha_vencimiento=datetime.now(timezone.utc) + timedelta(days=30))
+        comprobante = ComprobantePagoMensualidad(pago_mensualidad_id=pago.id, admin_id=admin.id,
+                                                 imagen_url="/uploads/comprobantes/bench.jpg",
+                                                 phash="0123456789abcdef")
+        admins.append(admin.dict())
+        lavaderos.append(lavadero.dict())
+        configuraciones.append(config.dict())
+        pagos.append(pago.dict())
+        comprobantes.append(comprobante.dict())
+    await db.users.insert_many(admins)
+    await db.lavaderos.insert_many(lavaderos)
+    await db.configuracion_lavadero.insert_many(configuraciones)
+    await db.pagos_mensualidad.insert_many(pagos)
+    await db.comprobantes_pago_mensualidad.insert_many(comprobantes)
+    return admins
+
+
+async def limpiar():
+    admin_ids = await db.users.find({"nombre": {"$regex": f"^{PREFIJO}"}}, {"_id": 0, "id": 1}).to_list(None)
+    admin_ids = {"$in": [a["id"] for a in admin_ids]}
+    await db.pagos_mensualidad.delete_many({"admin_id": admin_ids})
+    await db.comprobantes_pago_mensualidad.delete_many({"admin_id": admin_ids})
+    await db.users.delete_many({"nombre": {"$regex": f"^{PREFIJO}"}})
+    lavaderos = await db.lavaderos.find({"nombre": {"$regex": f"^{PREFIJO}"}}, {"_id": 0, "id": 1}).to_list(None)
+    await db.configuracion_lavadero.delete_many({"lavadero_id": {"$in": [l["id"] for l in lavaderos]}})
+    await db.lavaderos.delete_many({"nombre": {"$regex": f"^{PREFIJO}"}})
+
+
+def lecturas(admins: list):
+    """(nombre, lectura sin proyección, lectura con proyección) de cada camino"""
+    admin = admins[len(admins) // 2]
+
+    def con_modelo(modelo, lectura):
+        async def leer():
+            doc = await lectura()
+            return modelo(**doc)
+        return leer
+
+    async def listar(fields=None):
+        return [UserResponse(**u) for u in await repos.users.list(rol=UserRole.ADMIN, fields=fields)]
+
+    async def admins_con_lavadero(fields=None, lavadero_fields=None):
+        return await repos.users.with_lavadero(UserRole.ADMIN, fields=fields, lavadero_fields=lavadero_fields)
+
+    async def config(fields=None, config_fields=None):
+        lavadero, configuracion = await repos.lavaderos.get_with_config(
+            admin_id=admin["id"], fields=fields, config_fields=config_fields
+        )
+        return Lavadero(**lavadero), ConfiguracionLavadero(**configuracion)
+
+    return [
+        ("usuario del JWT",
+         con_modelo(User, lambda: repos.users.get_by_email(admin["email"])),
+         con_modelo(User, lambda: repos.users.get_by_email(admin["email"], fields=CAMPOS_USUARIO))),
+        ("GET /admin/users", listar, lambda: listar(CAMPOS_USER_RESPONSE)),
+        ("GET /superadmin/admins", admins_con_lavadero, lambda: admins_con_lavadero(
+            ("id", "nombre", "email", "has_password", "created_at", "is_active", "google_id"),
+            ("id", "nombre", "estado_operativo", "fecha_vencimiento"))),
+        ("id del lavadero del admin",
+         lambda: repos.lavaderos.get_by_admin(admin["id"]),
+         lambda: repos.lavaderos.get_by_admin(admin["id"], fields=SOLO_ID)),
+        ("lavadero + configuración", config, lambda: config(CAMPOS_LAVADERO, CAMPOS_CONFIGURACION)),
+        ("comprobantes pendientes",
+         lambda: repos.comprobantes.pendientes_con_detalle(),
+         lambda: repos.comprobantes.pendientes_con_detalle(fields=("id", "phash", "imagen_url", "created_at"))),
+        ("GET /admin/mis-comprobantes",
+         lambda: repos.comprobantes.del_admin(admin["id"]),
+         lambda: repos.comprobantes.del_admin(
+             admin["id"], fields=("id", "imagen_url", "estado", "comentario_superadmin", "fecha_revision",
+                                  "created_at"), pago_fields=("monto", "mes_año"))),
+        ("GET /admin/pago-pendiente",
+         lambda: repos.pagos.get_pendiente(admin["id"]),
+         lambda: repos.pagos.get_pendiente(admin["id"], fields=("id", "monto", "mes_año", "fecha_vencimiento"))),
+    ]
+
+
+async def medir(lectura, repeticiones: int):
+    # Bytes en una pasada aparte: codificar la respuesta para medirla también gasta CPU
+    reply_bytes.bytes = 0
+    reply_bytes.activo = True
+    await lectura()
+    reply_bytes.activo = False
+    por_lectura = reply_bytes.bytes
+
+    inicio = time.process_time()
+    for _ in range(repeticiones):
+        await lectura()
+    cpu_ms = (time.process_time() - inicio) * 1000 / repeticiones
+    return por_lectura, cpu_ms
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--admins", type=int, default=200)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    await limpiar()
+    try:
+        admins = await sembrar(args.admins)
+        print(f"{'lectura':<28} {'bytes antes':>12} {'después':>9} {'CPU ms antes':>13} {'después':>9}")
+        for nombre, antes, despues in lecturas(admins):
+            await antes()
+            await despues()
+            bytes_antes, cpu_antes = await medir(antes, args.repeticiones)
+            bytes_despues, cpu_despues = await medir(despues, args.repeticiones)
+            print(f"{nombre:<28} {bytes_antes:>12} {bytes_despues:>9} {cpu_antes:>13.3f} {cpu_despues:>9.3f}")
+    finally:
+        await limpiar()
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
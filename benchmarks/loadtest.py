@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Generador de carga asíncrono con escenarios que imitan el tráfico real.
+
+Cada usuario virtual elige un escenario según la mezcla (--mix) y lo repite
+hasta que termina la prueba:
+
+- cliente:    navega /lavaderos-operativos y la configuración pública.
+- admin:      inicia sesión y consulta /dashboard/stats y /admin/configuracion.
+- superadmin: inicia sesión, pagina comprobantes-historial y aprueba
+              comprobantes pendientes (desactivable con --sin-escrituras).
+
+Al final imprime p50/p95/p99 y throughput por endpoint y guarda el reporte
+en JSON (--output) para compararlo entre corridas.
+
+Uso:
+    python benchmarks/loadtest.py --base-url http://localhost:8001 \\
+        --concurrency 50 --duration 60 --mix cliente=70,admin=25,superadmin=5 \\
+        --admin-file admins.txt --superadmin email:password
+
+--admin-file tiene una credencial "email:password" por línea (seed_data.py
+puede generarlo).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from _common import percentile
+
+
+@dataclass
+class Config:
+    base_url: str
+    concurrency: int = 20
+    duration: float = 30
+    mix: Dict[str, int] = field(default_factory=lambda: {"cliente": 70, "admin": 25, "superadmin": 5})
+    think_ms: float = 0
+    timeout: float = 10
+    admins: List[tuple] = field(default_factory=list)
+    superadmin: Optional[tuple] = None
+    escrituras: bool = True
+    historial_limit: int = 50
+    seed: Optional[int] = None
+
+
+class Recorder:
+    def __init__(self):
+        self.latencias: Dict[str, List[float]] = {}
+        self.errores: Dict[str, int] = {}
+        self.status: Dict[str, Dict[str, int]] = {}
+
+    def record(self, nombre: str, latencia_ms: float, status: Optional[int], error: bool):
+        self.latencias.setdefault(nombre, []).append(latencia_ms)
+        if error:
+            self.errores[nombre] = self.errores.get(nombre, 0) + 1
+        codigos = self.status.setdefault(nombre, {})
+        clave = str(status) if status is not None else "sin_respuesta"
+        codigos[clave] = codigos.get(clave, 0) + 1
+
+
+class VirtualUser:
+    def __init__(self, numero: int, client: httpx.AsyncClient, recorder: Recorder, config: Config,
+                 rng: random.Random):
+        self.numero = numero
+        self.client = client
+        self.recorder = recorder
+        self.config = config
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+        self.estado: Dict[str, object] = {}
+
+    async def request(self, nombre: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        inicio = time.perf_counter()
+        response = None
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except httpx.HTTPError:
+            pass
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+        error = response is None or response.status_code >= 400
+        self.recorder.record(nombre, latencia_ms, response.status_code if response is not None else None, error)
+        return response if response is not None and not error else None
+
+    async def login(self, email: str, password: str) -> bool:
+        response = await self.request("POST /api/login", "POST", "/api/login",
+                                      json={"email": email, "password": password})
+        if response is None:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return True
+
+
+@dataclass
+class Escenario:
+    iteracion: Callable[[VirtualUser], Awaitable[None]]
+    setup: Optional[Callable[[VirtualUser], Awaitable[bool]]] = None
+
+
+async def cliente_iteracion(vu: VirtualUser):
+    await vu.request("GET /api/lavaderos-operativos", "GET", "/api/lavaderos-operativos")
+    await vu.request("GET /api/superadmin-config", "GET", "/api/superadmin-config")
+
+
+async def admin_setup(vu: VirtualUser) -> bool:
+    if not vu.config.admins:
+        return False
+    email, password = vu.config.admins[vu.numero % len(vu.config.admins)]
+    return await vu.login(email, password)
+
+
+async def admin_iteracion(vu: VirtualUser):
+    await vu.request("GET /api/dashboard/stats", "GET", "/api/dashboard/stats")
+    await vu.request("GET /api/admin/configuracion", "GET", "/api/admin/configuracion")
+
+
+async def superadmin_setup(vu: VirtualUser) -> bool:
+    if vu.config.superadmin is None:
+        return False
+    return await vu.login(*vu.config.superadmin)
+
+
+async def superadmin_iteracion(vu: VirtualUser):
+    limit = vu.config.historial_limit
+    offset = vu.estado.get("offset", 0)
+    response = await vu.request("GET /api/superadmin/comprobantes-historial", "GET",
+                                "/api/superadmin/comprobantes-historial",
+                                params={"limit": limit, "offset": offset})
+    total = response.json().get("total", 0) if response is not None else 0
+    vu.estado["offset"] = offset + limit if offset + limit < total else 0
+
+    if not vu.config.escrituras:
+        return
+    response = await vu.request("GET /api/superadmin/comprobantes-pendientes", "GET",
+                                "/api/superadmin/comprobantes-pendientes")
+    pendientes = response.json() if response is not None else []
+    if pendientes:
+        comprobante = vu.rng.choice(pendientes)
+        comprobante_id = comprobante.get("comprobante_id") or comprobante.get("id")
+        await vu.request("POST /api/superadmin/aprobar-comprobante/{comprobante_id}", "POST",
+                         f"/api/superadmin/aprobar-comprobante/{comprobante_id}")
+
+
+ESCENARIOS = {
+    "cliente": Escenario(cliente_iteracion),
+    "admin": Escenario(admin_iteracion, admin_setup),
+    "superadmin": Escenario(superadmin_iteracion, superadmin_setup),
+}
+
+
+async def _usuario(vu: VirtualUser, escenario: Escenario, fin: float):
+    if escenario.setup is not None and not await escenario.setup(vu):
+        return
+    while time.perf_counter() < fin:
+        await escenario.iteracion(vu)
+        # Aun sin pausa, ceder el loop para que ningún usuario virtual acapare el cliente
+        await asyncio.sleep(vu.rng.expovariate(1000 / vu.config.think_ms) if vu.config.think_ms else 0)
+
+
+def _asignar_escenarios(config: Config, rng: random.Random) -> List[str]:
+    nombres = [n for n, peso in config.mix.items() if peso > 0]
+    pesos = [config.mix[n] for n in nombres]
+    return rng.choices(nombres, weights=pesos, k=config.concurrency)
+
+
+def build_report(config: Config, recorder: Recorder, asignados: List[str], started_at: datetime,
+                 duracion: float) -> dict:
+    endpoints = {}
+    for nombre, latencias in sorted(recorder.latencias.items()):
+        endpoints[nombre] = {
+            "requests": len(latencias),
+            "errors": recorder.errores.get(nombre, 0),
+            "status": recorder.status.get(nombre, {}),
+            "rps": round(len(latencias) / duracion, 2),
+            "mean_ms": round(statistics.mean(latencias), 2),
+            "p50_ms": round(percentile(latencias, 50), 2),
+            "p95_ms": round(percentile(latencias, 95), 2),
+            "p99_ms": round(percentile(latencias, 99), 2),
+            "max_ms": round(max(latencias), 2),
+        }
+    todas = [l for latencias in recorder.latencias.values() for l in latencias]
+    total = len(todas)
+    return {
+        "started_at": started_at.isoformat(),
+        "config": {
+            "base_url": config.base_url,
+            "concurrency": config.concurrency,
+            "duration_s": config.duration,
+            "mix": config.mix,
+            "think_ms": config.think_ms,
+            "writes": config.escrituras,
+            "seed": config.seed,
+        },
+        "virtual_users": {n: asignados.count(n) for n in config.mix},
+        "summary": {
+            "requests": total,
+            "errors": sum(recorder.errores.values()),
+            "rps": round(total / duracion, 2) if duracion else 0,
+            "p50_ms": round(percentile(todas, 50), 2),
+            "p95_ms": round(percentile(todas, 95), 2),
+            "p99_ms": round(percentile(todas, 99), 2),
+            "elapsed_s": round(duracion, 2),
+        },
+        "endpoints": endpoints,
+    }
+
+
+async def run_load_test(config: Config, transport: Optional[httpx.AsyncBaseTransport] = None) -> dict:
+    rng = random.Random(config.seed)
+    recorder = Recorder()
+    asignados = _asignar_escenarios(config, rng)
+    limits = httpx.Limits(max_connections=config.concurrency, max_keepalive_connections=config.concurrency)
+    async with httpx.AsyncClient(base_url=config.base_url, timeout=config.timeout, limits=limits,
+                                 transport=transport) as client:
+        started_at = datetime.now(timezone.utc)
+        inicio = time.perf_counter()
+        fin = inicio + config.duration
+        await asyncio.gather(*(
+            _usuario(VirtualUser(n, client, recorder, config, random.Random(rng.random())), ESCENARIOS[nombre], fin)
+            for n, nombre in enumerate(asignados)
+        ))
+        duracion = time.perf_counter() - inicio
+    return build_report(config, recorder, asignados, started_at, duracion)
+
+
+def print_report(reporte: dict):
+    resumen = reporte["summary"]
+    print(f"\n{resumen['requests']} requests en {resumen['elapsed_s']} s -> {resumen['rps']} req/s, "
+          f"{resumen['errors']} errores")
+    print(f"p50={resumen['p50_ms']} ms  p95={resumen['p95_ms']} ms  p99={resumen['p99_ms']} ms\n")
+    print(f"{'endpoint':<62} {'req':>7} {'err':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for nombre, e in reporte["endpoints"].items():
+        print(f"{nombre:<62} {e['requests']:>7} {e['errors']:>5} {e['rps']:>8} "
+              f"{e['p50_ms']:>8} {e['p95_ms']:>8} {e['p99_ms']:>8}")
+
+
+def _credencial(texto: str) -> tuple:
+    email, _, password = texto.strip().partition(":")
+    return email, password
+
+
+def _mix(texto: str) -> Dict[str, int]:
+    mix = {}
+    for parte in texto.split(","):
+        nombre, _, peso = parte.partition("=")
+        if nombre not in ESCENARIOS:
+            raise argparse.ArgumentTypeError(f"escenario desconocido: {nombre}")
+        mix[nombre] = int(peso)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=os.environ.get("LOADTEST_BASE_URL", "http://localhost:8001"))
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="segundos")
+    parser.add_argument("--mix", type=_mix, default="cliente=70,admin=25,superadmin=5")
+    parser.add_argument("--think-ms", type=float, default=0, help="pausa media entre iteraciones")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--admin", action="append", default=[], help="email:password (repetible)")
+    parser.add_argument("--admin-file", help="archivo con una credencial email:password por línea")
+    parser.add_argument("--superadmin", default=os.environ.get("LOADTEST_SUPERADMIN"), help="email:password")
+    parser.add_argument("--sin-escrituras", action="store_true", help="no aprobar comprobantes")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", default="loadtest-report.json")
+    args = parser.parse_args()
+
+    admins = [_credencial(a) for a in args.admin]
+    if args.admin_file:
+        with open(args.admin_file) as f:
+            admins.extend(_credencial(linea) for linea in f if linea.strip())
+
+    config = Config(
+        base_url=args.base_url,
+        concurrency=args.concurrency,
+        duration=args.duration,
+        mix=args.mix,
+        think_ms=args.think_ms,
+        timeout=args.timeout,
+        admins=admins,
+        superadmin=_credencial(args.superadmin) if args.superadmin else None,
+        escrituras=not args.sin_escrituras,
+        seed=args.seed,
+    )
+    for nombre, escenario in (("admin", admins), ("superadmin", config.superadmin)):
+        if config.mix.get(nombre) and not escenario:
+            print(f"aviso: sin credenciales para '{nombre}', esos usuarios virtuales no harán requests")
+
+    reporte = asyncio.run(run_load_test(config))
+    print_report(reporte)
+    with open(args.output, "w") as f:
+        json.dump(reporte, f, indent=2)
+    print(f"\nreporte: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Compuerta de regresiones de performance: corre una suite fija de endpoints y
+consultas contra los datos de seed_data.py y compara p95 y round trips a
+Mongo con benchmarks/baseline.json.
+
+Falla (exit 1) si el p95 de un caso empeora más de --tolerancia (relativa)
+y --margen-ms (absoluto, para no saltar por ruido en casos de pocos ms), o
+si sus round trips suben más de --tolerancia-round-trips. También falla si
+la baseline no tiene casos o si un caso falta de un lado o del otro: un caso
+sin baseline no está cubierto. Imprime la tabla de diferencias siempre.
+
+Los requests van en proceso (httpx.ASGITransport), sin red, y la suite es
+de sólo lectura, así que se puede repetir sobre la misma base.
+
+Por defecto corre sólo los casos "sin db" (auth por claims, índice pHash,
+health): no tocan MongoDB, su p95 y sus round trips (cero) son
+reproducibles en cualquier máquina y baseline.json los cubre. Los casos con
+MongoDB son opcionales y se piden con --con-db; con ese flag sí son
+obligatorios, así que la baseline tiene que haberlos grabado (en la máquina
+de referencia, sobre los datos de seed_data.py).
+
+Uso:
+    python benchmarks/regression.py                                  # compara los casos sin db
+    python benchmarks/regression.py --update-baseline                # regraba los casos sin db
+    python benchmarks/seed_data.py --scale 1 --seed 42
+    python benchmarks/regression.py --con-db                         # compara también los casos con MongoDB
+    python benchmarks/regression.py --con-db --update-baseline       # regraba todos los casos
+
+Con --con-db necesita MONGO_URL y DB_NAME (backend/.env).
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from _common import install_counter, percentile
+
+counter = install_counter()
+
+import httpx  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+import server  # noqa: E402
+from phash_index import MultiIndexHashTable  # noqa: E402
+from server import Principal, UserRole, build_claims  # noqa: E402
+
+# Sin lifespan: el cliente de Mongo se abre a mano
+db = server.conectar()
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+@dataclass
+class Contexto:
+    cliente: httpx.AsyncClient
+    headers: Dict[str, Dict[str, str]]
+    lavadero_id: Optional[str] = None
+    admin_id: Optional[str] = None
+
+
+@dataclass
+class Caso:
+    nombre: str
+    ejecutar: Callable[[Contexto], Awaitable[None]]
+    usa_db: bool = True
+
+
+def endpoint(path: str, rol: Optional[str] = None, **params) -> Callable[[Contexto], Awaitable[None]]:
+    async def ejecutar(ctx: Contexto):
+        response = await ctx.cliente.get(path, params=params, headers=ctx.headers.get(rol, {}))
+        if response.status_code >= 400:
+            raise RuntimeError(f"{path} respondió {response.status_code}: {response.text[:200]}")
+    return ejecutar
+
+
+async def turnos_semana(ctx: Contexto):
+    desde = datetime.now(timezone.utc)
+    await db.turnos.find(
+        {"lavadero_id": ctx.lavadero_id, "fecha_hora": {"$gte": desde, "$lt": desde + timedelta(days=7)}},
+        {"_id": 0}
+    ).to_list(1000)
+
+
+async def turnos_por_estado(ctx: Contexto):
+    await db.turnos.aggregate([
+        {"$match": {"lavadero_id": ctx.lavadero_id}},
+        {"$group": {"_id": "$estado", "total": {"$sum": 1}}},
+    ]).to_list(None)
+
+
+async def pagos_pendientes(ctx: Contexto):
+    await db.pagos_mensualidad.count_documents({"estado": "PENDIENTE"})
+
+
+TOKEN_ADMIN = server.create_access_token(
+    build_claims(Principal(id="regression-admin", email="admin@regression.test", rol=UserRole.ADMIN,
+                           lavadero_id="regression-lavadero")),
+    timedelta(days=3650)
+)
+
+
+async def principal_del_jwt(ctx: Contexto):
+    request = Request({"type": "http", "headers": [(b"authorization", f"Bearer {TOKEN_ADMIN}".encode())]})
+    await server.get_current_principal(request)
+
+
+def busqueda_phash(n: int, k: int) -> Callable[[Contexto], Awaitable[None]]:
+    """Near-duplicate search on ``n`` seeded hashes; half the queries are real near-duplicates"""
+    estado = {}
+
+    def preparar():
+        rng = random.Random(42)
+        indice = MultiIndexHashTable()
+        hashes = [rng.getrandbits(64) for _ in range(n)]
+        for i, valor in enumerate(hashes):
+            indice.add(str(i), valor)
+        consultas = []
+        for j in range(256):
+            consulta = rng.choice(hashes) if j % 2 == 0 else rng.getrandbits(64)
+            for bit in rng.sample(range(64), rng.randint(0, k)):
+                consulta ^= 1 << bit
+            consultas.append(consulta)
+        estado.update(indice=indice, consultas=consultas, siguiente=0)
+
+    async def ejecutar(ctx: Contexto):
+        if not estado:
+            preparar()
+        consultas = estado["consultas"]
+        estado["indice"].search(consultas[estado["siguiente"] % len(consultas)], k)
+        estado["siguiente"] += 1
+    return ejecutar
+
+
+SUITE: List[Caso] = [
+    Caso("GET /api/lavaderos-operativos", endpoint("/api/lavaderos-operativos")),
+    Caso("GET /api/superadmin-config", endpoint("/api/superadmin-config")),
+    Caso("GET /api/me", endpoint("/api/me", "admin")),
+    Caso("GET /api/dashboard/stats", endpoint("/api/dashboard/stats", "admin")),
+    Caso("GET /api/admin/configuracion", endpoint("/api/admin/configuracion", "admin")),
+    Caso("GET /api/admin/dias-no-laborales", endpoint("/api/admin/dias-no-laborales", "admin")),
+    Caso("GET /api/admin/mis-comprobantes", endpoint("/api/admin/mis-comprobantes", "admin")),
+    Caso("GET /api/admin/pago-pendiente", endpoint("/api/admin/pago-pendiente", "admin")),
+    Caso("GET /api/superadmin/lavaderos", endpoint("/api/superadmin/lavaderos", "superadmin")),
+    Caso("GET /api/superadmin/admins", endpoint("/api/superadmin/admins", "superadmin")),
+    Caso("GET /api/superadmin/comprobantes-pendientes",
+         endpoint("/api/superadmin/comprobantes-pendientes", "superadmin")),
+    Caso("GET /api/superadmin/comprobantes-historial",
+         endpoint("/api/superadmin/comprobantes-historial", "superadmin", limit=50, offset=0)),
+    # Página profunda: detecta un $lookup que vuelva a quedar antes del $skip
+    Caso("GET /api/superadmin/comprobantes-historial offset=5000",
+         endpoint("/api/superadmin/comprobantes-historial", "superadmin", limit=50, offset=5000)),
+    Caso("query turnos de la semana", turnos_semana),
+    Caso("query turnos por estado", turnos_por_estado),
+    Caso("query pagos pendientes", pagos_pendientes),
+    # Sin MongoDB: reproducibles en cualquier máquina
+    Caso("sin db: GET /api/health/live", endpoint("/api/health/live"), usa_db=False),
+    Caso("sin db: principal desde los claims del JWT", principal_del_jwt, usa_db=False),
+    Caso("sin db: búsqueda pHash k=6 en 100k hashes", busqueda_phash(100_000, 6), usa_db=False),
+]
+
+
+async def preparar(cliente: httpx.AsyncClient, run: str) -> Contexto:
+    lavadero = await db.lavaderos.find_one(
+        {"seed_run": run, "estado_operativo": "ACTIVO"}, {"_id": 0}, sort=[("id", 1)]
+    )
+    if lavadero is None:
+        sys.exit(f"no hay datos con seed_run={run}: correr antes benchmarks/seed_data.py")
+    admin = await db.users.find_one({"id": lavadero["admin_id"]}, {"_id": 0, "email": 1})
+    tokens = {
+        "admin": Principal(id=lavadero["admin_id"], email=admin["email"], rol=UserRole.ADMIN,
+                           lavadero_id=lavadero["id"]),
+        "superadmin": Principal(id="regression-superadmin", email="superadmin@regression.test",
+                                rol=UserRole.SUPER_ADMIN),
+    }
+    headers = {
+        rol: {"Authorization": f"Bearer {server.create_access_token(build_claims(p), timedelta(hours=1))}"}
+        for rol, p in tokens.items()
+    }
+    return Contexto(cliente, headers, lavadero["id"], lavadero["admin_id"])
+
+
+async def medir(caso: Caso, ctx: Contexto, n: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        await caso.ejecutar(ctx)
+    latencias, round_trips = [], []
+    for _ in range(n):
+        counter.reset()
+        inicio = time.perf_counter()
+        await caso.ejecutar(ctx)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        round_trips.append(counter.commands)
+    return {
+        "p50_ms": round(statistics.median(latencias), 2),
+        "p95_ms": round(percentile(latencias, 95), 2),
+        "round_trips": round(statistics.mean(round_trips), 2),
+    }
+
+
+ESTADOS_QUE_FALLAN = ("REGRESIÓN", "FALTA", "NUEVO")
+
+
+def comparar(baseline: dict, actual: dict, tolerancia: float, margen_ms: float,
+             tolerancia_rt: float) -> List[dict]:
+    """One row per case with both results and its status; see ESTADOS_QUE_FALLAN"""
+    filas = []
+    for nombre in list(baseline) + [n for n in actual if n not in baseline]:
+        base, ahora = baseline.get(nombre), actual.get(nombre)
+        fila = {"caso": nombre, "base": base, "actual": ahora}
+        if base is None:
+            fila["estado"] = "NUEVO"
+        elif ahora is None:
+            fila["estado"] = "FALTA"
+        else:
+            limite_p95 = max(base["p95_ms"] * (1 + tolerancia), base["p95_ms"] + margen_ms)
+            regresiones = []
+            if ahora["p95_ms"] > limite_p95:
+                regresiones.append("p95")
+            if ahora["round_trips"] > base["round_trips"] + tolerancia_rt:
+                regresiones.append("round trips")
+            if regresiones:
+                fila["estado"] = "REGRESIÓN " + ", ".join(regresiones)
+            elif ahora["p95_ms"] < base["p95_ms"] / (1 + tolerancia) or ahora["round_trips"] < base["round_trips"]:
+                fila["estado"] = "MEJORA"
+            else:
+                fila["estado"] = "OK"
+        filas.append(fila)
+    return filas
+
+
+def _delta(base: Optional[dict], ahora: Optional[dict], clave: str) -> str:
+    if base is None or ahora is None:
+        return "-"
+    if clave == "round_trips":
+        return f"{ahora[clave] - base[clave]:+g}"
+    return f"{(ahora[clave] / base[clave] - 1) * 100:+.0f}%" if base[clave] else "-"
+
+
+def print_tabla(filas: List[dict]):
+    def valor(r, clave):
+        return "-" if r is None else f"{r[clave]:g}"
+
+    print(f"{'caso':<58} {'p95 base':>9} {'p95':>9} {'Δ':>6} {'rt base':>8} {'rt':>6} {'Δ':>5}  estado")
+    for f in filas:
+        base, ahora = f["base"], f["actual"]
+        print(f"{f['caso']:<58} {valor(base, 'p95_ms'):>9} {valor(ahora, 'p95_ms'):>9} "
+              f"{_delta(base, ahora, 'p95_ms'):>6} {valor(base, 'round_trips'):>8} "
+              f"{valor(ahora, 'round_trips'):>6} {_delta(base, ahora, 'round_trips'):>5}  {f['estado']}")
+
+
+def seleccionados(args) -> List[Caso]:
+    return [
+        caso for caso in SUITE
+        if (not args.solo or args.solo in caso.nombre) and (args.con_db or not caso.usa_db)
+    ]
+
+
+async def correr(args) -> dict:
+    casos = seleccionados(args)
+    resultados = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://regression") as cliente:
+        if any(caso.usa_db for caso in casos):
+            await server.ensure_indexes()
+            ctx = await preparar(cliente, args.run)
+        else:
+            ctx = Contexto(cliente, {})
+        for caso in casos:
+            resultados[caso.nombre] = await medir(caso, ctx, args.n, args.warmup)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100, help="repeticiones medidas por caso")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--run", default="seed", help="seed_run de los datos generados")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="aumento relativo de p95 permitido")
+    parser.add_argument("--margen-ms", type=float, default=2.0, help="aumento absoluto de p95 siempre permitido")
+    parser.add_argument("--tolerancia-round-trips", type=float, default=0)
+    parser.add_argument("--solo", help="corre sólo los casos cuyo nombre contenga este texto")
+    parser.add_argument("--con-db", action="store_true",
+                        help="corre también los casos que usan MongoDB (y exige que estén en la baseline)")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    resultados = asyncio.run(correr(args))
+    nombres = {caso.nombre for caso in seleccionados(args)}
+    guardada = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+
+    if args.update_baseline:
+        # Una corrida parcial (--solo, sin --con-db) regraba sólo sus casos; los
+        # que ya no están en la suite se descartan
+        vigentes = {caso.nombre for caso in SUITE}
+        casos = {n: r for n, r in guardada.get("cases", {}).items() if n in vigentes and n not in nombres}
+        contenido = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "machine": platform.node(),
+            "seed_run": args.run,
+            "n": args.n,
+            "note": "Los casos con MongoDB son opcionales (--con-db); se graban en la máquina de referencia con: "
+                    "python benchmarks/seed_data.py --scale 1 --seed 42 && "
+                    "python benchmarks/regression.py --con-db --update-baseline",
+            "cases": {**casos, **resultados},
+        }
+        args.baseline.write_text(json.dumps(contenido, indent=2, ensure_ascii=False) + "\n")
+        print(f"baseline actualizada: {args.baseline} ({len(resultados)} casos medidos, "
+              f"{len(contenido['cases'])} en total)")
+        return
+
+    baseline = guardada.get("cases", {})
+    if not baseline:
+        # Sin baseline la compuerta no compara nada: no puede pasar
+        print(f"{args.baseline} no tiene casos: generarla con --update-baseline")
+        sys.exit(1)
+    # Mismo filtro que los casos: un caso de la baseline que ya no está en la suite queda como FALTA
+    usa_db = {caso.nombre: caso.usa_db for caso in SUITE}
+    baseline = {
+        n: r for n, r in baseline.items()
+        if (not args.solo or args.solo in n) and (args.con_db or not usa_db.get(n, True))
+    }
+    filas = comparar(baseline, resultados, args.tolerancia, args.margen_ms, args.tolerancia_round_trips)
+    print_tabla(filas)
+    fallidos = [f for f in filas if f["estado"].startswith(ESTADOS_QUE_FALLAN)]
+    if fallidos:
+        print(f"\n{len(fallidos)} casos con regresión o sin comparar respecto de {args.baseline.name}")
+        sys.exit(1)
+    print("\nsin regresiones")
+
+
+if __name__ == "__main__":
+    main()
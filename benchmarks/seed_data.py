@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Genera datos sintéticos con volumen realista para correr los benchmarks a
+1x, 10x y 100x el tamaño de producción.
+
+Crea N admins con su lavadero y configuración (con coordenadas alrededor de
+ciudades reales), M meses de pagos_mensualidad con sus comprobantes, un
+conjunto de clientes y K turnos por lavadero, con distribuciones de estados
+parecidas a las reales. Todo es reproducible: los ids y los valores salen de
+--seed, no del reloj ni de uuid4.
+
+Los turnos, que son el grueso del volumen, se generan e insertan en
+paralelo en varios procesos (--workers), por lotes con insert_many sin
+orden. Cada documento lleva ``seed_run`` para poder borrarlos con --drop.
+
+Uso:
+    python benchmarks/seed_data.py --scale 10 --seed 42 --admin-file admins.txt
+    python benchmarks/seed_data.py --admins 20000 --turnos 500 --workers 8   # ~10M turnos
+    python benchmarks/seed_data.py --drop-only
+
+Necesita MONGO_URL y DB_NAME (backend/.env).
+"""
+import argparse
+import hashlib
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import _common  # noqa: F401  (rutas y .env del backend)
+from pymongo import MongoClient
+
+# Tamaño de "producción" para --scale 1
+BASE = {"admins": 200, "meses": 12, "turnos": 500}
+
+PASSWORD = "seed1234"
+DOMINIO = "seed-lavaderos.example.com"
+BATCH = 10_000
+
+COLECCIONES = [
+    "users", "lavaderos", "configuracion_lavadero", "pagos_mensualidad",
+    "comprobantes_pago_mensualidad", "turnos",
+]
+
+CIUDADES = [
+    ("Buenos Aires", -34.6037, -58.3816, 40),
+    ("Córdoba", -31.4201, -64.1888, 15),
+    ("Rosario", -32.9442, -60.6505, 12),
+    ("Mendoza", -32.8895, -68.8458, 10),
+    ("La Plata", -34.9214, -57.9545, 8),
+    ("Mar del Plata", -38.0055, -57.5426, 6),
+    ("Tucumán", -26.8083, -65.2176, 5),
+    ("Salta", -24.7821, -65.4232, 4),
+]
+
+ESTADOS_LAVADERO = (["ACTIVO", "VENCIDO", "PENDIENTE_APROBACION", "BLOQUEADO"], [70, 12, 13, 5])
+ESTADOS_TURNO_PASADO = (["CONFIRMADO", "CANCELADO", "RESERVADO", "DISPONIBLE"], [60, 15, 5, 20])
+ESTADOS_TURNO_FUTURO = (["DISPONIBLE", "RESERVADO", "CONFIRMADO", "CANCELADO"], [55, 30, 10, 5])
+
+
+def det_id(seed: int, espacio: str, i: int) -> str:
+    """Reproducible uuid4-shaped id for the i-th document of a kind"""
+    digest = hashlib.blake2b(f"{seed}:{espacio}:{i}".encode(), digest_size=16).digest()
+    return str(uuid.UUID(bytes=digest, version=4))
+
+
+def restar_meses(fecha: datetime, meses: int) -> datetime:
+    total = fecha.year * 12 + fecha.month - 1 - meses
+    return fecha.replace(year=total // 12, month=total % 12 + 1, day=1)
+
+
+def _insertar(coleccion, docs):
+    for i in range(0, len(docs), BATCH):
+        coleccion.insert_many(docs[i:i + BATCH], ordered=False)
+
+
+def generar_admins(rng: random.Random, args, ahora: datetime, password_hash: str):
+    users, lavaderos, configs, pagos, comprobantes = [], [], [], [], []
+    ciudades = [c[:3] for c in CIUDADES]
+    pesos_ciudad = [c[3] for c in CIUDADES]
+    for n in range(args.admins):
+        admin_id = det_id(args.seed, "admin", n)
+        lavadero_id = det_id(args.seed, "lavadero", n)
+        estado = rng.choices(*ESTADOS_LAVADERO)[0]
+        antiguedad = rng.randint(1, args.meses)
+        creado = restar_meses(ahora, antiguedad) + timedelta(days=rng.randint(0, 27))
+        ciudad, lat, lon = rng.choices(ciudades, weights=pesos_ciudad)[0]
+
+        users.append({
+            "id": admin_id, "email": f"admin{n}@{DOMINIO}", "nombre": f"Admin {n}", "rol": "ADMIN",
+            "password_hash": password_hash, "created_at": creado, "is_active": True,
+            "google_id": None, "picture": None, "token_version": 0, "seed_run": args.run,
+        })
+        if estado == "ACTIVO":
+            vencimiento = ahora + timedelta(days=rng.randint(1, 30))
+        elif estado in ("VENCIDO", "BLOQUEADO"):
+            vencimiento = ahora - timedelta(days=rng.randint(1, 60))
+        else:
+            vencimiento = None
+        lavaderos.append({
+            "id": lavadero_id, "nombre": f"Lavadero {ciudad} {n}", "direccion": f"Calle {rng.randint(1, 9999)}, {ciudad}",
+            "descripcion": None, "admin_id": admin_id, "estado_operativo": estado,
+            "fecha_vencimiento": vencimiento, "created_at": creado, "is_active": True, "seed_run": args.run,
+        })
+        precio_autos = float(rng.choice([4000, 5000, 6000, 7000]))
+        configs.append({
+            "id": det_id(args.seed, "config", n), "lavadero_id": lavadero_id,
+            "hora_apertura": rng.choice(["07:00", "08:00", "09:00"]), "hora_cierre": rng.choice(["18:00", "19:00", "20:00"]),
+            "duracion_turno_minutos": rng.choice([30, 45, 60]), "dias_laborales": rng.choice([[1, 2, 3, 4, 5], [1, 2, 3, 4, 5, 6]]),
+            "alias_bancario": f"lavadero{n}.mp", "precio_turno": precio_autos,
+            "servicio_motos": rng.random() < 0.6, "servicio_autos": True, "servicio_camionetas": rng.random() < 0.8,
+            "precio_motos": precio_autos * 0.6, "precio_autos": precio_autos, "precio_camionetas": precio_autos * 1.6,
+            "latitud": round(lat + rng.gauss(0, 0.05), 6), "longitud": round(lon + rng.gauss(0, 0.05), 6),
+            "direccion_completa": f"Calle {rng.randint(1, 9999)}, {ciudad}, Argentina",
+            "esta_abierto": estado == "ACTIVO" and rng.random() < 0.5, "created_at": creado, "seed_run": args.run,
+        })
+
+        # Pagos: un mes por fila desde el alta; los últimos quedan pendientes según el estado
+        meses = 1 if estado == "PENDIENTE_APROBACION" else antiguedad
+        pendientes = {"ACTIVO": int(rng.random() < 0.2), "VENCIDO": rng.randint(1, 2),
+                      "BLOQUEADO": rng.randint(2, 3), "PENDIENTE_APROBACION": 1}[estado]
+        for m in range(meses):
+            mes = restar_meses(ahora, meses - 1 - m)
+            pago_id = det_id(args.seed, f"pago-{n}", m)
+            pago_estado = "PENDIENTE" if m >= meses - pendientes else "CONFIRMADO"
+            pagos.append({
+                "id": pago_id, "admin_id": admin_id, "lavadero_id": lavadero_id, "monto": 10000.0,
+                "mes_año": mes.strftime("%Y-%m"), "estado": pago_estado,
+                "fecha_vencimiento": mes + timedelta(days=30), "created_at": mes, "seed_run": args.run,
+            })
+            historial = []
+            if pago_estado == "CONFIRMADO":
+                if rng.random() < 0.1:
+                    historial.append("RECHAZADO")
+                historial.append("CONFIRMADO")
+            elif rng.random() < 0.5:
+                historial.append("PENDIENTE")
+            for k, comp_estado in enumerate(historial):
+                subido = mes + timedelta(days=rng.randint(0, 10), hours=k)
+                comprobantes.append({
+                    "id": det_id(args.seed, f"comprobante-{n}-{m}", k), "pago_mensualidad_id": pago_id,
+                    "admin_id": admin_id, "imagen_url": "/uploads/comprobantes/seed.webp",
+                    "imagen_original_url": None, "phash": f"{rng.getrandbits(64):016x}", "estado": comp_estado,
+                    "comentario_superadmin": {"CONFIRMADO": "Pago confirmado", "RECHAZADO": "Comprobante ilegible"}.get(comp_estado),
+                    "fecha_revision": subido + timedelta(days=1) if comp_estado != "PENDIENTE" else None,
+                    "created_at": subido, "seed_run": args.run,
+                })
+    return users, lavaderos, configs, pagos, comprobantes
+
+
+def generar_clientes(args, ahora: datetime, password_hash: str):
+    return [{
+        "id": det_id(args.seed, "cliente", i), "email": f"cliente{i}@{DOMINIO}", "nombre": f"Cliente {i}",
+        "rol": "CLIENTE", "password_hash": password_hash, "created_at": ahora, "is_active": True,
+        "google_id": None, "picture": None, "token_version": 0, "seed_run": args.run,
+    } for i in range(args.clientes)]
+
+
+def sembrar_turnos(mongo_url: str, db_name: str, seed: int, run: str, inicio: int, fin: int,
+                   turnos_por_lavadero: int, meses: int, clientes: int, ahora_ts: float) -> int:
+    """Generate and insert the turnos of lavaderos [inicio, fin); runs in a worker process"""
+    coleccion = MongoClient(mongo_url)[db_name].turnos
+    ahora = datetime.fromtimestamp(ahora_ts, timezone.utc)
+    desde = restar_meses(ahora, meses)
+    rango_horas = int((ahora + timedelta(days=30) - desde).total_seconds() // 3600)
+    total = 0
+    lote = []
+    for n in range(inicio, fin):
+        # Semilla por lavadero: el resultado no depende de cómo se repartan entre workers
+        rng = random.Random(f"{seed}:turnos:{n}")
+        lavadero_id = det_id(seed, "lavadero", n)
+        precio = float(rng.choice([4000, 5000, 6000, 7000]))
+        for k in range(turnos_por_lavadero):
+            hora = desde + timedelta(hours=rng.randrange(rango_horas))
+            fecha_hora = hora.replace(hour=8 + hora.hour % 11, minute=0, second=0, microsecond=0)
+            estados = ESTADOS_TURNO_PASADO if fecha_hora < ahora else ESTADOS_TURNO_FUTURO
+            estado = rng.choices(*estados)[0]
+            lote.append({
+                "id": det_id(seed, f"turno-{n}", k), "lavadero_id": lavadero_id,
+                "cliente_id": None if estado == "DISPONIBLE" else det_id(seed, "cliente", rng.randrange(clientes)),
+                "fecha_hora": fecha_hora, "estado": estado, "precio": precio,
+                "created_at": fecha_hora - timedelta(days=rng.randint(1, 14)), "seed_run": run,
+            })
+            if len(lote) >= BATCH:
+                coleccion.insert_many(lote, ordered=False)
+                total += len(lote)
+                lote = []
+    if lote:
+        coleccion.insert_many(lote, ordered=False)
+        total += len(lote)
+    return total
+
+
+def borrar(db, run: str):
+    for nombre in COLECCIONES:
+        resultado = db[nombre].delete_many({"seed_run": run})
+        print(f"  {nombre}: {resultado.deleted_count} borrados")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1, help="multiplica la cantidad base de admins (200)")
+    parser.add_argument("--admins", type=int)
+    parser.add_argument("--meses", type=int, default=BASE["meses"])
+    parser.add_argument("--turnos", type=int, default=BASE["turnos"], help="turnos por lavadero")
+    parser.add_argument("--clientes", type=int, help="por defecto 10 por admin")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--run", default="seed", help="marca seed_run de los documentos generados")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--admin-file", help="escribe las credenciales email:password de los admins")
+    parser.add_argument("--drop", action="store_true", help="borra antes los documentos de este --run")
+    parser.add_argument("--drop-only", action="store_true")
+    args = parser.parse_args()
+    args.admins = args.admins if args.admins is not None else int(BASE["admins"] * args.scale)
+    args.clientes = args.clientes if args.clientes is not None else max(100, args.admins * 10)
+
+    mongo_url, db_name = os.environ["MONGO_URL"], os.environ["DB_NAME"]
+    db = MongoClient(mongo_url)[db_name]
+    if args.drop or args.drop_only:
+        print(f"borrando seed_run={args.run}")
+        borrar(db, args.run)
+        if args.drop_only:
+            return
+
+    from passlib.context import CryptContext
+    password_hash = CryptContext(schemes=["bcrypt"]).hash(PASSWORD)
+    rng = random.Random(args.seed)
+    # Fecha de referencia fija por día: dos corridas con la misma semilla el mismo día coinciden
+    ahora = datetime.now(timezone.utc).replace(hour=12, minute=0, second=0, microsecond=0)
+
+    inicio = time.perf_counter()
+    users, lavaderos, configs, pagos, comprobantes = generar_admins(rng, args, ahora, password_hash)
+    users += generar_clientes(args, ahora, password_hash)
+    for nombre, docs in (("users", users), ("lavaderos", lavaderos), ("configuracion_lavadero", configs),
+                         ("pagos_mensualidad", pagos), ("comprobantes_pago_mensualidad", comprobantes)):
+        _insertar(db[nombre], docs)
+        print(f"  {nombre}: {len(docs)}")
+
+    por_worker = max(1, -(-args.admins // (args.workers * 4)))
+    rangos = [(i, min(i + por_worker, args.admins)) for i in range(0, args.admins, por_worker)]
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futuros = [
+            pool.submit(sembrar_turnos, mongo_url, db_name, args.seed, args.run, a, b,
+                        args.turnos, args.meses, args.clientes, ahora.timestamp())
+            for a, b in rangos
+        ]
+        turnos = sum(f.result() for f in futuros)
+    duracion = time.perf_counter() - inicio
+    print(f"  turnos: {turnos}")
+    print(f"listo en {duracion:.1f} s ({(len(users) + len(pagos) + len(comprobantes) + turnos) / duracion:,.0f} docs/s)")
+
+    if args.admin_file:
+        with open(args.admin_file, "w") as f:
+            f.writelines(f"{u['email']}:{PASSWORD}\n" for u in users if u["rol"] == "ADMIN")
+        print(f"credenciales de admins: {args.admin_file}")
+
+
+if __name__ == "__main__":
+    main()
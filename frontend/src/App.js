@@ -3492,10 +3492,8 @@ const GestionAdmins = () => {
                             </button>
                             {showPassword[admin.admin_id] && (
                               <div className="mt-1 text-sm text-gray-600 bg-gray-50 p-2 rounded">
-                                <strong>Hash de contraseña:</strong><br />
-                                <code className="text-xs break-all">
-                                  {admin.password_hash || 'Sin contraseña (usuario de Google)'}
-                                </code>
+                                <strong>Contraseña:</strong>{' '}
+                                {admin.has_password ? 'Contraseña establecida' : 'Sin contraseña (usuario de Google)'}
                               </div>
                             )}
                           </div>
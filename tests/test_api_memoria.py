@@ -0,0 +1,412 @@
+"""La app ASGI en proceso sobre MemoryRepositories: sin MongoDB ni red.
+
+Todas las rutas acceden a datos a través de los repositorios; los round trips
+por ruta contra Mongo se miden en test_db_budgets.py.
+"""
+import asyncio
+import inspect
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi.routing import APIRoute
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_lavaderos")
+
+import server  # noqa: E402
+from estados import EstadoAdmin, EstadoPago, EstadoTurno, UserRole  # noqa: E402
+from repositories import MemoryRepositories  # noqa: E402
+from server import Principal, build_claims  # noqa: E402
+
+PASSWORD = "admin123"
+
+
+@pytest.fixture
+def repos():
+    # Sin lifespan: conectar() no hace I/O, sólo arma el cliente y las cachés
+    server.conectar()
+    repos = MemoryRepositories()
+    server.usar_repositorios(repos)
+    server.superadmin_config.load_default()
+    yield repos
+    server.client.close()
+
+
+def _token(principal: Principal) -> dict:
+    token = server.create_access_token(build_claims(principal), timedelta(minutes=5))
+    return {"Authorization": f"Bearer {token}"}
+
+
+SUPERADMIN = _token(Principal(id="superadmin-1", email="root@example.com", rol=UserRole.SUPER_ADMIN))
+
+
+async def _sembrar(repos: MemoryRepositories):
+    ahora = datetime.now(timezone.utc)
+    await repos.users.insert({
+        "id": "admin-1", "email": "admin1@example.com", "nombre": "Admin 1", "rol": UserRole.ADMIN,
+        "password_hash": server.get_password_hash(PASSWORD), "is_active": True, "created_at": ahora
+    })
+    await repos.lavaderos.insert({
+        "id": "lav-1", "nombre": "Lavadero 1", "direccion": "-", "admin_id": "admin-1",
+        "estado_operativo": EstadoAdmin.PENDIENTE_APROBACION, "is_active": True, "created_at": ahora
+    })
+    await repos.pagos.insert({
+        "id": "pago-1", "admin_id": "admin-1", "lavadero_id": "lav-1", "monto": 10000.0, "mes_año": "2026-03",
+        "estado": EstadoPago.PENDIENTE, "fecha_vencimiento": ahora + timedelta(days=30), "created_at": ahora
+    })
+    await repos.comprobantes.insert({
+        "id": "comp-1", "pago_mensualidad_id": "pago-1", "admin_id": "admin-1", "imagen_url": "/c.jpg",
+        "estado": EstadoPago.PENDIENTE, "created_at": ahora
+    })
+    for n, estado in enumerate([EstadoTurno.CONFIRMADO, EstadoTurno.RESERVADO, EstadoTurno.RESERVADO]):
+        await repos.turnos.insert({"id": f"turno-{n}", "lavadero_id": "lav-1", "cliente_id": "cliente-1",
+                                   "estado": estado, "created_at": ahora})
+
+
+def correr(prueba):
+    async def main():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as cliente:
+            await prueba(cliente)
+    asyncio.run(main())
+
+
+def test_login_me_y_dashboard(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        response = await cliente.post("/api/login", json={"email": "admin1@example.com", "password": PASSWORD})
+        assert response.status_code == 200
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await cliente.get("/api/me", headers=headers)
+        assert response.json()["id"] == "admin-1"
+
+        response = await cliente.get("/api/dashboard/stats", headers=headers)
+        assert response.status_code == 200
+        stats = response.json()
+        assert (stats["total_turnos"], stats["turnos_confirmados"], stats["turnos_pendientes"]) == (3, 1, 2)
+
+        response = await cliente.post("/api/login", json={"email": "admin1@example.com", "password": "otra"})
+        assert response.status_code == 401
+    correr(prueba)
+
+
+def test_aprobar_comprobante_activa_el_lavadero(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        response = await cliente.get("/api/superadmin/comprobantes-pendientes", headers=SUPERADMIN)
+        assert [c["comprobante_id"] for c in response.json()] == ["comp-1"]
+
+        response = await cliente.post("/api/superadmin/aprobar-comprobante/comp-1", headers=SUPERADMIN)
+        assert response.status_code == 200
+        # Reintento: no falla ni cambia el vencimiento
+        lavadero = await repos.lavaderos.get("lav-1")
+        response = await cliente.post("/api/superadmin/aprobar-comprobante/comp-1", headers=SUPERADMIN)
+        assert response.status_code == 200
+        assert await repos.lavaderos.get("lav-1") == lavadero
+        assert lavadero["estado_operativo"] == EstadoAdmin.ACTIVO
+        assert (await repos.pagos.get("pago-1"))["estado"] == EstadoPago.CONFIRMADO
+
+        response = await cliente.get("/api/superadmin/comprobantes-historial", headers=SUPERADMIN)
+        historial = response.json()
+        assert historial["stats"]["aprobados"] == 1
+        assert historial["comprobantes"][0]["lavadero_nombre"] == "Lavadero 1"
+
+        response = await cliente.get("/api/lavaderos-operativos")
+        assert [l["id"] for l in response.json()] == ["lav-1"]
+
+        response = await cliente.post("/api/superadmin/aprobar-comprobante/no-existe", headers=SUPERADMIN)
+        assert response.status_code == 404
+    correr(prueba)
+
+
+def test_reintento_de_aprobacion_no_pisa_el_vencimiento(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        assert (await cliente.post("/api/superadmin/aprobar-comprobante/comp-1", headers=SUPERADMIN)).status_code == 200
+        # Más tarde el lavadero vence: un reintento de la aprobación vieja no lo reactiva
+        await repos.lavaderos.update("lav-1", {"estado_operativo": EstadoAdmin.VENCIDO})
+        assert (await cliente.post("/api/superadmin/aprobar-comprobante/comp-1", headers=SUPERADMIN)).status_code == 200
+        assert (await repos.lavaderos.get("lav-1"))["estado_operativo"] == EstadoAdmin.VENCIDO
+    correr(prueba)
+
+
+def test_aprobar_un_comprobante_rechazado_es_un_conflicto(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        response = await cliente.post("/api/superadmin/rechazar-comprobante/comp-1", headers=SUPERADMIN,
+                                      json={"comentario": "ilegible"})
+        assert response.status_code == 200
+        response = await cliente.post("/api/superadmin/aprobar-comprobante/comp-1", headers=SUPERADMIN)
+        assert response.status_code == 409
+        assert (await repos.comprobantes.get("comp-1"))["estado"] == EstadoPago.RECHAZADO
+        assert (await repos.pagos.get("pago-1"))["estado"] == EstadoPago.PENDIENTE
+        assert (await repos.lavaderos.get("lav-1"))["estado_operativo"] == EstadoAdmin.PENDIENTE_APROBACION
+    correr(prueba)
+
+
+def test_reintento_completa_una_aprobacion_cortada(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        # Sin transacciones: el comprobante quedó aprobado pero el pago y el lavadero no
+        await repos.comprobantes.approve("comp-1", datetime.now(timezone.utc))
+        assert (await cliente.post("/api/superadmin/aprobar-comprobante/comp-1", headers=SUPERADMIN)).status_code == 200
+        assert (await repos.pagos.get("pago-1"))["estado"] == EstadoPago.CONFIRMADO
+        assert (await repos.lavaderos.get("lav-1"))["estado_operativo"] == EstadoAdmin.ACTIVO
+    correr(prueba)
+
+
+def test_lote_no_activa_lo_que_proceso_otra_revision(repos, monkeypatch):
+    leer = repos.comprobantes.get_many
+
+    async def leer_y_rechazar_en_paralelo(comprobante_ids, fields=None):
+        leidos = await leer(comprobante_ids, fields=fields)
+        # Otro superadmin rechaza el comprobante entre la lectura y la escritura del lote
+        await repos.comprobantes.reject("comp-1", "ilegible", datetime.now(timezone.utc))
+        return leidos
+
+    async def prueba(cliente):
+        await _sembrar(repos)
+        monkeypatch.setattr(repos.comprobantes, "get_many", leer_y_rechazar_en_paralelo)
+        response = await cliente.post("/api/superadmin/comprobantes/procesar-lote", headers=SUPERADMIN, json={
+            "decisiones": [{"comprobante_id": "comp-1", "decision": "APROBAR"}]
+        })
+        assert response.status_code == 200
+        cuerpo = response.json()
+        assert (cuerpo["procesados"], cuerpo["conflictos"]) == (0, 1)
+        assert cuerpo["resultados"][0]["error"] == "Comprobante procesado por otra revisión"
+        assert (await repos.comprobantes.get("comp-1"))["estado"] == EstadoPago.RECHAZADO
+        assert (await repos.pagos.get("pago-1"))["estado"] == EstadoPago.PENDIENTE
+        assert (await repos.lavaderos.get("lav-1"))["estado_operativo"] == EstadoAdmin.PENDIENTE_APROBACION
+    correr(prueba)
+
+
+def test_facturacion_no_corre_sin_indice_unico(repos, monkeypatch):
+    async def sin_indice():
+        return False
+
+    async def no_se_puede_crear():
+        raise RuntimeError("E11000 duplicate key")
+
+    async def prueba(cliente):
+        await _sembrar(repos)
+        response = await cliente.post("/api/superadmin/facturacion/generar?mes_año=2026-04", headers=SUPERADMIN)
+        assert response.status_code == 200
+
+        monkeypatch.setattr(repos.pagos, "unique_month_index_ready", sin_indice)
+        monkeypatch.setattr(repos.pagos, "ensure_unique_month", no_se_puede_crear)
+        response = await cliente.post("/api/superadmin/facturacion/generar?mes_año=2026-05", headers=SUPERADMIN)
+        assert response.status_code == 503
+        assert not [p for p in repos.pagos.data.docs.values() if p["mes_año"] == "2026-05"]
+    correr(prueba)
+
+
+def test_registro_rechaza_email_repetido(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        response = await cliente.post("/api/register", json={
+            "email": "cliente@example.com", "password": PASSWORD, "nombre": "Cliente", "rol": UserRole.CLIENTE
+        })
+        assert response.status_code == 200
+        assert (await repos.users.get_by_email("cliente@example.com"))["rol"] == UserRole.CLIENTE
+
+        response = await cliente.post("/api/register", json={
+            "email": "cliente@example.com", "password": PASSWORD, "nombre": "Otro", "rol": UserRole.CLIENTE
+        })
+        assert response.status_code == 400
+    correr(prueba)
+
+
+def test_listado_de_admins_sin_hash(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        response = await cliente.get("/api/superadmin/admins", headers=SUPERADMIN)
+        assert response.status_code == 200
+        [admin] = response.json()
+        assert "password_hash" not in admin
+        assert admin["has_password"] is True
+        assert admin["lavadero"]["nombre"] == "Lavadero 1"
+
+        response = await cliente.get("/api/admin/users", headers=SUPERADMIN)
+        assert all("password_hash" not in user for user in response.json())
+    correr(prueba)
+
+
+async def _login(cliente, email="admin1@example.com") -> dict:
+    response = await cliente.post("/api/login", json={"email": email, "password": PASSWORD})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_desactivar_usuario_revoca_sus_tokens(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        admin = await _login(cliente)
+        assert (await cliente.get("/api/dashboard/stats", headers=admin)).status_code == 200
+
+        response = await cliente.put("/api/admin/users/admin-1/toggle-status", headers=SUPERADMIN)
+        assert response.status_code == 200
+        assert (await repos.users.get("admin-1"))["is_active"] is False
+        assert (await cliente.get("/api/dashboard/stats", headers=admin)).status_code == 401
+    correr(prueba)
+
+
+def test_actualizar_admin(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        admin = await _login(cliente)
+        response = await cliente.put("/api/superadmin/admins/admin-1", headers=SUPERADMIN,
+                                     json={"nombre": "Otro nombre", "password": "nueva123"})
+        assert response.status_code == 200
+        assert (await repos.users.get("admin-1"))["nombre"] == "Otro nombre"
+        # Los tokens emitidos antes del cambio dejan de valer; la contraseña nueva sí
+        assert (await cliente.get("/api/dashboard/stats", headers=admin)).status_code == 401
+        response = await cliente.post("/api/login", json={"email": "admin1@example.com", "password": "nueva123"})
+        assert response.status_code == 200
+    correr(prueba)
+
+
+def test_borrar_admin_purga_sus_datos(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        admin = await _login(cliente)
+        response = await cliente.delete("/api/superadmin/admins/admin-1", headers=SUPERADMIN)
+        assert response.status_code == 202
+        assert (await cliente.get("/api/dashboard/stats", headers=admin)).status_code == 401
+
+        await asyncio.gather(*server.app.state.background_tasks)
+        purga = (await cliente.get(f"/api/superadmin/purgas/{response.json()['purga_id']}", headers=SUPERADMIN)).json()
+        assert purga["estado"] == "COMPLETADA"
+        assert purga["pasos"]["lavaderos"] == 1
+        assert await repos.users.get("admin-1") is None
+        assert await repos.pagos.get("pago-1") is None
+        assert await repos.turnos.stats_lavadero("lav-1") == ({}, 0)
+    correr(prueba)
+
+
+def test_reanudar_solo_purgas_huerfanas(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        ahora = datetime.now(timezone.utc)
+        base = {"estado": "EN_CURSO", "pasos": {}, "actualizado_at": ahora}
+        await repos.purgas.insert({**base, "id": "huerfana", "admin_id": "admin-1", "lavadero_id": "lav-1",
+                                   "owner": "worker-muerto", "heartbeat_at": ahora - timedelta(hours=1)})
+        await repos.purgas.insert({**base, "id": "ajena", "admin_id": "admin-2", "lavadero_id": None,
+                                   "owner": "worker-vivo", "heartbeat_at": ahora})
+
+        await server.reanudar_purgas_interrumpidas()
+        huerfana = await repos.purgas.get("huerfana")
+        assert (huerfana["estado"], huerfana["owner"]) == ("COMPLETADA", server.WORKER_ID)
+        assert await repos.users.get("admin-1") is None
+        ajena = await repos.purgas.get("ajena")
+        assert (ajena["owner"], ajena["pasos"]) == ("worker-vivo", {})
+    correr(prueba)
+
+
+def test_registro_de_admin_guarda_la_credencial_temporal(repos):
+    async def prueba(cliente):
+        response = await cliente.post("/api/register-admin", json={
+            "email": "nuevo@example.com", "password": "clave-temporal", "nombre": "Nuevo",
+            "lavadero": {"nombre": "Lavadero Nuevo", "direccion": "-"}
+        })
+        assert response.status_code == 200
+        response = await cliente.get("/api/superadmin/credenciales-testing", headers=SUPERADMIN)
+        assert {c["email"]: c["password"] for c in response.json()} == {"nuevo@example.com": "clave-temporal"}
+    correr(prueba)
+
+
+def test_sesion_de_google_por_cookie(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        ahora = datetime.now(timezone.utc)
+        await repos.users.upsert_session({"id": "sesion-1", "user_id": "admin-1", "session_token": "token-1",
+                                          "expires_at": ahora + timedelta(days=1), "created_at": ahora})
+        await repos.users.upsert_session({"id": "sesion-2", "user_id": "admin-1", "session_token": "vencido",
+                                          "expires_at": ahora - timedelta(days=1), "created_at": ahora})
+
+        response = await cliente.get("/api/me", headers={"Cookie": "session_token=token-1"})
+        assert (response.status_code, response.json()["id"]) == (200, "admin-1")
+        assert (await cliente.get("/api/me", headers={"Cookie": "session_token=vencido"})).status_code == 401
+
+        assert (await cliente.post("/api/logout", headers={"Cookie": "session_token=token-1"})).status_code == 200
+        assert await repos.users.session_user_id("token-1", ahora) is None
+    correr(prueba)
+
+
+def test_dias_no_laborales(repos):
+    async def prueba(cliente):
+        await _sembrar(repos)
+        admin = await _login(cliente)
+        dia = {"fecha": "2099-01-01T15:30:00+00:00", "motivo": "Feriado"}
+        response = await cliente.post("/api/admin/dias-no-laborales", headers=admin, json=dia)
+        assert response.status_code == 200
+        dia_id = response.json()["dia"]["id"]
+        # Mismo día a otra hora: ya está marcado
+        response = await cliente.post("/api/admin/dias-no-laborales", headers=admin,
+                                      json={"fecha": "2099-01-01T09:00:00+00:00"})
+        assert response.status_code == 400
+
+        response = await cliente.get("/api/admin/dias-no-laborales", headers=admin)
+        assert [d["id"] for d in response.json()] == [dia_id]
+
+        assert (await cliente.delete(f"/api/admin/dias-no-laborales/{dia_id}", headers=admin)).status_code == 200
+        assert (await cliente.delete(f"/api/admin/dias-no-laborales/{dia_id}", headers=admin)).status_code == 404
+        assert (await cliente.get("/api/admin/dias-no-laborales", headers=admin)).json() == []
+    correr(prueba)
+
+
+# Cuerpo válido de cada ruta protegida que lo necesita: sin él FastAPI responde
+# 422 antes de llegar a la autenticación
+CUERPOS = {
+    ("POST", "/api/comprobante-mensualidad"): {"files": {"imagen": ("c.png", b"x", "image/png")}},
+    ("POST", "/api/superadmin/rechazar-comprobante/{comprobante_id}"): {"json": {"comentario": "x"}},
+    ("POST", "/api/superadmin/comprobantes/procesar-lote"): {"json": {"decisiones": []}},
+    ("PUT", "/api/superadmin/admins/{admin_id}"): {"json": {"nombre": "x"}},
+    ("POST", "/api/superadmin/crear-admin"): {"json": {
+        "email": "nuevo@example.com", "password": "x", "nombre": "x",
+        "lavadero": {"nombre": "x", "direccion": "x"}
+    }},
+    ("PUT", "/api/admin/configuracion"): {"json": {
+        "hora_apertura": "08:00", "hora_cierre": "18:00", "duracion_turno_minutos": 60,
+        "dias_laborales": [1], "alias_bancario": "x", "precio_turno": 1.0
+    }},
+    ("POST", "/api/admin/dias-no-laborales"): {"json": {"fecha": "2099-01-01T00:00:00"}},
+    ("PUT", "/api/superadmin/configuracion"): {"json": {}},
+}
+AUTENTICACION = ("get_current_principal(", "get_admin_user(", "get_super_admin_user(", "get_current_user(")
+
+
+def _rutas_protegidas():
+    for ruta in server.api_router.routes:
+        if not isinstance(ruta, APIRoute):
+            continue
+        fuente = inspect.getsource(inspect.unwrap(ruta.endpoint))
+        if any(llamada in fuente for llamada in AUTENTICACION):
+            for metodo in ruta.methods:
+                yield metodo, ruta.path, ruta.body_field is not None
+
+
+@pytest.mark.parametrize("accion", ["desactivar", "borrar"])
+def test_token_de_usuario_desactivado_o_borrado_no_sirve(repos, accion):
+    rutas = list(_rutas_protegidas())
+    assert {(m, r) for m, r, cuerpo in rutas if cuerpo} == set(CUERPOS), "cada ruta con cuerpo necesita uno"
+
+    async def prueba(cliente):
+        await _sembrar(repos)
+        admin = await _login(cliente)
+        if accion == "desactivar":
+            response = await cliente.put("/api/admin/users/admin-1/toggle-status", headers=SUPERADMIN)
+        else:
+            response = await cliente.delete("/api/admin/users/admin-1", headers=SUPERADMIN)
+        assert response.status_code == 200
+
+        rechazadas = []
+        for metodo, ruta, _ in rutas:
+            url = re.sub(r"\{[^}]+\}", "x", ruta)
+            response = await cliente.request(metodo, url, headers=admin, **CUERPOS.get((metodo, ruta), {}))
+            if response.status_code != 401:
+                rechazadas.append(f"{metodo} {ruta}: {response.status_code}")
+        assert rechazadas == []
+    correr(prueba)
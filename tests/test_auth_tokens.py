@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta, timezone
+
+from auth_tokens import Principal, TokenRevocationRegistry, build_claims, principal_from_claims
+
+
+def _principal(token_version=0):
+    return Principal(id="u-1", email="admin@test.com", rol="ADMIN", lavadero_id="lav-1", token_version=token_version)
+
+
+def test_claims_ida_y_vuelta():
+    principal = _principal(token_version=3)
+    assert principal_from_claims(build_claims(principal)) == principal
+
+
+def test_token_antiguo_no_tiene_principal():
+    assert principal_from_claims({"sub": "admin@test.com"}) is None
+
+
+def test_revocacion_por_version_minima():
+    registry = TokenRevocationRegistry(users=None, collection=None, token_lifetime=timedelta(minutes=30))
+    assert not registry.is_revoked(_principal(0))
+
+    registry._aplicar({"_id": "u-1", "min_version": 1, "updated_at": datetime.now(timezone.utc)})
+    assert registry.is_revoked(_principal(0))
+    assert not registry.is_revoked(_principal(1))
+
+    # Un refresco con una versión vieja no deshace una revocación más nueva
+    registry._aplicar({"_id": "u-1", "min_version": 2, "updated_at": datetime.now(timezone.utc)})
+    registry._aplicar({"_id": "u-1", "min_version": 1, "updated_at": datetime.now(timezone.utc)})
+    assert registry.is_revoked(_principal(1))
@@ -0,0 +1,62 @@
+import asyncio
+
+from config_cache import LavaderoConfigCache
+from repositories import MemoryRepositories
+
+
+def _lavadero(n):
+    return {"id": f"lav-{n}", "admin_id": f"admin-{n}", "nombre": f"Lavadero {n}"}
+
+
+def test_hit_por_admin_y_por_lavadero():
+    cache = LavaderoConfigCache(lavaderos=None, maxsize=10)
+    config = {"lavadero_id": "lav-1", "esta_abierto": False}
+    cache.put(_lavadero(1), config)
+
+    assert asyncio.run(cache.get_by_admin("admin-1")) == (_lavadero(1), config)
+    assert asyncio.run(cache.get_by_lavadero("lav-1")) == (_lavadero(1), config)
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 0
+
+
+def test_write_through_e_invalidacion():
+    cache = LavaderoConfigCache(lavaderos=None, maxsize=10)
+    cache.put(_lavadero(1), None)
+    cache.put_config({"lavadero_id": "lav-1", "esta_abierto": True})
+    assert asyncio.run(cache.get_by_lavadero("lav-1"))[1] == {"lavadero_id": "lav-1", "esta_abierto": True}
+
+    cache.invalidate(admin_id="admin-1")
+    assert cache.stats()["size"] == 0
+    assert cache._por_admin.get("admin-1") is None
+
+
+def test_tamaño_acotado_cuenta_desalojos():
+    cache = LavaderoConfigCache(lavaderos=None, maxsize=2)
+    for n in range(5):
+        cache.put(_lavadero(n), None)
+
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 3
+
+
+def test_write_through_guarda_la_misma_proyeccion_que_la_lectura():
+    repos = MemoryRepositories()
+    lavadero = {**_lavadero(1), "direccion": "-", "descripcion": "larga " * 100, "is_active": True}
+    config = {"id": "conf-1", "lavadero_id": "lav-1", "esta_abierto": False, "notas_internas": "x" * 500}
+
+    async def main():
+        await repos.lavaderos.insert(lavadero)
+        await repos.lavaderos.insert_config(config)
+        campos = {"fields": ("id", "admin_id", "nombre"), "config_fields": ("lavadero_id", "esta_abierto")}
+        leida = LavaderoConfigCache(repos.lavaderos, maxsize=10, **campos)
+        escrita = LavaderoConfigCache(repos.lavaderos, maxsize=10, **campos)
+        # Lo que devuelve un upsert: el documento completo
+        escrita.put(lavadero, config)
+        return await leida.get_by_admin("admin-1"), await escrita.get_by_admin("admin-1")
+
+    desde_la_base, write_through = asyncio.run(main())
+    assert write_through == desde_la_base == (
+        {"id": "lav-1", "admin_id": "admin-1", "nombre": "Lavadero 1"},
+        {"lavadero_id": "lav-1", "esta_abierto": False}
+    )
@@ -0,0 +1,344 @@
+"""Presupuesto de round trips a MongoDB por ruta.
+
+Cada endpoint de api_router declara con ``@db_budget(n)`` cuántos comandos
+puede mandar a Mongo. El primer test corre siempre y exige que todas las
+rutas lo declaren. El segundo siembra datos en la base de MONGO_URL/DB_NAME,
+llama cada ruta en proceso y falla si alguna hace más round trips que su
+presupuesto (así un N+1 aparece acá y no en producción); se saltea si no
+hay MongoDB.
+"""
+import asyncio
+import io
+import os
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+import httpx
+import pytest
+from fastapi.routing import APIRoute
+from PIL import Image
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_lavaderos")
+
+import db_tracing  # noqa: E402
+import server  # noqa: E402
+from db_tracing import round_trip_budget  # noqa: E402
+from fake_auth_server import FakeAuthSettings, create_fake_auth_app  # noqa: E402
+from server import EstadoAdmin, EstadoPago, EstadoTurno, Principal, UserRole, build_claims  # noqa: E402
+from upstream import UpstreamClient  # noqa: E402
+
+PASSWORD = "admin123"
+DOMINIO = "budget-lavaderos.example.com"
+
+
+def _rutas() -> Dict[tuple, Callable]:
+    return {
+        (metodo, route.path.removeprefix(server.api_router.prefix)): route.endpoint
+        for route in server.api_router.routes if isinstance(route, APIRoute)
+        for metodo in route.methods
+    }
+
+
+def test_todas_las_rutas_declaran_presupuesto():
+    sin_presupuesto = [ruta for ruta, endpoint in _rutas().items() if round_trip_budget(endpoint) is None]
+    assert sin_presupuesto == []
+
+
+@dataclass
+class Escenario:
+    metodo: str
+    ruta: str  # plantilla, tal como la declara api_router
+    rol: Optional[str] = None
+    url: Optional[Callable[[dict], str]] = None
+    request: Callable[[dict], dict] = lambda d: {}
+    status: int = 200
+
+
+ESCENARIOS = [
+    Escenario("GET", "/"),
+    Escenario("GET", "/health"),
+    Escenario("GET", "/health/live"),
+    Escenario("GET", "/health/ready"),
+    Escenario("GET", "/superadmin-config"),
+    Escenario("GET", "/lavaderos-operativos"),
+    Escenario("POST", "/register", request=lambda d: {"json": {
+        "email": f"{d['p']}cliente-nuevo@{DOMINIO}", "password": PASSWORD, "nombre": "Cliente", "rol": UserRole.CLIENTE
+    }}),
+    Escenario("POST", "/register-admin", request=lambda d: {"json": {
+        "email": f"{d['p']}admin-nuevo@{DOMINIO}", "password": PASSWORD, "nombre": "Admin",
+        "lavadero": {"nombre": f"{d['p']}registrado", "direccion": "-"}
+    }}),
+    Escenario("POST", "/login", request=lambda d: {"json": {"email": d["admin_a_email"], "password": PASSWORD}}),
+    Escenario("GET", "/me", "admin"),
+    Escenario("GET", "/dashboard/stats", "admin"),
+    Escenario("GET", "/admin/users", "superadmin"),
+    Escenario("GET", "/protected", "admin"),
+    Escenario("GET", "/admin-only", "admin"),
+    Escenario("GET", "/session-data", request=lambda d: {"headers": {"X-Session-ID": f"{d['p']}google"}}),
+    Escenario("POST", "/set-session-cookie", request=lambda d: {"json": {"session_token": d["sesion"]}}),
+    Escenario("GET", "/check-session", request=lambda d: {"cookies": {"session_token": d["sesion"]}}),
+    Escenario("GET", "/superadmin/lavaderos", "superadmin"),
+    Escenario("GET", "/superadmin/comprobantes-pendientes", "superadmin"),
+    Escenario("GET", "/superadmin/comprobantes-historial", "superadmin"),
+    Escenario("GET", "/admin/mis-comprobantes", "admin"),
+    Escenario("GET", "/admin/pago-pendiente", "admin"),
+    Escenario("GET", "/superadmin/admins", "superadmin"),
+    Escenario("GET", "/superadmin/admins/{admin_id}/password", "superadmin",
+              url=lambda d: f"/superadmin/admins/{d['admin_b']}/password"),
+    Escenario("GET", "/superadmin/purgas/{purga_id}", "superadmin", url=lambda d: f"/superadmin/purgas/{d['purga']}"),
+    Escenario("GET", "/admin/configuracion", "admin"),
+    Escenario("GET", "/admin/dias-no-laborales", "admin"),
+    Escenario("GET", "/superadmin/configuracion", "superadmin"),
+    Escenario("GET", "/superadmin/credenciales-testing", "superadmin"),
+    Escenario("GET", "/superadmin/cache-stats", "superadmin"),
+    Escenario("GET", "/superadmin/perfiles", "superadmin"),
+    Escenario("GET", "/superadmin/perfiles/{perfil_id}", "superadmin",
+              url=lambda d: f"/superadmin/perfiles/{d['perfil']}"),
+    Escenario("GET", "/superadmin/slow-queries", "superadmin"),
+    Escenario("GET", "/uploads/comprobantes/{filename}", url=lambda d: f"/uploads/comprobantes/{d['imagen']}"),
+    Escenario("POST", "/comprobante-mensualidad", "admin_b", request=lambda d: {
+        "files": {"imagen": ("comprobante.png", d["png"], "image/png")}
+    }),
+    Escenario("PUT", "/admin/configuracion", "admin", request=lambda d: {"json": {
+        "hora_apertura": "08:00", "hora_cierre": "18:00", "duracion_turno_minutos": 60,
+        "dias_laborales": [1, 2, 3, 4, 5], "alias_bancario": "budget.mp", "precio_turno": 5000.0
+    }}),
+    Escenario("POST", "/admin/dias-no-laborales", "admin", request=lambda d: {"json": {
+        "fecha": (datetime.now(timezone.utc) + timedelta(days=3)).isoformat(), "motivo": "feriado"
+    }}),
+    Escenario("DELETE", "/admin/dias-no-laborales/{dia_id}", "admin",
+              url=lambda d: f"/admin/dias-no-laborales/{d['dia']}"),
+    Escenario("POST", "/admin/toggle-apertura", "admin"),
+    Escenario("POST", "/superadmin/aprobar-comprobante/{comprobante_id}", "superadmin",
+              url=lambda d: f"/superadmin/aprobar-comprobante/{d['comprobantes'][0]}"),
+    Escenario("POST", "/superadmin/rechazar-comprobante/{comprobante_id}", "superadmin",
+              url=lambda d: f"/superadmin/rechazar-comprobante/{d['comprobantes'][1]}",
+              request=lambda d: {"json": {"comentario": "ilegible"}}),
+    Escenario("POST", "/superadmin/comprobantes/procesar-lote", "superadmin", request=lambda d: {"json": {
+        "decisiones": [{"comprobante_id": d["comprobantes"][2], "decision": "APROBAR"}]
+    }}),
+    Escenario("PUT", "/superadmin/configuracion", "superadmin", request=lambda d: {"json": d["config_superadmin"]}),
+    Escenario("PUT", "/superadmin/admins/{admin_id}", "superadmin",
+              url=lambda d: f"/superadmin/admins/{d['admin_b']}", request=lambda d: {"json": {"nombre": "Admin B"}}),
+    Escenario("POST", "/superadmin/crear-admin", "superadmin", request=lambda d: {"json": {
+        "email": f"{d['p']}admin-creado@{DOMINIO}", "password": PASSWORD, "nombre": "Admin",
+        "lavadero": {"nombre": f"{d['p']}creado", "direccion": "-"}
+    }}),
+    Escenario("POST", "/superadmin/toggle-lavadero/{admin_id}", "superadmin",
+              url=lambda d: f"/superadmin/toggle-lavadero/{d['admin_b']}"),
+    Escenario("POST", "/superadmin/facturacion/generar", "superadmin",
+              request=lambda d: {"params": {"mes_año": "2099-12"}}),
+    Escenario("PUT", "/admin/users/{user_id}/toggle-status", "superadmin",
+              url=lambda d: f"/admin/users/{d['cliente']}/toggle-status"),
+    Escenario("POST", "/logout", request=lambda d: {"cookies": {"session_token": d["sesion"]}}),
+    Escenario("DELETE", "/admin/users/{user_id}", "superadmin", url=lambda d: f"/admin/users/{d['borrable']}"),
+    Escenario("DELETE", "/superadmin/admins/{admin_id}", "superadmin",
+              url=lambda d: f"/superadmin/admins/{d['admin_b']}", status=202),
+]
+
+
+def _mongo_disponible() -> bool:
+    try:
+        MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=500).admin.command("ping")
+    except PyMongoError:
+        return False
+    return True
+
+
+def _png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 30, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def sembrar(p: str) -> dict:
+    db = server.db
+    ahora = datetime.now(timezone.utc)
+    password_hash = server.get_password_hash(PASSWORD)
+
+    def usuario(nombre, rol, **extra):
+        return {"id": p + nombre, "email": f"{p}{nombre}@{DOMINIO}", "nombre": nombre, "rol": rol,
+                "password_hash": password_hash, "created_at": ahora, "is_active": True,
+                "google_id": None, "picture": None, "token_version": 0, **extra}
+
+    await db.users.insert_many([
+        usuario("superadmin", UserRole.SUPER_ADMIN), usuario("admin-a", UserRole.ADMIN),
+        usuario("admin-b", UserRole.ADMIN), usuario("admin-c", UserRole.ADMIN), usuario("cliente", UserRole.CLIENTE),
+        usuario("borrable", UserRole.CLIENTE),
+    ])
+    await db.lavaderos.insert_many([
+        {"id": p + "lav-a", "nombre": p + "lav-a", "direccion": "-", "descripcion": None, "admin_id": p + "admin-a",
+         "estado_operativo": EstadoAdmin.ACTIVO, "fecha_vencimiento": ahora + timedelta(days=30),
+         "created_at": ahora, "is_active": True},
+        {"id": p + "lav-b", "nombre": p + "lav-b", "direccion": "-", "descripcion": None, "admin_id": p + "admin-b",
+         "estado_operativo": EstadoAdmin.PENDIENTE_APROBACION, "fecha_vencimiento": None,
+         "created_at": ahora, "is_active": True},
+        # Vencido: también se factura, así la facturación pasa por más de un lote
+        {"id": p + "lav-c", "nombre": p + "lav-c", "direccion": "-", "descripcion": None, "admin_id": p + "admin-c",
+         "estado_operativo": EstadoAdmin.VENCIDO, "fecha_vencimiento": ahora - timedelta(days=1),
+         "created_at": ahora, "is_active": True},
+    ])
+    await db.configuracion_lavadero.insert_one({
+        "id": p + "config-a", "lavadero_id": p + "lav-a", "hora_apertura": "08:00", "hora_cierre": "18:00",
+        "duracion_turno_minutos": 60, "dias_laborales": [1, 2, 3, 4, 5], "alias_bancario": "a.mp",
+        "precio_turno": 5000.0, "esta_abierto": False, "created_at": ahora
+    })
+
+    pagos, comprobantes = [], []
+    for n, estado in enumerate([EstadoPago.CONFIRMADO, EstadoPago.PENDIENTE, EstadoPago.PENDIENTE,
+                                EstadoPago.PENDIENTE]):
+        pagos.append({"id": f"{p}pago-a{n}", "admin_id": p + "admin-a", "lavadero_id": p + "lav-a",
+                      "monto": 10000.0, "mes_año": f"2098-{n + 1:02d}", "estado": estado,
+                      "fecha_vencimiento": ahora, "created_at": ahora})
+        comprobantes.append({"id": f"{p}comp-a{n}", "pago_mensualidad_id": f"{p}pago-a{n}",
+                             "admin_id": p + "admin-a", "imagen_url": "/uploads/comprobantes/x.png",
+                             "imagen_original_url": None, "phash": f"{n:016x}", "estado": estado,
+                             "comentario_superadmin": None, "fecha_revision": None, "created_at": ahora})
+    pagos.append({"id": p + "pago-b", "admin_id": p + "admin-b", "lavadero_id": p + "lav-b", "monto": 10000.0,
+                  "mes_año": "2098-01", "estado": EstadoPago.PENDIENTE, "fecha_vencimiento": ahora,
+                  "created_at": ahora})
+    await db.pagos_mensualidad.insert_many(pagos)
+    await db.comprobantes_pago_mensualidad.insert_many(comprobantes)
+
+    await db.turnos.insert_many([
+        {"id": f"{p}turno-{n}", "lavadero_id": p + "lav-a", "cliente_id": p + "cliente",
+         "fecha_hora": ahora + timedelta(hours=n), "estado": estado, "precio": 5000.0, "created_at": ahora}
+        for n, estado in enumerate([EstadoTurno.RESERVADO, EstadoTurno.CONFIRMADO, EstadoTurno.CANCELADO])
+    ])
+    await db.comprobantes_pago.insert_one({"id": p + "comp-turno", "turno_id": p + "turno-0",
+                                           "estado": EstadoPago.PENDIENTE, "created_at": ahora})
+    await db.dias_no_laborales.insert_one({"id": p + "dia", "lavadero_id": p + "lav-a",
+                                           "fecha": ahora + timedelta(days=10), "motivo": None,
+                                           "created_at": ahora})
+    await db.temp_credentials.insert_one({"admin_email": f"{p}admin-a@{DOMINIO}", "password": PASSWORD,
+                                          "created_at": ahora})
+    await db.google_sessions.insert_one({"id": p + "sesion", "user_id": p + "cliente", "session_token": p + "sesion",
+                                         "expires_at": ahora + timedelta(days=1), "created_at": ahora})
+    await db.purgas.insert_one({"id": p + "purga", "admin_id": p + "admin-x", "estado": "COMPLETADA",
+                                "pasos": {}, "created_at": ahora, "actualizado_at": ahora})
+    await db.perfiles.insert_one({"id": p + "perfil", "speedscope": "{}", "created_at": ahora})
+    imagen = f"{p}imagen.png"
+    (server.COMPROBANTES_DIR / imagen).write_bytes(_png())
+
+    config_superadmin = await server.superadmin_config.get()
+    return {
+        "p": p,
+        "admin_a_email": f"{p}admin-a@{DOMINIO}",
+        "admin_b": p + "admin-b",
+        "cliente": p + "cliente",
+        "borrable": p + "borrable",
+        "sesion": p + "sesion",
+        "purga": p + "purga",
+        "perfil": p + "perfil",
+        "dia": p + "dia",
+        "imagen": imagen,
+        "png": _png(),
+        "comprobantes": [f"{p}comp-a{n}" for n in (1, 2, 3)],
+        "config_superadmin": {k: config_superadmin[k] for k in ("alias_bancario", "precio_mensualidad")},
+        "tokens": {
+            rol: server.create_access_token(build_claims(principal), timedelta(minutes=30))
+            for rol, principal in {
+                "superadmin": Principal(id=p + "superadmin", email=f"{p}superadmin@{DOMINIO}",
+                                        rol=UserRole.SUPER_ADMIN),
+                "admin": Principal(id=p + "admin-a", email=f"{p}admin-a@{DOMINIO}", rol=UserRole.ADMIN,
+                                   lavadero_id=p + "lav-a"),
+                "admin_b": Principal(id=p + "admin-b", email=f"{p}admin-b@{DOMINIO}", rol=UserRole.ADMIN,
+                                     lavadero_id=p + "lav-b"),
+            }.items()
+        },
+    }
+
+
+async def limpiar(p: str):
+    db = server.db
+    # Los usuarios creados por las rutas (registro, Google) también tienen el prefijo en el email
+    prefijo = {"$regex": f"^{p}"}
+    usuarios = [u["id"] async for u in db.users.find({"email": prefijo}, {"_id": 0, "id": 1})]
+    ids = {"$in": usuarios}
+    lavaderos = [lav["id"] async for lav in db.lavaderos.find({"admin_id": ids}, {"_id": 0, "id": 1})]
+    for comprobante in await db.comprobantes_pago_mensualidad.find(
+        {"admin_id": ids}, {"_id": 0, "imagen_url": 1}
+    ).to_list(None):
+        (server.COMPROBANTES_DIR / comprobante["imagen_url"].rsplit("/", 1)[-1]).unlink(missing_ok=True)
+    (server.COMPROBANTES_DIR / f"{p}imagen.png").unlink(missing_ok=True)
+
+    await db.users.delete_many({"id": ids})
+    await db.lavaderos.delete_many({"admin_id": ids})
+    await db.configuracion_lavadero.delete_many({"lavadero_id": {"$in": lavaderos}})
+    await db.pagos_mensualidad.delete_many({"$or": [{"admin_id": ids}, {"mes_año": "2099-12"}]})
+    await db.comprobantes_pago_mensualidad.delete_many({"admin_id": ids})
+    await db.turnos.delete_many({"lavadero_id": {"$in": lavaderos}})
+    await db.comprobantes_pago.delete_many({"id": prefijo})
+    await db.dias_no_laborales.delete_many({"lavadero_id": {"$in": lavaderos}})
+    await db.temp_credentials.delete_many({"admin_email": prefijo})
+    await db.google_sessions.delete_many({"$or": [{"user_id": ids}, {"session_token": {"$regex": f"^token-{p}"}}]})
+    await db.purgas.delete_many({"$or": [{"id": prefijo}, {"admin_id": ids}]})
+    await db.perfiles.delete_many({"id": prefijo})
+    await db.token_revocations.delete_many({"_id": ids})
+
+
+@pytest.mark.skipif(not _mongo_disponible(), reason="necesita MongoDB en MONGO_URL")
+def test_round_trips_por_ruta_dentro_del_presupuesto(monkeypatch):
+    # Cada request del middleware deja acá su RequestDbStats
+    capturados = []
+    tracking_original = db_tracing.tracking
+
+    @contextmanager
+    def tracking_capturado(label=None):
+        with tracking_original(label) as stats:
+            capturados.append(stats)
+            yield stats
+
+    monkeypatch.setattr(db_tracing, "tracking", tracking_capturado)
+    # Un lavadero por lote: la facturación tiene que respetar el presupuesto por lote
+    monkeypatch.setattr(server, "FACTURACION_BATCH_SIZE", 1)
+    fake_auth = create_fake_auth_app(FakeAuthSettings())
+    monkeypatch.setattr(server, "auth_client", UpstreamClient(
+        "auth", "http://fake-auth", transport=httpx.ASGITransport(app=fake_auth)
+    ))
+    rutas = _rutas()
+    assert {(e.metodo, e.ruta) for e in ESCENARIOS} == set(rutas), "cada ruta necesita su escenario"
+
+    async def run():
+        server.conectar()
+        server.app.state.background_tasks = set()
+        server.slow_query_log.bind(server.db, asyncio.get_running_loop())
+        await server.ensure_indexes()
+        # Lo hace phash_sync.run() en el arranque; sin él readiness responde 503
+        await server.phash_sync.refresh()
+        p = f"budget-{uuid.uuid4().hex[:8]}-"
+        excedidos = []
+        try:
+            datos = await sembrar(p)
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test/api") as cliente:
+                for escenario in ESCENARIOS:
+                    url = escenario.url(datos) if escenario.url else escenario.ruta
+                    kwargs = escenario.request(datos)
+                    if escenario.rol:
+                        kwargs.setdefault("headers", {})["Authorization"] = f"Bearer {datos['tokens'][escenario.rol]}"
+                    cliente.cookies.clear()
+                    response = await cliente.request(escenario.metodo, url, **kwargs)
+                    ruta = f"{escenario.metodo} {escenario.ruta}"
+                    assert response.status_code == escenario.status, f"{ruta}: {response.text[:300]}"
+                    stats = capturados[-1]
+                    presupuesto = round_trip_budget(rutas[(escenario.metodo, escenario.ruta)])
+                    presupuesto += stats.extra_budget
+                    if stats.commands > presupuesto:
+                        excedidos.append(f"{ruta}: {stats.commands} > {presupuesto}\n{stats.summary()}")
+            # La purga del admin borrado corre en segundo plano
+            await asyncio.gather(*server.app.state.background_tasks, return_exceptions=True)
+        finally:
+            await limpiar(p)
+            await server.auth_client.aclose()
+            server.client.close()
+        return excedidos
+
+    excedidos = asyncio.run(run())
+    assert excedidos == [], "\n".join(excedidos)
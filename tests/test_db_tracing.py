@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+from fastapi import FastAPI
+
+from db_tracing import (
+    DB_BUDGET_EXCEEDED, DB_REPEATED, DbTracingMiddleware, MongoCommandTracer, command_shape, db_budget,
+    extend_budget, tracking
+)
+
+tracer = MongoCommandTracer()
+
+
+def _comando(request_id, nombre, comando, micros=1000):
+    tracer.started(SimpleNamespace(request_id=request_id, command_name=nombre, command=comando))
+    tracer.succeeded(SimpleNamespace(request_id=request_id, command_name=nombre, duration_micros=micros))
+
+
+def test_forma_sin_valores():
+    a = command_shape("find", {"find": "users", "filter": {"email": "a@x.com", "purga_id": {"$exists": False}}})
+    b = command_shape("find", {"find": "users", "filter": {"email": "b@x.com", "purga_id": {"$exists": False}}})
+    assert a == b == 'find users {"email": "?", "purga_id": {"$exists": "?"}}'
+
+    pipeline = command_shape("aggregate", {"aggregate": "lavaderos", "pipeline": [
+        {"$match": {"id": {"$in": ["1", "2"]}}}, {"$limit": 1}
+    ]})
+    assert pipeline == 'aggregate lavaderos [{"$match": {"id": {"$in": "?"}}}, {"$limit": "?"}]'
+
+
+def test_atribucion_por_contexto():
+    with tracking() as stats:
+        _comando(1, "find", {"find": "users", "filter": {"id": "1"}})
+        _comando(2, "hello", {"hello": 1})
+    # Fuera del bloque no se atribuye a nadie
+    _comando(3, "find", {"find": "users", "filter": {"id": "2"}})
+
+    assert stats.commands == 1
+    assert stats.duration_ms == 1.0
+
+
+def test_middleware_marca_consultas_repetidas():
+    app = FastAPI()
+
+    @app.get("/lavaderos/{lavadero_id}/turnos")
+    async def turnos(lavadero_id: str):
+        for n in range(4):
+            _comando(n, "find", {"find": "turnos", "filter": {"id": str(n)}})
+        return {}
+
+    app.add_middleware(DbTracingMiddleware, debug_headers=True, repeated_query_threshold=3)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as cliente:
+            return await cliente.get("/lavaderos/1/turnos")
+
+    antes = DB_REPEATED.value(("GET", "/lavaderos/{lavadero_id}/turnos"))
+    respuesta = asyncio.run(run())
+
+    assert respuesta.headers["x-db-round-trips"] == "4"
+    assert respuesta.headers["x-db-repeated-query"] == "1"
+    assert DB_REPEATED.value(("GET", "/lavaderos/{lavadero_id}/turnos")) == antes + 1
+
+
+def test_middleware_cuenta_presupuesto_excedido():
+    app = FastAPI()
+
+    @app.get("/admin/configuracion")
+    @db_budget(2)
+    async def configuracion():
+        _comando(1, "find", {"find": "lavaderos", "filter": {"id": "1"}})
+        _comando(2, "find", {"find": "configuracion_lavadero", "filter": {"lavadero_id": "1"}})
+        _comando(3, "commitTransaction", {"commitTransaction": 1})
+        return {}
+
+    @app.post("/facturacion")
+    @db_budget(1)
+    async def facturacion():
+        for n in range(3):
+            if n:
+                extend_budget(1)
+            _comando(n, "insert", {"insert": "pagos_mensualidad"})
+        return {}
+
+    app.add_middleware(DbTracingMiddleware)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as cliente:
+            await cliente.get("/admin/configuracion")
+            await cliente.post("/facturacion")
+
+    antes = DB_BUDGET_EXCEEDED.value(("GET", "/admin/configuracion"))
+    antes_lotes = DB_BUDGET_EXCEEDED.value(("POST", "/facturacion"))
+    asyncio.run(run())
+
+    # El commit de la transacción es un round trip más: tres contra un presupuesto de dos
+    assert DB_BUDGET_EXCEEDED.value(("GET", "/admin/configuracion")) == antes + 1
+    # Cada lote extra amplía el presupuesto del request
+    assert DB_BUDGET_EXCEEDED.value(("POST", "/facturacion")) == antes_lotes
@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+from health import CachedCheck, Pinger, PoolStats
+
+
+def test_readiness_cacheada():
+    llamadas = []
+
+    async def check():
+        llamadas.append(1)
+        return {"ready": True}
+
+    async def run():
+        cached = CachedCheck(check, ttl=60)
+        return await asyncio.gather(*(cached.get() for _ in range(10)))
+
+    assert asyncio.run(run()) == [{"ready": True}] * 10
+    assert len(llamadas) == 1
+
+
+def test_ping_colgado_no_se_relanza():
+    class DbColgada:
+        pings = 0
+
+        async def command(self, nombre):
+            self.pings += 1
+            await asyncio.sleep(10)
+
+    async def run():
+        db = DbColgada()
+        pinger = Pinger(db, timeout=0.01)
+        resultados = [await pinger.ping() for _ in range(3)]
+        pinger._en_curso.cancel()
+        return db.pings, resultados
+
+    pings, resultados = asyncio.run(run())
+    assert pings == 1
+    assert all(not r["ok"] for r in resultados)
+
+
+def test_pool_stats():
+    stats = PoolStats()
+    evento = SimpleNamespace(address=("localhost", 27017))
+    stats.connection_created(evento)
+    stats.connection_created(evento)
+    stats.connection_checked_out(evento)
+
+    assert stats.snapshot() == {"size": 2, "checked_out": 1}
+    stats.connection_checked_in(evento)
+    stats.connection_closed(evento)
+    assert stats.snapshot() == {"size": 1, "checked_out": 0}
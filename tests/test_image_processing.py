@@ -0,0 +1,43 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from image_processing import ImageSettings, InvalidImageError, normalize_image
+
+
+def _imagen(size=(3000, 2000), mode="RGB", formato="JPEG", **save_kwargs):
+    buffer = BytesIO()
+    Image.new(mode, size, "white").save(buffer, format=formato, **save_kwargs)
+    return buffer.getvalue()
+
+
+def test_reduce_a_la_dimension_maxima_y_quita_exif():
+    exif = Image.Exif()
+    exif[0x010F] = "Camara de prueba"
+    data = _imagen(exif=exif.tobytes())
+
+    resultado = normalize_image(data, ImageSettings(max_dimension=1000))
+
+    img = Image.open(BytesIO(resultado.content))
+    assert img.format == "WEBP"
+    assert max(img.size) == 1000
+    assert "exif" not in img.info
+    assert resultado.original_size == len(data)
+
+
+def test_jpeg_aplana_transparencia():
+    data = _imagen(size=(200, 100), mode="RGBA", formato="PNG")
+
+    resultado = normalize_image(data, ImageSettings(formato="jpeg"))
+
+    img = Image.open(BytesIO(resultado.content))
+    assert img.format == "JPEG"
+    assert img.mode == "RGB"
+    assert resultado.extension == "jpg"
+    assert img.size == (200, 100)
+
+
+def test_archivo_invalido():
+    with pytest.raises(InvalidImageError):
+        normalize_image(b"no es una imagen", ImageSettings())
@@ -0,0 +1,64 @@
+"""Arranque y apagado de la app armada por create_app(), sin MongoDB.
+
+Con un Mongo inalcanzable cada paso del arranque falla rápido y se registra:
+el worker igual levanta, arranca sus tareas de fondo y las drena al apagar.
+"""
+import asyncio
+import logging
+import os
+
+import httpx
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_lavaderos")
+
+import server  # noqa: E402
+from repositories import MemoryRepositories  # noqa: E402
+from upstream import UpstreamClient  # noqa: E402
+
+MONGO_INALCANZABLE = "mongodb://localhost:1/?serverSelectionTimeoutMS=50"
+
+
+def test_lifespan_arranca_y_drena_las_tareas(monkeypatch, tmp_path, caplog):
+    monkeypatch.setenv("MONGO_URL", MONGO_INALCANZABLE)
+    monkeypatch.setattr(server, "COMPROBANTES_DIR", tmp_path / "comprobantes")
+    # El apagado cierra el cliente de auth: que no sea el compartido por los demás tests
+    monkeypatch.setattr(server, "auth_client", UpstreamClient("auth", "http://fake-auth"))
+    app = server.create_app()
+
+    async def main():
+        async with app.router.lifespan_context(app):
+            tareas = set(app.state.background_tasks)
+            assert tareas and not any(task.done() for task in tareas)
+            assert server.COMPROBANTES_DIR.is_dir()
+            # El servidor responde aunque Mongo no esté
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as cliente:
+                assert (await cliente.get("/api/health/live")).status_code == 200
+        return tareas
+
+    with caplog.at_level(logging.INFO, logger="server"):
+        tareas = asyncio.run(main())
+    assert all(task.done() for task in tareas)
+    assert "indices" in app.state.arranque["fases"]
+    assert any(r.getMessage().startswith("Arranque en ") for r in caplog.records)
+    assert any(r.getMessage().startswith("Apagado en ") for r in caplog.records)
+
+
+
+def test_lifespan_en_memoria_no_toca_mongo(monkeypatch, tmp_path, caplog):
+    monkeypatch.setenv("MONGO_URL", MONGO_INALCANZABLE)
+    monkeypatch.setattr(server, "COMPROBANTES_DIR", tmp_path / "comprobantes")
+    monkeypatch.setattr(server, "auth_client", UpstreamClient("auth", "http://fake-auth"))
+    app = server.create_app(MemoryRepositories())
+
+    async def main():
+        async with app.router.lifespan_context(app):
+            assert not any(task.done() for task in app.state.background_tasks)
+            assert (await server.superadmin_config.get())["version"] == 1
+
+    with caplog.at_level(logging.INFO, logger="server"):
+        asyncio.run(main())
+    # Sin índices ni log de consultas lentas: ningún paso esperó a Mongo ni falló
+    assert set(app.state.arranque["fases"]) == {"uploads"}
+    assert not any(r.getMessage().startswith("Arranque: falló") for r in caplog.records)
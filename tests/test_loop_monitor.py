@@ -0,0 +1,31 @@
+import asyncio
+import logging
+import time
+
+from loop_monitor import LOOP_LAG, LoopLagMonitor
+
+
+def bloquear_loop(segundos):
+    time.sleep(segundos)
+
+
+def test_detecta_bloqueo_y_captura_la_pila(caplog):
+    async def run():
+        monitor = LoopLagMonitor(interval=0.02, threshold=0.1)
+        task = monitor.start()
+        await asyncio.sleep(0.05)
+        bloquear_loop(0.3)
+        await asyncio.sleep(0.05)
+        task.cancel()
+        monitor.stop()
+        return monitor
+
+    antes = LOOP_LAG.count(())
+    with caplog.at_level(logging.WARNING, logger="loop_monitor"):
+        asyncio.run(run())
+
+    assert LOOP_LAG.count(()) > antes
+    bloqueos = [r.getMessage() for r in caplog.records if "Event loop bloqueado" in r.getMessage()]
+    assert len(bloqueos) == 1
+    assert "bloquear_loop" in bloqueos[0]
+    assert "fuera de un request" in bloqueos[0]
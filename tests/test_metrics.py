@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+from metrics import HTTP_ERRORS, HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS, REGISTRY, MetricsMiddleware
+
+
+def _app():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        if item_id == "roto":
+            raise HTTPException(status_code=503, detail="no disponible")
+        return {"id": item_id}
+
+    app.add_middleware(MetricsMiddleware)
+    return app
+
+
+def _get(app, *paths):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as cliente:
+            return [(await cliente.get(path)).status_code for path in paths]
+    return asyncio.run(run())
+
+
+def test_etiqueta_por_plantilla_de_ruta():
+    antes = HTTP_REQUESTS.value(("GET", "/items/{item_id}", "200"))
+    assert _get(_app(), "/items/1", "/items/2") == [200, 200]
+
+    assert HTTP_REQUESTS.value(("GET", "/items/{item_id}", "200")) == antes + 2
+    assert HTTP_LATENCY.count(("GET", "/items/{item_id}")) >= 2
+    assert HTTP_IN_FLIGHT.value() == 0
+
+
+def test_errores_y_rutas_sin_match():
+    errores = HTTP_ERRORS.value(("GET", "/items/{item_id}"))
+    assert _get(_app(), "/items/roto", "/no-existe") == [503, 404]
+
+    assert HTTP_ERRORS.value(("GET", "/items/{item_id}")) == errores + 1
+    assert HTTP_REQUESTS.value(("GET", "<unmatched>", "404")) >= 1
+
+
+def test_formato_de_exposicion():
+    _get(_app(), "/items/1")
+    texto = REGISTRY.render()
+
+    assert "# TYPE http_request_duration_seconds histogram" in texto
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/items/{item_id}",le="+Inf"}' in texto
+    assert 'http_requests_total{method="GET",route="/items/{item_id}",status="200"}' in texto
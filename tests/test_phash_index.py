@@ -0,0 +1,109 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from image_processing import ImageSettings, normalize_image
+from phash_index import HashIndexSync, MultiIndexHashTable
+
+
+def test_busqueda_coincide_con_fuerza_bruta():
+    rng = random.Random(7)
+    indice = MultiIndexHashTable()
+    hashes = {}
+    for i in range(5000):
+        valor = rng.getrandbits(64)
+        if i % 10 == 0 and hashes:
+            # Variantes cercanas de hashes ya cargados
+            valor = rng.choice(list(hashes.values())) ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        hashes[str(i)] = valor
+        indice.add(str(i), valor)
+
+    for consulta in rng.sample(list(hashes.values()), 200):
+        for k in (0, 3, 6, 9):
+            esperado = sorted(
+                (item_id, (valor ^ consulta).bit_count())
+                for item_id, valor in hashes.items()
+                if (valor ^ consulta).bit_count() <= k
+            )
+            assert sorted(indice.search(consulta, k)) == esperado
+
+
+def test_remove_y_excluir():
+    indice = MultiIndexHashTable()
+    indice.add("a", 0xFF)
+    indice.add("b", 0xFF)
+    indice.add("c", 0xFE)
+
+    assert [item_id for item_id, _ in indice.search(0xFF, 1, excluir="a")] == ["b", "c"]
+    indice.remove("b")
+    indice.remove("c")
+    assert indice.search(0xFF, 1) == [("a", 0)]
+    assert len(indice) == 1
+
+
+def test_reenvio_de_la_misma_captura_tiene_hash_cercano():
+    img = Image.new("RGB", (1200, 2000), "white")
+    draw = ImageDraw.Draw(img)
+    for y in range(100, 1900, 150):
+        draw.rectangle((100, y, 1100, y + 60), fill=(30, 30, 30))
+    draw.ellipse((300, 300, 900, 900), fill=(0, 120, 200))
+
+    original, recomprimida = BytesIO(), BytesIO()
+    img.save(original, format="PNG")
+    img.resize((600, 1000)).save(recomprimida, format="JPEG", quality=60)
+
+    settings = ImageSettings()
+    a = int(normalize_image(original.getvalue(), settings).phash, 16)
+    b = int(normalize_image(recomprimida.getvalue(), settings).phash, 16)
+    assert (a ^ b).bit_count() <= 6
+
+
+def test_sync_carga_completa_y_despues_solo_lo_nuevo():
+    ahora = datetime(2026, 3, 10, tzinfo=timezone.utc)
+    guardados = [("a", f"{0xFF:016x}", ahora), ("b", f"{0xF0:016x}", ahora + timedelta(seconds=1))]
+    pedidos = []
+
+    async def fuente(desde):
+        pedidos.append(desde)
+        for item in list(guardados):
+            if desde is None or item[2] > desde:
+                yield item
+
+    async def main():
+        sync = HashIndexSync(MultiIndexHashTable(), fuente)
+        assert not sync.cargado
+        assert await sync.refresh() == 2
+        assert sync.cargado
+        # Otro worker sube un comprobante: la próxima pasada lo trae
+        guardados.append(("c", f"{0xFE:016x}", ahora + timedelta(seconds=10)))
+        assert await sync.refresh() == 1
+        assert [item_id for item_id, _ in sync.indice.search(0xFF, 1)] == ["a", "c"]
+        return sync
+
+    asyncio.run(main())
+    assert pedidos == [None, ahora + timedelta(seconds=1) - HashIndexSync.SOLAPAMIENTO]
+
+
+def test_sync_reintenta_la_carga_que_falla():
+    intentos = []
+
+    async def fuente(desde):
+        intentos.append(desde)
+        if len(intentos) == 1:
+            raise ConnectionError("mongo caído")
+        yield "a", f"{0xFF:016x}", datetime(2026, 3, 10, tzinfo=timezone.utc)
+
+    async def main():
+        sync = HashIndexSync(MultiIndexHashTable(), fuente, refresh_seconds=60, retry_seconds=0)
+        tarea = asyncio.create_task(sync.run())
+        while not sync.cargado:
+            await asyncio.sleep(0)
+        tarea.cancel()
+        return sync
+
+    sync = asyncio.run(main())
+    assert "a" in sync.indice
+    assert intentos == [None, None]
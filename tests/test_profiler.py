@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from profiler import ProfilingMiddleware
+
+
+def trabajo_cpu(segundos):
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        pass
+
+
+def _app(autorizado):
+    app = FastAPI()
+    guardados = []
+
+    @app.get("/lento")
+    async def lento():
+        trabajo_cpu(0.05)
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    async def authorize(scope):
+        return autorizado
+
+    async def save(perfil):
+        guardados.append(perfil)
+
+    app.add_middleware(ProfilingMiddleware, authorize=authorize, save=save)
+    return app, guardados
+
+
+def _get(app, headers):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as cliente:
+            return await cliente.get("/lento", headers=headers)
+    return asyncio.run(run())
+
+
+def test_perfil_speedscope_con_cpu_y_espera():
+    app, guardados = _app(autorizado=True)
+    respuesta = _get(app, {"X-Profile-Request": "1"})
+
+    assert respuesta.status_code == 200
+    assert respuesta.headers["x-profile-id"] == guardados[0]["id"]
+    speedscope = guardados[0]["speedscope"]
+    nombres = {frame["name"] for frame in speedscope["shared"]["frames"]}
+    assert "trabajo_cpu" in nombres
+    assert "[await]" in nombres
+    perfil = speedscope["profiles"][0]
+    assert perfil["type"] == "sampled"
+    assert len(perfil["samples"]) == len(perfil["weights"]) > 0
+
+
+def test_sin_header_o_sin_permiso_no_perfila():
+    app, guardados = _app(autorizado=False)
+    assert "x-profile-id" not in _get(app, {"X-Profile-Request": "1"}).headers
+    app, guardados = _app(autorizado=True)
+    assert "x-profile-id" not in _get(app, {}).headers
+    assert guardados == []
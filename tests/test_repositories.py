@@ -0,0 +1,369 @@
+"""Contrato de los repositorios: la implementación en memoria y la de Motor
+tienen que comportarse igual. Cada test corre contra MemoryRepositories y,
+si hay MongoDB en MONGO_URL, contra MongoRepositories en una base temporal.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from estados import EstadoAdmin, EstadoPago, EstadoTurno, UserRole
+from repositories import CALCULADOS_USUARIO, MemoryRepositories, MongoRepositories, proyeccion
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+AHORA = datetime(2026, 3, 10, 12, 0, 0, 123456, tzinfo=timezone.utc)
+
+
+def _mongo_disponible() -> bool:
+    try:
+        MongoClient(MONGO_URL, serverSelectionTimeoutMS=500).admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+@pytest.fixture(params=[
+    "memoria",
+    pytest.param("mongo", marks=pytest.mark.skipif(not _mongo_disponible(), reason="necesita MongoDB en MONGO_URL")),
+])
+def correr(request):
+    def correr(prueba):
+        async def main():
+            if request.param == "memoria":
+                return await prueba(MemoryRepositories())
+            client = AsyncIOMotorClient(MONGO_URL)
+            db = client[f"test_repos_{uuid.uuid4().hex[:8]}"]
+            await db.pagos_mensualidad.create_index([("admin_id", 1), ("mes_año", 1)], unique=True)
+            try:
+                return await prueba(MongoRepositories(client, db))
+            finally:
+                await client.drop_database(db.name)
+                client.close()
+        return asyncio.run(main())
+    return correr
+
+
+async def _sembrar_admin(repos, n: int, estado=EstadoAdmin.ACTIVO, creado=AHORA) -> dict:
+    admin = {"id": f"admin-{n}", "email": f"admin{n}@example.com", "nombre": f"Admin {n}",
+             "rol": UserRole.ADMIN, "is_active": True, "created_at": creado}
+    lavadero = {"id": f"lav-{n}", "nombre": f"Lavadero {n}", "direccion": "-", "admin_id": admin["id"],
+                "estado_operativo": estado, "fecha_vencimiento": AHORA + timedelta(days=n - 5),
+                "is_active": True, "created_at": creado}
+    pago = {"id": f"pago-{n}", "admin_id": admin["id"], "lavadero_id": lavadero["id"], "monto": 1000.0 * n,
+            "mes_año": "2026-03", "estado": EstadoPago.PENDIENTE, "fecha_vencimiento": AHORA,
+            "created_at": creado}
+    await repos.users.insert(admin)
+    await repos.lavaderos.insert(lavadero)
+    await repos.pagos.insert(pago)
+    return {"admin": admin, "lavadero": lavadero, "pago": pago}
+
+
+def test_usuarios_en_purga_no_existen(correr):
+    async def prueba(repos):
+        await _sembrar_admin(repos, 1)
+        assert (await repos.users.get_by_email("admin1@example.com"))["id"] == "admin-1"
+
+        await repos.users.mark_purging("admin-1", "purga-1")
+        assert await repos.users.get_by_email("admin1@example.com") is None
+        assert await repos.users.get_by_id("admin-1") is None
+        assert await repos.users.get_with_rol("admin-1", UserRole.ADMIN, exclude_purging=True) is None
+        assert (await repos.users.get("admin-1"))["is_active"] is False
+        assert await repos.users.email_in_use("admin1@example.com")
+        assert not await repos.users.email_in_use("admin1@example.com", exclude_id="admin-1")
+    correr(prueba)
+
+
+def test_documentos_vuelven_como_de_mongo(correr):
+    async def prueba(repos):
+        doc = (await _sembrar_admin(repos, 1))["admin"]
+        leido = await repos.users.get("admin-1")
+        # Fecha UTC sin zona, truncada a milisegundos; sin _id
+        assert leido["created_at"] == datetime(2026, 3, 10, 12, 0, 0, 123000)
+        assert "_id" not in leido
+        # El llamador no ve cambios en su propio dict
+        assert "_id" not in doc
+        leido["nombre"] = "otro"
+        assert (await repos.users.get("admin-1"))["nombre"] == "Admin 1"
+    correr(prueba)
+
+
+def test_nombre_de_lavadero_sin_distinguir_mayusculas(correr):
+    async def prueba(repos):
+        await _sembrar_admin(repos, 1)
+        assert await repos.lavaderos.name_exists("LAVADERO 1")
+        assert not await repos.lavaderos.name_exists("Lavadero")
+        assert not await repos.lavaderos.name_exists("Lavadero.1")
+    correr(prueba)
+
+
+def test_un_pago_por_admin_y_mes(correr):
+    async def prueba(repos):
+        datos = await _sembrar_admin(repos, 1)
+        repetido = {**datos["pago"], "id": "pago-repetido"}
+        nuevo = {**datos["pago"], "id": "pago-abril", "mes_año": "2026-04"}
+        assert await repos.pagos.insert_new([repetido, nuevo]) == 1
+
+        await repos.pagos.confirm("pago-1")
+        assert await repos.pagos.reopen_month({**datos["pago"], "id": "otro"}) == "reabierto"
+        assert await repos.pagos.reopen_month({**datos["pago"], "id": "otro"}) is None
+        assert await repos.pagos.reopen_month({**datos["pago"], "id": "pago-mayo", "mes_año": "2026-05"}) == "creado"
+        assert (await repos.pagos.get("pago-1"))["estado"] == EstadoPago.PENDIENTE
+    correr(prueba)
+
+
+def test_pendiente_es_el_mes_mas_viejo(correr):
+    async def prueba(repos):
+        datos = await _sembrar_admin(repos, 1)
+        # Un lavadero VENCIDO se sigue facturando: puede deber varios meses
+        await repos.pagos.insert_new([{**datos["pago"], "id": f"pago-{mes}", "mes_año": mes}
+                                      for mes in ("2026-05", "2026-01", "2026-04")])
+        assert (await repos.pagos.get_pendiente("admin-1"))["id"] == "pago-2026-01"
+        await repos.pagos.confirm("pago-2026-01")
+        assert (await repos.pagos.get_pendiente("admin-1"))["id"] == "pago-1"
+        assert await repos.pagos.ensure_unique_month() == 0
+        assert await repos.pagos.unique_month_index_ready()
+    correr(prueba)
+
+
+def test_aprobar_comprobante_es_idempotente(correr):
+    async def prueba(repos):
+        await _sembrar_admin(repos, 1)
+        await repos.comprobantes.insert({"id": "comp-1", "pago_mensualidad_id": "pago-1", "admin_id": "admin-1",
+                                         "imagen_url": "/x.jpg", "estado": EstadoPago.PENDIENTE,
+                                         "created_at": AHORA})
+        aprobado = await repos.comprobantes.approve("comp-1", AHORA)
+        assert aprobado["estado"] == EstadoPago.CONFIRMADO
+        assert aprobado["pago_mensualidad_id"] == "pago-1"
+        assert await repos.comprobantes.approve("comp-1", AHORA) is None
+        # Un comprobante rechazado no se aprueba
+        await repos.comprobantes.insert({"id": "comp-2", "pago_mensualidad_id": "pago-1", "admin_id": "admin-1",
+                                         "imagen_url": "/y.jpg", "estado": EstadoPago.PENDIENTE,
+                                         "created_at": AHORA})
+        await repos.comprobantes.reject("comp-2", "ilegible", AHORA)
+        assert await repos.comprobantes.approve("comp-2", AHORA) is None
+        assert (await repos.comprobantes.get("comp-2"))["estado"] == EstadoPago.RECHAZADO
+        assert await repos.pagos.confirm("pago-1") == {"lavadero_id": "lav-1"}
+        assert await repos.pagos.confirm("no-existe") is None
+    correr(prueba)
+
+
+def test_hashes_de_comprobantes_desde(correr):
+    async def prueba(repos):
+        for n in range(1, 4):
+            await repos.comprobantes.insert({
+                "id": f"comp-{n}", "pago_mensualidad_id": f"pago-{n}", "admin_id": f"admin-{n}",
+                "imagen_url": f"/{n}.jpg", "phash": None if n == 2 else f"{n:016x}",
+                "estado": EstadoPago.PENDIENTE, "created_at": AHORA + timedelta(minutes=n)
+            })
+        assert [c async for c, _, _ in repos.comprobantes.phashes()] == ["comp-1", "comp-3"]
+        nuevos = [(c, h) async for c, h, _ in repos.comprobantes.phashes(since=AHORA + timedelta(minutes=1))]
+        assert nuevos == [("comp-3", f"{3:016x}")]
+    correr(prueba)
+
+
+def test_historial_pagina_y_cuenta(correr):
+    async def prueba(repos):
+        for n in range(1, 4):
+            await _sembrar_admin(repos, n)
+            await repos.comprobantes.insert({
+                "id": f"comp-{n}", "pago_mensualidad_id": f"pago-{n}", "admin_id": f"admin-{n}",
+                "imagen_url": f"/{n}.jpg", "estado": EstadoPago.PENDIENTE,
+                "created_at": AHORA + timedelta(minutes=n)
+            })
+        aplicados = await repos.comprobantes.apply_decisions(["comp-1"], {"comp-2": "ilegible"}, AHORA, "rev-1")
+        assert sorted(aplicados) == ["comp-1", "comp-2"]
+        # Una segunda revisión sobre comprobantes ya procesados no cambia nada
+        assert await repos.comprobantes.apply_decisions(["comp-2"], {"comp-1": "x"}, AHORA, "rev-2") == []
+
+        items, total, por_estado = await repos.comprobantes.historial(limit=2, offset=0)
+        assert [c["comprobante_id"] for c in items] == ["comp-3", "comp-2"]
+        assert items[1]["lavadero_nombre"] == "Lavadero 2"
+        assert items[1]["comentario_superadmin"] == "ilegible"
+        assert total == 3
+        assert por_estado == {EstadoPago.PENDIENTE: 1, EstadoPago.CONFIRMADO: 1, EstadoPago.RECHAZADO: 1}
+
+        items, total, _ = await repos.comprobantes.historial(estado=EstadoPago.CONFIRMADO, limit=10, offset=0)
+        assert [c["comprobante_id"] for c in items] == ["comp-1"]
+        assert total == 1
+
+        pendientes = await repos.comprobantes.pendientes_con_detalle()
+        assert [(c["id"], c["admin"]["id"], c["lavadero"]["id"]) for c in pendientes] == [("comp-3", "admin-3", "lav-3")]
+    correr(prueba)
+
+
+def test_vencimientos_y_facturables(correr):
+    async def prueba(repos):
+        for n in range(1, 8):
+            await _sembrar_admin(repos, n)
+        await _sembrar_admin(repos, 9, estado=EstadoAdmin.PENDIENTE_APROBACION)
+
+        # lav-1..lav-4 vencen antes de AHORA, lav-5 justo en AHORA
+        assert await repos.lavaderos.expire(AHORA) == 4
+        assert await repos.lavaderos.count_by_estado() == {
+            EstadoAdmin.VENCIDO: 4, EstadoAdmin.ACTIVO: 3, EstadoAdmin.PENDIENTE_APROBACION: 1
+        }
+        facturables = [doc async for doc in repos.lavaderos.billable(batch_size=2)]
+        assert sorted(doc["id"] for doc in facturables) == [f"lav-{n}" for n in range(1, 8)]
+    correr(prueba)
+
+
+def test_estadisticas_de_turnos(correr):
+    async def prueba(repos):
+        estados = [EstadoTurno.CONFIRMADO, EstadoTurno.RESERVADO, EstadoTurno.RESERVADO]
+        for n, estado in enumerate(estados):
+            await repos.turnos.insert({"id": f"turno-{n}", "lavadero_id": "lav-1", "cliente_id": "cliente-1",
+                                       "estado": estado, "created_at": AHORA})
+        await repos.turnos.insert_comprobante({"id": "ct-1", "turno_id": "turno-1", "estado": EstadoPago.PENDIENTE})
+        await repos.turnos.insert_comprobante({"id": "ct-2", "turno_id": "turno-0", "estado": EstadoPago.CONFIRMADO})
+
+        por_estado, pendientes = await repos.turnos.stats_lavadero("lav-1")
+        assert por_estado == {EstadoTurno.CONFIRMADO: 1, EstadoTurno.RESERVADO: 2}
+        assert pendientes == 1
+        assert await repos.turnos.stats_lavadero("lav-2") == ({}, 0)
+        assert await repos.turnos.stats_cliente("cliente-1") == por_estado
+    correr(prueba)
+
+
+def test_configuracion_upsert_y_toggle(correr):
+    async def prueba(repos):
+        await _sembrar_admin(repos, 1)
+        assert await repos.lavaderos.toggle_apertura("lav-1") is None
+
+        config = await repos.lavaderos.upsert_config(
+            "lav-1", {"hora_apertura": "08:00"}, {"id": "cfg-1", "lavadero_id": "lav-1", "esta_abierto": False}
+        )
+        assert (config["id"], config["hora_apertura"], config["esta_abierto"]) == ("cfg-1", "08:00", False)
+        assert (await repos.lavaderos.toggle_apertura("lav-1"))["esta_abierto"] is True
+
+        lavadero, config = await repos.lavaderos.get_with_config(admin_id="admin-1")
+        assert lavadero["id"] == "lav-1"
+        assert config["esta_abierto"] is True
+        assert await repos.lavaderos.get_with_config(lavadero_id="no-existe") is None
+    correr(prueba)
+
+
+def test_lecturas_con_proyeccion(correr):
+    async def prueba(repos):
+        await _sembrar_admin(repos, 1)
+        await repos.users.update("admin-1", {"password_hash": "hash"})
+        await repos.users.insert({"id": "google-1", "email": "g@example.com", "nombre": "G", "rol": UserRole.ADMIN,
+                                  "password_hash": None, "is_active": True, "created_at": AHORA})
+
+        assert await repos.users.get_by_email("admin1@example.com", fields=("id", "rol")) == {
+            "id": "admin-1", "rol": UserRole.ADMIN
+        }
+        # has_password se calcula sin traer el hash
+        assert await repos.users.get("admin-1", fields=("has_password",)) == {"has_password": True}
+        assert await repos.users.get("google-1", fields=("has_password",)) == {"has_password": False}
+
+        admins = await repos.users.with_lavadero(UserRole.ADMIN, fields=("id", "has_password"),
+                                                 lavadero_fields=("nombre",))
+        assert sorted(admins, key=lambda a: a["id"]) == [
+            {"id": "admin-1", "has_password": True, "lavadero": [{"nombre": "Lavadero 1"}]},
+            {"id": "google-1", "has_password": False, "lavadero": []},
+        ]
+        lavaderos = await repos.lavaderos.with_admin(fields=("id",), admin_fields=("email", "has_password"))
+        # has_password del admin se calcula con su propio hash, no con el del lavadero
+        assert lavaderos == [{"id": "lav-1", "admin": {"email": "admin1@example.com", "has_password": True}}]
+
+        assert await repos.pagos.get_pendiente("admin-1", fields=("id", "monto")) == {"id": "pago-1", "monto": 1000.0}
+        await repos.comprobantes.insert({"id": "comp-1", "pago_mensualidad_id": "pago-1", "admin_id": "admin-1",
+                                         "imagen_url": "/c.png", "estado": EstadoPago.PENDIENTE, "created_at": AHORA})
+        assert await repos.comprobantes.get_many(["comp-1", "otro"], fields=("estado",)) == {
+            "comp-1": {"id": "comp-1", "estado": EstadoPago.PENDIENTE}
+        }
+        assert await repos.comprobantes.del_admin("admin-1", fields=("id",), pago_fields=("mes_año",)) == [
+            {"id": "comp-1", "pago": {"mes_año": "2026-03"}}
+        ]
+        # El detalle de los pendientes no trae el documento entero del admin (ni su hash)
+        [pendiente] = await repos.comprobantes.pendientes_con_detalle(fields=("id",))
+        assert pendiente == {
+            "id": "comp-1",
+            "pago": {"id": "pago-1", "mes_año": "2026-03", "monto": 1000.0, "estado": EstadoPago.PENDIENTE,
+                     "fecha_vencimiento": AHORA.replace(tzinfo=None, microsecond=123000)},
+            "admin": {"id": "admin-1", "nombre": "Admin 1", "email": "admin1@example.com"},
+            "lavadero": {"id": "lav-1", "nombre": "Lavadero 1"},
+        }
+
+        assert await repos.lavaderos.get_by_admin("admin-1", fields=("id",)) == {"id": "lav-1"}
+        assert await repos.lavaderos.owned_by("lav-1", "admin-1")
+        assert not await repos.lavaderos.owned_by("lav-1", "google-1")
+    correr(prueba)
+
+
+def test_campos_calculados_bajo_un_prefijo():
+    assert proyeccion(("id", "has_password"), CALCULADOS_USUARIO, prefijo="admin.") == {
+        "admin.id": 1, "admin.has_password": {"$gt": ["$admin.password_hash", None]}
+    }
+
+
+def test_version_de_token_y_purgas(correr):
+    async def prueba(repos):
+        await _sembrar_admin(repos, 1)
+        assert await repos.users.bump_token_version("admin-1") == 1
+        assert await repos.users.bump_token_version("admin-1") == 2
+        assert await repos.users.bump_token_version("no-existe") is None
+
+        await repos.purgas.insert({"id": "purga-1", "admin_id": "admin-1", "estado": "EN_CURSO", "pasos": {},
+                                   "owner": "worker-a", "heartbeat_at": AHORA, "actualizado_at": AHORA})
+        assert await repos.purgas.update("purga-1", {"pasos.turnos": 3}, inc={"pasos_completados": 1},
+                                         owner="worker-a")
+        purga = await repos.purgas.get("purga-1")
+        assert (purga["pasos"], purga["pasos_completados"]) == ({"turnos": 3}, 1)
+        assert await repos.purgas.interrupted(["EN_CURSO"], AHORA + timedelta(minutes=1)) == ["purga-1"]
+        assert await repos.purgas.interrupted(["EN_CURSO"], AHORA) == []
+    correr(prueba)
+
+
+def test_purga_se_reclama_solo_con_el_heartbeat_vencido(correr):
+    async def prueba(repos):
+        await repos.purgas.insert({"id": "purga-1", "admin_id": "admin-1", "estado": "EN_CURSO", "pasos": {},
+                                   "owner": "worker-a", "heartbeat_at": AHORA, "actualizado_at": AHORA})
+        # worker-a sigue vivo: su heartbeat es posterior al límite
+        assert await repos.purgas.claim("purga-1", "worker-b", ["EN_CURSO"], AHORA, AHORA) is None
+
+        despues = AHORA + timedelta(minutes=2)
+        reclamada = await repos.purgas.claim("purga-1", "worker-b", ["EN_CURSO"], AHORA + timedelta(minutes=1), despues)
+        assert reclamada["owner"] == "worker-b"
+        # Dos reclamos con el mismo límite: el segundo ya ve el heartbeat nuevo
+        assert await repos.purgas.claim("purga-1", "worker-c", ["EN_CURSO"], AHORA + timedelta(minutes=1),
+                                        despues) is None
+        # El dueño anterior pierde la purga en su próximo paso
+        assert not await repos.purgas.update("purga-1", {"pasos.turnos": 1}, owner="worker-a")
+        assert await repos.purgas.update("purga-1", {"pasos.turnos": 1}, owner="worker-b")
+        assert await repos.purgas.claim("purga-1", "worker-b", ["ERROR"], despues + timedelta(days=1), despues) is None
+    correr(prueba)
+
+
+def test_sesiones_y_dias_no_laborales(correr):
+    async def prueba(repos):
+        sesion = {"id": "sesion-1", "user_id": "admin-1", "session_token": "token-1",
+                  "expires_at": AHORA + timedelta(days=7), "created_at": AHORA}
+        await repos.users.upsert_session(sesion)
+        # Repetir el login con el mismo token no agrega otra sesión
+        await repos.users.upsert_session({**sesion, "id": "sesion-2", "user_id": "admin-2"})
+        assert await repos.users.session_user_id("token-1", AHORA) == "admin-2"
+        assert await repos.users.session_user_id("token-1", AHORA + timedelta(days=8)) is None
+        assert await repos.users.delete_sessions("admin-2") == 1
+
+        fecha = datetime(2026, 4, 1, tzinfo=timezone.utc)
+        await repos.lavaderos.insert_dia_no_laboral({"id": "dia-1", "lavadero_id": "lav-1", "fecha": fecha})
+        assert await repos.lavaderos.dia_no_laboral_exists("lav-1", fecha)
+        assert not await repos.lavaderos.dia_no_laboral_exists("lav-2", fecha)
+        assert await repos.lavaderos.list_dias_no_laborales("lav-1") == [
+            {"id": "dia-1", "lavadero_id": "lav-1", "fecha": fecha.replace(tzinfo=None)}
+        ]
+        assert not await repos.lavaderos.delete_dia_no_laboral("dia-1", "lav-2")
+        assert await repos.lavaderos.delete_dia_no_laboral("dia-1", "lav-1")
+
+        await repos.perfiles.insert({"id": "perfil-1", "speedscope": "{}", "created_at": AHORA})
+        assert [p["id"] for p in await repos.perfiles.list()] == ["perfil-1"]
+        assert "speedscope" not in (await repos.perfiles.list())[0]
+        assert await repos.perfiles.get_speedscope("perfil-1") == "{}"
+        assert await repos.perfiles.get_speedscope("otro") is None
+    correr(prueba)
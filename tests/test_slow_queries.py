@@ -0,0 +1,41 @@
+import asyncio
+from types import SimpleNamespace
+
+from slow_queries import SlowQueryLog, summarize_explain
+
+
+def _evento(request_id, comando, micros):
+    nombre = next(iter(comando))
+    return (
+        SimpleNamespace(request_id=request_id, command_name=nombre, command=comando, database_name="test"),
+        SimpleNamespace(request_id=request_id, command_name=nombre, duration_micros=micros),
+    )
+
+
+def test_resumen_de_explain():
+    explain = {
+        "queryPlanner": {"winningPlan": {"stage": "LIMIT", "inputStage": {"stage": "COLLSCAN"}}},
+        "executionStats": {"executionTimeMillis": 120, "totalKeysExamined": 0,
+                           "totalDocsExamined": 50000, "nReturned": 1},
+    }
+    resumen = summarize_explain(explain)
+    assert resumen["plan"] == ["LIMIT", "COLLSCAN"]
+    assert resumen["totalDocsExamined"] == 50000
+
+
+def test_encola_solo_lentas_y_un_explain_por_forma():
+    async def run():
+        log = SlowQueryLog(threshold_ms=50)
+        log.bind(db=None, loop=asyncio.get_running_loop())
+        for request_id, (filtro, micros) in enumerate([("a", 80_000), ("b", 90_000), ("c", 10_000)]):
+            started, succeeded = _evento(request_id, {"find": "lavaderos", "filter": {"nombre": filtro}}, micros)
+            log.started(started)
+            log.succeeded(succeeded)
+        await asyncio.sleep(0)
+        return [log._queue.get_nowait() for _ in range(log._queue.qsize())]
+
+    items = asyncio.run(run())
+    assert len(items) == 2
+    assert items[0][0]["shape"] == 'find lavaderos {"nombre": "?"}'
+    assert items[0][1] is not None  # primera vez: se pide explain
+    assert items[1][1] is None
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+
+from fake_auth_server import SESSION_DATA_PATH, FakeAuthSettings, create_fake_auth_app
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient, UpstreamTimeout
+
+
+def _cliente(settings, **kwargs):
+    fake = create_fake_auth_app(settings)
+    return fake, UpstreamClient("auth", "http://fake-auth", transport=httpx.ASGITransport(app=fake), **kwargs)
+
+
+def test_circuito_se_abre_tras_fallas_seguidas():
+    async def run():
+        fake, cliente = _cliente(FakeAuthSettings(status_code=503),
+                                 breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await cliente.get(SESSION_DATA_PATH, headers={"X-Session-ID": "s"})
+        with pytest.raises(CircuitOpenError):
+            await cliente.get(SESSION_DATA_PATH, headers={"X-Session-ID": "s"})
+        await cliente.aclose()
+        return fake.state.calls
+
+    # La tercera llamada no llega al upstream
+    assert asyncio.run(run()) == 2
+
+
+def test_medio_abierto_deja_pasar_una_sola_prueba(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr("upstream.monotonic", lambda: reloj[0])
+
+    async def run():
+        settings = FakeAuthSettings(status_code=503)
+        fake, cliente = _cliente(settings, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30))
+        with pytest.raises(Exception):
+            await cliente.get(SESSION_DATA_PATH, headers={"X-Session-ID": "s"})
+
+        # Vencido el reset_timeout llegan varios requests a la vez mientras la prueba tarda
+        reloj[0] += 31
+        settings.status_code, settings.delay = 200, 0.05
+        resultados = await asyncio.gather(
+            *(cliente.get(SESSION_DATA_PATH, headers={"X-Session-ID": "s"}) for _ in range(5)),
+            return_exceptions=True
+        )
+        rechazados = [r for r in resultados if isinstance(r, CircuitOpenError)]
+        assert len(rechazados) == 4
+        assert cliente.breaker.state == "closed"
+        # Con la prueba exitosa el circuito se cierra para todos
+        await cliente.get(SESSION_DATA_PATH, headers={"X-Session-ID": "s"})
+        await cliente.aclose()
+        return fake.state.calls
+
+    assert asyncio.run(run()) == 3
+
+
+def test_prueba_colgada_no_deja_el_circuito_cerrado_para_siempre(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr("upstream.monotonic", lambda: reloj[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    reloj[0] += 31
+    assert breaker.allow()
+    assert not breaker.allow()
+    # La prueba se canceló sin registrar resultado: pasado otro reset_timeout se permite otra
+    reloj[0] += 31
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_presupuesto_de_tiempo():
+    async def run():
+        _, cliente = _cliente(FakeAuthSettings(hang=True), timeout=0.1)
+        with pytest.raises(UpstreamTimeout):
+            await cliente.get(SESSION_DATA_PATH, headers={"X-Session-ID": "s"})
+        await cliente.aclose()
+
+    asyncio.run(run())
+
+
+def test_otras_rutas_no_se_afectan_mientras_el_upstream_cuelga(monkeypatch):
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "test_upstream")
+    import server
+
+    _, cliente_colgado = _cliente(FakeAuthSettings(hang=True), timeout=0.5)
+    monkeypatch.setattr(server, "auth_client", cliente_colgado)
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as cliente:
+            sesion = asyncio.create_task(cliente.get("/api/session-data", headers={"X-Session-ID": "s"}))
+            await asyncio.sleep(0.05)
+            inicio = time.perf_counter()
+            health = await cliente.get("/api/health")
+            latencia_health = time.perf_counter() - inicio
+            return health.status_code, latencia_health, (await sesion).status_code
+
+    health, latencia_health, sesion = asyncio.run(run())
+    assert health == 200
+    assert latencia_health < 0.2
+    assert sesion == 504